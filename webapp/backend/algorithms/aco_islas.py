@@ -0,0 +1,144 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from algorithms.criterio_parada import N_ITERACIONES_MAX, POR_CONVERGENCIA, POR_ITERACIONES, POR_TIEMPO
+from algorithms.optimizacion_1 import ACO, OBJETIVO_DEFECTO, UMBRAL_CERCANIA, crear_matriz_feromonas
+
+"""
+ACO en paralelo con modelo de islas para optimizacion_1.
+
+Varias colonias independientes (islas) corren en procesos distintos. La matriz de distancias y las matrices de
+feromonas de todas las islas viven en multiprocessing.shared_memory: cada proceso las mapea por nombre sin
+copiarlas, y cada isla evapora y deposita sobre su propia matriz de feromonas en el lugar.
+La busqueda avanza por epocas de `iteraciones_epoca` iteraciones; al final de cada epoca la mejor ruta de cada
+isla migra a la siguiente (anillo), que la refuerza en su matriz antes de seguir. Las islas arrancan con
+semillas distintas, asi exploran zonas distintas y el intercambio comparte lo mejor de cada una.
+Con `tiempo_limite_ms` cada epoca recibe lo que queda del presupuesto y no se empieza otra si ya se agoto;
+con `sin_mejora` se corta cuando pasan esa cantidad de iteraciones (por isla) sin mejorar el mejor costo global.
+"""
+
+N_ISLAS = 4
+EPOCAS = 5
+ITERACIONES_EPOCA = 4
+POR_OBJETIVO = "objetivo"
+
+
+class _Compartido:
+    """Arreglo numpy sobre un bloque de shared_memory (creado aca o abierto por nombre)"""
+
+    def __init__(self, forma, dtype=np.float64, nombre=None, datos=None):
+        tamano = int(np.prod(forma)) * np.dtype(dtype).itemsize
+        if nombre is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=max(tamano, 1))
+        else:
+            self.shm = shared_memory.SharedMemory(name=nombre)
+        self.arreglo = np.ndarray(forma, dtype=dtype, buffer=self.shm.buf)
+        if datos is not None:
+            self.arreglo[...] = datos
+
+    @property
+    def nombre(self):
+        return self.shm.name
+
+    def cerrar(self, liberar=False):
+        # Soltar la vista antes de cerrar, si no SharedMemory.close() falla con el buffer exportado
+        self.arreglo = None
+        self.shm.close()
+        if liberar:
+            self.shm.unlink()
+
+
+def correr_isla(nombre_dist, nombre_tau, n, n_islas, isla, iteraciones, n_ants, migrante, semilla, busqueda_local,
+                tiempo_limite_ms=None):
+    """
+    Una epoca de una isla, pensada para correr en otro proceso: mapea la matriz de distancias y la feromona
+    de la isla, refuerza la ruta migrante (si hay) y corre `iteraciones` iteraciones del ACO.
+    Devuelve (ruta, costo, iteraciones corridas).
+    """
+    dist = _Compartido((n, n), nombre=nombre_dist)
+    feromonas = _Compartido((n_islas, n, n), nombre=nombre_tau)
+    try:
+        aco = ACO(dist.arreglo, np.empty((0, 0)), semilla=semilla)
+        # La feromona de la isla es una vista sobre la memoria compartida: se actualiza en el lugar
+        aco.tau = feromonas.arreglo[isla]
+        if migrante is not None:
+            ruta, costo = migrante
+            aco._depositar_feromonas([ruta], [costo])
+        ruta, costo = aco.correr(n_ants=n_ants, n_iteraciones=iteraciones, busqueda_local=busqueda_local,
+                                 tiempo_limite_ms=tiempo_limite_ms)
+        return ruta, float(costo), aco.estadisticas["iteraciones"]
+    finally:
+        aco = None
+        dist.cerrar()
+        feromonas.cerrar()
+
+
+def _ejecutar_local(funcion, *args):
+    return funcion(*args)
+
+
+def resolver_ruta_islas(dist_matrix, n_islas=N_ISLAS, epocas=None, iteraciones_epoca=ITERACIONES_EPOCA,
+                        n_ants=10, busqueda_local="final", semilla=None, ejecutar_cpu=_ejecutar_local,
+                        costo_objetivo=None, tiempo_limite_ms=None, sin_mejora=None,
+                        umbral_cercania=UMBRAL_CERCANIA[OBJETIVO_DEFECTO]):
+    """
+    Misma interfaz de salida que optimizacion_1.resolver_ruta: (ruta [0, ..., 0], costo, estadisticas).
+    `ejecutar_cpu` es el de services.trabajos (una llamada por isla y epoca, todas las islas a la vez).
+    Si se pasa `costo_objetivo` se corta al terminar la primera epoca que lo alcanza.
+    """
+    # Sin `epocas` explicitas y con corte por tiempo o convergencia, las epocas solo tienen el tope general
+    if epocas is None:
+        epocas = EPOCAS if tiempo_limite_ms is None and sin_mejora is None else N_ITERACIONES_MAX // iteraciones_epoca
+    inicio = time.perf_counter()
+    hasta = inicio + tiempo_limite_ms / 1000 if tiempo_limite_ms is not None else None
+    estadisticas = {"iteraciones": 0, "mejor_iteracion": 0, "segundos": 0.0, "motivo": POR_ITERACIONES,
+                    "semilla": semilla, "islas": n_islas, "epocas": 0}
+    dist_matrix = np.asarray(dist_matrix, dtype=np.float64)
+    n = dist_matrix.shape[0]
+    if n <= 1:
+        return [0, 0], 0.0, estadisticas
+
+    semillas = np.random.SeedSequence(semilla).spawn(n_islas)
+    dist = _Compartido((n, n), datos=dist_matrix)
+    tau = crear_matriz_feromonas(dist_matrix, umbral_cercania)
+    feromonas = _Compartido((n_islas, n, n), datos=np.broadcast_to(tau, (n_islas, n, n)))
+    mejor_ruta, mejor_costo = None, np.inf
+    migrantes = [None] * n_islas
+    try:
+        with ThreadPoolExecutor(max_workers=n_islas) as executor:
+            for epoca in range(epocas):
+                restante_ms = (hasta - time.perf_counter()) * 1000 if hasta is not None else None
+                if restante_ms is not None and restante_ms <= 0 and mejor_ruta is not None:
+                    break
+                futuros = [
+                    executor.submit(
+                        ejecutar_cpu, correr_isla, dist.nombre, feromonas.nombre, n, n_islas, isla, iteraciones_epoca, n_ants,
+                        migrantes[isla], int(semillas[isla].generate_state(1)[0]) + epoca, busqueda_local,
+                        max(restante_ms, 1.0) if restante_ms is not None else None,
+                    )
+                    for isla in range(n_islas)
+                ]
+                resultados = [f.result() for f in futuros]
+                estadisticas["epocas"] += 1
+                # Iteraciones por isla (corren a la vez): las de la isla que mas corrio en la epoca
+                estadisticas["iteraciones"] += max(iteraciones for _, _, iteraciones in resultados)
+                for ruta, costo, _ in resultados:
+                    if ruta is not None and (costo < mejor_costo or mejor_ruta is None):
+                        mejor_ruta, mejor_costo = ruta, costo
+                        estadisticas["mejor_iteracion"] = estadisticas["iteraciones"]
+                if costo_objetivo is not None and mejor_costo <= costo_objetivo:
+                    estadisticas["motivo"] = POR_OBJETIVO
+                    break
+                if sin_mejora is not None and estadisticas["iteraciones"] - estadisticas["mejor_iteracion"] >= sin_mejora:
+                    estadisticas["motivo"] = POR_CONVERGENCIA
+                    break
+                # Migracion en anillo: la isla i recibe la mejor ruta de la isla i - 1
+                migrantes = [resultados[(isla - 1) % n_islas][:2] for isla in range(n_islas)]
+    finally:
+        dist.cerrar(liberar=True)
+        feromonas.cerrar(liberar=True)
+    if hasta is not None and time.perf_counter() >= hasta and estadisticas["motivo"] == POR_ITERACIONES:
+        estadisticas["motivo"] = POR_TIEMPO
+    estadisticas["segundos"] = round(time.perf_counter() - inicio, 4)
+    return mejor_ruta, mejor_costo, estadisticas
@@ -0,0 +1,124 @@
+import time
+import numpy as np
+
+"""
+Busqueda local 2-opt / Or-opt sobre un recorrido cerrado, para refinar las rutas que construye el ACO.
+
+El recorrido es una lista de indices de la matriz de distancias sin repetir el inicio (se cierra solo).
+En cada pasada se evaluan con NumPy todos los movimientos de un tipo a la vez (matriz n x n de deltas)
+y se aplica el de mayor mejora (best-improvement), hasta que ninguno mejora, se llega a `max_pasadas` o
+se pasa el instante `hasta` (time.perf_counter); cortar antes deja un recorrido valido, solo menos mejorado.
+Las matrices pueden ser asimetricas (calles de una mano): el delta del 2-opt incluye el cambio de costo del
+tramo que queda invertido, calculado con sumas acumuladas en ambos sentidos.
+"""
+
+EPSILON = 1e-9
+
+
+def _matriz_finita(dist):
+    """Copia con los inf reemplazados por un costo grande, para que los deltas no den nan"""
+    dist = np.asarray(dist, dtype=np.float64)
+    finitos = np.isfinite(dist)
+    if finitos.all():
+        return dist
+    tope = (dist[finitos].max() if finitos.any() else 1.0) * dist.shape[0] * 10 + 1.0
+    return np.where(finitos, dist, tope)
+
+
+def costo_tour(dist, tour):
+    tour = np.asarray(tour)
+    return float(np.asarray(dist)[tour, np.roll(tour, -1)].sum())
+
+
+def _mejor_dos_opt(dist, tour):
+    """Mejor 2-opt: invertir tour[i+1..j]. Devuelve (delta, i, j)"""
+    n = len(tour)
+    siguiente = np.roll(tour, -1)
+    # Costos acumulados del recorrido en sentido directo e inverso: adelante[k] = sum d(t_m, t_m+1), m < k
+    adelante = np.concatenate(([0.0], np.cumsum(dist[tour[:-1], tour[1:]])))
+    atras = np.concatenate(([0.0], np.cumsum(dist[tour[1:], tour[:-1]])))
+
+    i = np.arange(n)[:, None]
+    j = np.arange(n)[None, :]
+    validos = (j > i + 1) & ~((i == 0) & (j == n - 1))
+    jj = np.where(validos, j, i + 2).clip(max=n - 1)
+    ii = np.broadcast_to(i, jj.shape)
+
+    a, b = tour[ii], siguiente[ii]
+    c, d = tour[jj], siguiente[jj]
+    # Tramo b..c invertido: sus aristas internas pasan de sentido directo a inverso
+    ii1 = np.minimum(ii + 1, n - 1)
+    interno = (atras[jj] - atras[ii1]) - (adelante[jj] - adelante[ii1])
+    delta = dist[a, c] + dist[b, d] - dist[a, b] - dist[c, d] + interno
+    delta = np.where(validos, delta, np.inf)
+    k = int(np.argmin(delta))
+    return float(delta.flat[k]), k // n, k % n
+
+
+def _mejor_or_opt(dist, tour, largo):
+    """
+    Mejor Or-opt: mover el segmento tour[i..i+largo-1] (sin invertir) entre tour[j] y tour[j+1].
+    Devuelve (delta, i, j)
+    """
+    n = len(tour)
+    if n < largo + 3:
+        return np.inf, 0, 0
+    i = np.arange(n)[:, None]
+    j = np.arange(n)[None, :]
+    previo = tour[(i - 1) % n]
+    primero = tour[i]
+    ultimo = tour[(i + largo - 1) % n]
+    posterior = tour[(i + largo) % n]
+    u, v = tour[j], tour[(j + 1) % n]
+
+    quitar = dist[previo, posterior] - dist[previo, primero] - dist[ultimo, posterior]
+    insertar = dist[u, primero] + dist[ultimo, v] - dist[u, v]
+    delta = quitar + insertar
+    # j no puede estar dentro del segmento ni ser el nodo anterior (seria el mismo recorrido)
+    relativo = (j - i) % n
+    validos = (relativo >= largo) & (relativo != n - 1)
+    delta = np.where(validos, delta, np.inf)
+    k = int(np.argmin(delta))
+    return float(delta.flat[k]), k // n, k % n
+
+
+def _aplicar_or_opt(tour, i, j, largo):
+    n = len(tour)
+    # Rotar para que el segmento quede al principio y no cruce el final de la lista
+    rotado = np.roll(tour, -i)
+    segmento, resto = rotado[:largo], rotado[largo:]
+    posicion = (j - i) % n - largo  # indice de tour[j] dentro de resto
+    return np.concatenate((resto[:posicion + 1], segmento, resto[posicion + 1:]))
+
+
+def mejorar_tour(dist, tour, max_pasadas=None, largos_or_opt=(1, 2, 3), hasta=None):
+    """
+    Aplica pasadas best-improvement de 2-opt y Or-opt sobre `tour` (recorrido cerrado sin repetir el inicio).
+    Devuelve (tour, costo) con el inicio original en la primera posicion.
+    """
+    tour = np.asarray(tour, dtype=np.int64)
+    n = len(tour)
+    if n < 4:
+        return tour.tolist(), costo_tour(dist, tour)
+    inicio = int(tour[0])
+    d = _matriz_finita(dist)
+    max_pasadas = max_pasadas if max_pasadas is not None else 10 * n
+
+    for _ in range(max_pasadas):
+        if hasta is not None and time.perf_counter() >= hasta:
+            break
+        delta, i, j = _mejor_dos_opt(d, tour)
+        if delta < -EPSILON:
+            tour = np.concatenate((tour[:i + 1], tour[i + 1:j + 1][::-1], tour[j + 1:]))
+            continue
+        mejor = (0.0, 0, 0, 0)
+        for largo in largos_or_opt:
+            delta, i, j = _mejor_or_opt(d, tour, largo)
+            if delta < mejor[0]:
+                mejor = (delta, i, j, largo)
+        if mejor[0] >= -EPSILON:
+            break
+        tour = _aplicar_or_opt(tour, mejor[1], mejor[2], mejor[3])
+
+    tour = np.roll(tour, -int(np.flatnonzero(tour == inicio)[0]))
+    return tour.tolist(), costo_tour(dist, tour)
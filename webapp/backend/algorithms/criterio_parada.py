@@ -0,0 +1,77 @@
+import time
+
+"""
+Criterio de parada comun para los ACO (optimizacion_1, optimizacion_2).
+
+Corta por lo primero que pase: `n_iteraciones` iteraciones, `tiempo_limite_ms` de reloj o `sin_mejora`
+iteraciones seguidas sin mejorar el mejor costo. Siempre se corre al menos una iteracion, asi hay ruta.
+Con busqueda local "final" el ACO deja libre una parte del presupuesto (RESERVA_BUSQUEDA_LOCAL) para el
+2-opt / Or-opt, que usa `hasta` como limite.
+"""
+
+N_ITERACIONES_MAX = 500
+# Corte por convergencia cuando no se pide ningun criterio: con la busqueda local la colonia suele
+# estancarse mucho antes del tope de iteraciones
+SIN_MEJORA_DEFECTO = 10
+RESERVA_BUSQUEDA_LOCAL = 0.2
+
+POR_ITERACIONES = "iteraciones"
+POR_TIEMPO = "tiempo"
+POR_CONVERGENCIA = "convergencia"
+
+
+def criterios_por_defecto(n_iteraciones, tiempo_limite_ms, sin_mejora, defecto):
+    """
+    (n_iteraciones, sin_mejora) a usar. Sin ningun criterio explicito: `defecto` iteraciones, cortando antes si
+    converge (SIN_MEJORA_DEFECTO). Con tiempo o convergencia pedidos y sin tope: N_ITERACIONES_MAX.
+    """
+    if n_iteraciones is None and tiempo_limite_ms is None and sin_mejora is None:
+        return defecto, SIN_MEJORA_DEFECTO
+    if n_iteraciones is None:
+        n_iteraciones = N_ITERACIONES_MAX
+    return n_iteraciones, sin_mejora
+
+
+class CriterioParada:
+    def __init__(self, n_iteraciones, tiempo_limite_ms=None, sin_mejora=None, busqueda_local=None):
+        self.n_iteraciones = n_iteraciones
+        self.sin_mejora = sin_mejora
+        self.inicio = time.perf_counter()
+        # hasta: limite total (lo usa la busqueda local); hasta_aco: limite para iterar la colonia
+        self.hasta = None
+        self.hasta_aco = None
+        if tiempo_limite_ms is not None:
+            self.hasta = self.inicio + tiempo_limite_ms / 1000
+            reserva = RESERVA_BUSQUEDA_LOCAL if busqueda_local == "final" else 0.0
+            self.hasta_aco = self.inicio + tiempo_limite_ms * (1 - reserva) / 1000
+        self.iteraciones = 0
+        self.mejor_iteracion = 0
+        self.motivo = POR_ITERACIONES
+
+    def registrar(self, mejoro):
+        """Se llama al final de cada iteracion"""
+        self.iteraciones += 1
+        if mejoro:
+            self.mejor_iteracion = self.iteraciones
+
+    def continuar(self):
+        if self.iteraciones == 0:
+            return self.n_iteraciones > 0
+        if self.iteraciones >= self.n_iteraciones:
+            self.motivo = POR_ITERACIONES
+            return False
+        if self.sin_mejora is not None and self.iteraciones - self.mejor_iteracion >= self.sin_mejora:
+            self.motivo = POR_CONVERGENCIA
+            return False
+        if self.hasta_aco is not None and time.perf_counter() >= self.hasta_aco:
+            self.motivo = POR_TIEMPO
+            return False
+        return True
+
+    def estadisticas(self):
+        return {
+            "iteraciones": self.iteraciones,
+            "mejor_iteracion": self.mejor_iteracion,
+            "segundos": round(time.perf_counter() - self.inicio, 4),
+            "motivo": self.motivo,
+        }
@@ -1,7 +1,8 @@
 
+from functools import partial
 import numpy as np
-import random
-import pandas as pd
+from algorithms.busqueda_local import mejorar_tour
+from algorithms.criterio_parada import CriterioParada, criterios_por_defecto
 
 """
 Este algoritmo en especifico primero corre un preprocesado en la base de Neo4j que consiste en calcular un dijkstra entre todos los nodos (clientes)
@@ -10,77 +11,117 @@ y nodos (centro de distribucion), con ello se crea una matriz de distancias que
 
 
 class ACO:
-    def __init__(self, dist, tau, alpha=1.0, beta=2.0, evaporation=0.5, q=100.0):
-        self.dist = dist
-        self.tau = tau
-        self.n = dist.shape[0]
+    """
+    ACO vectorizado: todas las hormigas de una iteracion construyen su ruta a la vez.
+    En cada paso se toma la fila de atractivo (tau^alpha * eta^beta) del nodo actual de cada hormiga,
+    se enmascaran los nodos ya visitados y se elige el siguiente con una ruleta vectorizada (cumsum).
+    """
+    def __init__(self, dist, tau, alpha=1.0, beta=2.0, evaporation=0.5, q=100.0, semilla=None):
+        self.dist = np.asarray(dist, dtype=np.float64)
+        self.tau = np.array(tau, dtype=np.float64)
+        self.n = self.dist.shape[0]
         self.alpha = alpha
         self.beta = beta
         self.evaporation = evaporation
         self.q = q
         self.best_route = None
         self.best_cost = np.inf
-
-    def _probabilidad(self, i, no_visitados):
-        attractiveness = []
-        for j in no_visitados:
-            pheromone = self.tau[i, j] ** self.alpha
-            heuristic = (1.0 / self.dist[i, j]) ** self.beta if self.dist[i, j] > 0 else 0
-            attractiveness.append(pheromone * heuristic)
-        total = sum(attractiveness)
-        if total == 0:
-            probs = [1/len(no_visitados)] * len(no_visitados)
-        else:
-            probs = [a/total for a in attractiveness]
-        return probs
-
-    def _construir_ruta(self):
-        ruta = [0]
-        no_visitados = set(range(1, self.n))
-
-        while no_visitados:
-            i = ruta[-1]
-            no_vis = list(no_visitados)
-            probs = self._probabilidad(i, no_vis)
-            siguiente = random.choices(no_vis, weights=probs, k=1)[0]
-            ruta.append(siguiente)
-            no_visitados.remove(siguiente)
-
-        ruta.append(0)
-        return ruta
+        self.estadisticas = None
+        self._rng = np.random.default_rng(semilla)
+        # Heuristica fija: (1/d)^beta, 0 para distancias nulas o inalcanzables (igual que antes)
+        validas = np.isfinite(self.dist) & (self.dist > 0)
+        self._eta = np.zeros_like(self.dist)
+        self._eta[validas] = (1.0 / self.dist[validas]) ** self.beta
+
+    def _atractivo(self):
+        return (self.tau ** self.alpha) * self._eta
+
+    def _construir_rutas(self, n_ants):
+        """Devuelve una matriz (n_ants, n+1) con una ruta por fila, empezando y terminando en 0"""
+        n = self.n
+        atractivo = self._atractivo()
+        rutas = np.zeros((n_ants, n + 1), dtype=np.int64)
+        visitados = np.zeros((n_ants, n), dtype=bool)
+        visitados[:, 0] = True
+        hormigas = np.arange(n_ants)
+        actual = np.zeros(n_ants, dtype=np.int64)
+
+        for paso in range(1, n):
+            pesos = np.where(visitados, 0.0, atractivo[actual])
+            acumulado = np.cumsum(pesos, axis=1)
+            total = acumulado[:, -1]
+            # Sin informacion (todo 0): eleccion uniforme entre los no visitados
+            sin_info = total <= 0
+            if sin_info.any():
+                acumulado[sin_info] = np.cumsum(~visitados[sin_info], axis=1)
+                total = acumulado[:, -1]
+            r = np.minimum(self._rng.random(n_ants) * total, np.nextafter(total, 0))
+            siguiente = np.argmax(acumulado > r[:, None], axis=1)
+            rutas[:, paso] = siguiente
+            visitados[hormigas, siguiente] = True
+            actual = siguiente
+
+        return rutas
+
+    def _costo_rutas(self, rutas):
+        return self.dist[rutas[:, :-1], rutas[:, 1:]].sum(axis=1)
 
     def _costo_ruta(self, ruta):
-        return sum(self.dist[ruta[i], ruta[i+1]] for i in range(len(ruta) - 1))
+        return float(self._costo_rutas(np.asarray([ruta]))[0])
 
     def _evaporar(self):
         self.tau *= (1 - self.evaporation)
 
     def _depositar_feromonas(self, rutas, costos):
-        for ruta, cost in zip(rutas, costos):
-            feromona = self.q / cost
-            for i in range(len(ruta) - 1):
-                self.tau[ruta[i], ruta[i+1]] += feromona
-
-    def correr(self, n_ants=10, n_iteraciones=100):
-        for it in range(n_iteraciones):
-            rutas = []
-            costos = []
-
-            for _ in range(n_ants):
-                ruta = self._construir_ruta()
-                costo = self._costo_ruta(ruta)
-                rutas.append(ruta)
-                costos.append(costo)
-
-                if costo < self.best_cost:
-                    self.best_route = ruta
-                    self.best_cost = costo
+        rutas = np.asarray(rutas)
+        costos = np.asarray(costos, dtype=np.float64)
+        with np.errstate(divide="ignore"):
+            feromona = np.where(costos > 0, self.q / costos, 0.0)
+        # add.at acumula correctamente cuando varias hormigas usan la misma arista
+        np.add.at(self.tau, (rutas[:, :-1], rutas[:, 1:]), feromona[:, None])
+
+    def _mejorar(self, ruta, hasta=None):
+        """2-opt / Or-opt sobre una ruta [0, ..., 0]"""
+        tour, costo = mejorar_tour(self.dist, ruta[:-1], hasta=hasta)
+        return tour + [tour[0]], costo
+
+    def correr(self, n_ants=10, n_iteraciones=100, busqueda_local=None, tiempo_limite_ms=None, sin_mejora=None):
+        """
+        busqueda_local: None, "iteracion" (se mejora la mejor hormiga de cada iteracion antes de depositar
+        feromona) o "final" (solo la mejor ruta encontrada)
+        tiempo_limite_ms / sin_mejora: cortes anticipados (algorithms.criterio_parada); `n_iteraciones` es el tope.
+        Las iteraciones corridas, el tiempo y el motivo del corte quedan en self.estadisticas.
+        """
+        parada = CriterioParada(n_iteraciones, tiempo_limite_ms, sin_mejora, busqueda_local)
+        if self.n <= 1:
+            self.best_route, self.best_cost = [0, 0], 0.0
+            self.estadisticas = parada.estadisticas()
+            return self.best_route, self.best_cost
+
+        while parada.continuar():
+            rutas = self._construir_rutas(n_ants)
+            costos = self._costo_rutas(rutas)
+
+            mejor = int(np.argmin(costos))
+            if busqueda_local == "iteracion":
+                ruta, costo = self._mejorar(rutas[mejor].tolist(), parada.hasta_aco)
+                if costo < costos[mejor]:
+                    rutas[mejor], costos[mejor] = ruta, costo
+            # Si hay paradas inalcanzables todos los costos son inf: igual se devuelve una ruta
+            mejoro = costos[mejor] < self.best_cost
+            if mejoro or self.best_route is None:
+                self.best_route = rutas[mejor].tolist()
+                self.best_cost = float(costos[mejor])
 
             self._evaporar()
             self._depositar_feromonas(rutas, costos)
+            parada.registrar(mejoro)
 
-            #print(f"Iteración {it+1}: Mejor costo hasta ahora: {self.best_cost:.2f}")
-
+        if busqueda_local == "final":
+            ruta, costo = self._mejorar(self.best_route, parada.hasta)
+            if costo < self.best_cost:
+                self.best_route, self.best_cost = ruta, costo
+        self.estadisticas = parada.estadisticas()
         return self.best_route, self.best_cost
 
 
@@ -89,97 +130,174 @@ class ACO:
 def build_node_index(poi_ids):
     return {nid: i for i, nid in enumerate(poi_ids)}
 
-def compute_distance_matrix_dijkstra(driver, poi_ids):
-    """
-    Retorna una matriz de distancia minima evaluada por dijkstra entre los nodos, 
-    y una un diccionario con los caminos que conforman las distancia entre los nodos antes planteados
-    """
-
-    CY_DIJKSTRA_PATHS = """
-    MATCH (start:Point {id: $source})
-    WITH id(start) AS sourceNodeId
-    MATCH (target:Point)
-    WHERE target.id IN $targets
-    WITH sourceNodeId, collect(id(target)) AS targetNodeIds
-    CALL gds.shortestPath.dijkstra.stream('mapa-logistico', {
-    sourceNode: sourceNodeId,
+# Costo minimo por $peso de cada origen a todos los destinos; se corre una vez por criterio.
+# Solo se resuelve el id del nodo destino (uno por par), los caminos no se materializan
+CY_DIJKSTRA_MATRIZ = """
+MATCH (target:Point)
+WHERE target.id IN $targets
+WITH collect(id(target)) AS targetNodeIds
+UNWIND $sources AS source_id
+MATCH (start:Point {id: source_id})
+CALL gds.shortestPath.dijkstra.stream($proyeccion, {
+    sourceNode: id(start),
     targetNodes: targetNodeIds,
+    relationshipWeightProperty: $peso
+})
+YIELD targetNode, totalCost
+RETURN source_id, gds.util.asNode(targetNode).id AS target_id, totalCost
+"""
+
+CY_DIJKSTRA_GEOMETRIA = """
+UNWIND $pares AS par
+MATCH (a:Point {id: par[0]}), (b:Point {id: par[1]})
+CALL gds.shortestPath.dijkstra.stream($proyeccion, {
+    sourceNode: id(a),
+    targetNode: id(b),
     relationshipWeightProperty: 'length'
-    })
-    YIELD targetNode, totalCost, nodeIds
-    UNWIND nodeIds AS nid
-    WITH targetNode, totalCost, gds.util.asNode(nid) AS node
-    RETURN 
-    gds.util.asNode(targetNode).id AS target_id,
-    totalCost,
-    collect({
-        id: node.id,
-        lon: node.lon,
-        lat: node.lat
-    }) AS path
+})
+YIELD nodeIds
+RETURN par[0] AS source_id, par[1] AS target_id,
+       [nid IN nodeIds | gds.util.asNode(nid) {.id, .lon, .lat}] AS path
+"""
+
+TAMANO_LOTE_MATRIZ = 50
+# Con 2-opt / Or-opt sobre la ruta final la colonia se estanca antes (ver benchmarks/busqueda_local.py): sin otro
+# criterio se corre hasta N_ITERACIONES pero se corta por convergencia (criterio_parada.SIN_MEJORA_DEFECTO).
+# "iteracion" mejora un poco mas el costo pero es bastante mas lento con muchos puntos
+BUSQUEDA_LOCAL = "final"
+N_ITERACIONES = 30
+PROYECCION_DEFECTO = 'mapa-logistico'
+# Objetivo del ACO: un criterio del backend ("length" en metros o "weight" = length / maxspeed)
+OBJETIVO_DEFECTO = "length"
+# Feromona inicial alta entre puntos cercanos: 300 m, o lo que se tarda en 300 m a 40 km/h (maxspeed por defecto)
+UMBRAL_CERCANIA = {"length": 300.0, "weight": 300.0 / 40}
+
+
+def compute_cost_matrices_dijkstra(driver, poi_ids, targets=None, tamano_lote=TAMANO_LOTE_MATRIZ,
+                                   proyeccion=PROYECCION_DEFECTO, criterios=("length", "weight")):
     """
-    n = len(poi_ids)
-    dist = np.full((n, n), np.inf)
-    np.fill_diagonal(dist, 0.0)
-    node_idx = build_node_index(poi_ids)
-    paths = {}
+    Matrices de costo minimo evaluadas por dijkstra entre los nodos `poi_ids` (filas) y `targets` (columnas,
+    por defecto los mismos `poi_ids`): devuelve un array (len(criterios), len(poi_ids), len(targets)) con el
+    costo del camino minimo por cada criterio (cada criterio con sus propios caminos).
+    Los origenes se envian en lotes (UNWIND) de `tamano_lote`, asi las matrices completas se obtienen
+    en ceil(n / tamano_lote) consultas por criterio en lugar de una por nodo. La geometria de los caminos no se
+    calcula aca, ver obtener_geometria_tramos.
+    """
+    if targets is None:
+        targets = poi_ids
+    matrices = np.full((len(criterios), len(poi_ids), len(targets)), np.inf)
+    src_idx = build_node_index(poi_ids)
+    tgt_idx = build_node_index(targets)
+    for nid, i in src_idx.items():
+        if nid in tgt_idx:
+            matrices[:, i, tgt_idx[nid]] = 0.0
 
     with driver.session() as session:
-        for src_id in poi_ids:
-            result = session.run(CY_DIJKSTRA_PATHS, source=src_id, targets=poi_ids)
-            i = node_idx[src_id]
-            for record in result:
-                tgt_id = record["target_id"]
-                cost = record["totalCost"]
-                path = record["path"]
-
-                if tgt_id in node_idx:
-                    j = node_idx[tgt_id]
-                    dist[i, j] = cost
-                    paths[(src_id, tgt_id)] = path
-
-    #print("Matriz de distancias:")
-    #print(dist)
-    #print("Caminos calculados:")
-    #for k, v in paths.items():
-        #print(f"{k[0]} -> {k[1]} | {len(v)} nodos | camino: {[p['id'] for p in v]}")
-
-    return dist, paths
-
-def crear_matriz_feromonas(dist):
+        for c, peso in enumerate(criterios):
+            for inicio in range(0, len(poi_ids), tamano_lote):
+                sources = poi_ids[inicio:inicio + tamano_lote]
+                result = session.run(CY_DIJKSTRA_MATRIZ, sources=sources, targets=targets, proyeccion=proyeccion,
+                                     peso=peso)
+                for record in result:
+                    src_id = record["source_id"]
+                    tgt_id = record["target_id"]
+                    if src_id in src_idx and tgt_id in tgt_idx and src_id != tgt_id:
+                        matrices[c, src_idx[src_id], tgt_idx[tgt_id]] = record["totalCost"]
+
+    return matrices
+
+def obtener_geometria_tramos(driver, pares, proyeccion=PROYECCION_DEFECTO):
+    """
+    Retorna un diccionario {(origen, destino): [{id, lon, lat}, ...]} con el camino de cada par,
+    resuelto en una sola consulta. Se usa solo para los tramos de la ruta final.
+    """
+    if not pares:
+        return {}
+    with driver.session() as session:
+        result = session.run(CY_DIJKSTRA_GEOMETRIA, pares=[list(par) for par in pares], proyeccion=proyeccion)
+        return {(record["source_id"], record["target_id"]): record["path"] for record in result}
+
+def crear_matriz_feromonas(dist, umbral_cercania=UMBRAL_CERCANIA[OBJETIVO_DEFECTO]):
     n = dist.shape[0]
     # Definir parámetros
-    umbral_cercania = 300.0  # metros
     tau_cercano = 1.0         # feromonas para caminos cortos
     tau_lejano = 0.1          # feromonas para caminos largos
     #Crea la matriz de feromonas
     tau = np.full((n, n), tau_lejano)
     # Asignar feromonas mayores en caminos cercanos
-    for i in range(n):
-        for j in range(n):
-            if i != j and dist[i, j] < umbral_cercania:
-                tau[i, j] = tau_cercano
+    cercanos = dist < umbral_cercania
+    np.fill_diagonal(cercanos, False)
+    tau[cercanos] = tau_cercano
 
     return tau
 
 
-def ejecutarOptimizacion(driver,puntos):
+def resolver_ruta(dist_matrix, n_ants=10, n_iteraciones=None, busqueda_local=BUSQUEDA_LOCAL, semilla=None,
+                  tiempo_limite_ms=None, sin_mejora=None, umbral_cercania=UMBRAL_CERCANIA[OBJETIVO_DEFECTO]):
+    """
+    Fase de CPU (ACO) separada para poder correrla en otro proceso: solo recibe y devuelve datos serializables.
+    Devuelve (ruta, costo, estadisticas) con las iteraciones corridas y el tiempo (ver ACO.correr).
+    """
+    n_iteraciones, sin_mejora = criterios_por_defecto(n_iteraciones, tiempo_limite_ms, sin_mejora, N_ITERACIONES)
+    ##Creamos la matriz de feromonas
+    tau = crear_matriz_feromonas(dist_matrix, umbral_cercania)
+    ##Inicializamos ACO
+    aco = ACO(dist_matrix,tau,semilla=semilla)
+    ruta, costo = aco.correr(n_ants=n_ants,n_iteraciones=n_iteraciones,busqueda_local=busqueda_local,
+                             tiempo_limite_ms=tiempo_limite_ms,sin_mejora=sin_mejora)
+    return ruta, costo, {**aco.estadisticas, "semilla": semilla}
+
+
+def _ejecutar_local(funcion, *args):
+    return funcion(*args)
+
+
+def matrices_objetivo(backend, ids, cache=None, objetivo=OBJETIVO_DEFECTO):
+    """
+    Matrices de todos los criterios del backend, calculadas y cacheadas juntas,
+    y la del `objetivo`. Cambiar de objetivo no recalcula nada.
+    """
+    if cache is not None:
+        matrices = cache.obtener_criterios(ids, backend.matrices_costos)
+    else:
+        matrices = backend.matrices_costos(ids, ids)
+    return matrices, matrices[list(backend.criterios).index(objetivo)]
+
+
+def totales_ruta(matrices, criterios, ruta):
+    """Costo de `ruta` ([0, ..., 0]) en cada criterio: {criterio: costo}"""
+    ruta = np.asarray(ruta)
+    return {criterio: float(matrices[c][ruta[:-1], ruta[1:]].sum()) for c, criterio in enumerate(criterios)}
+
+
+def ejecutarOptimizacion(backend,puntos,cache=None,ejecutar_cpu=_ejecutar_local,islas=1,opciones=None,
+                         objetivo=OBJETIVO_DEFECTO):
+    """
+    `backend` (services.backend_grafo) calcula la matriz y los caminos: con GDS sobre una proyeccion
+    o en proceso con el grafo en memoria.
+    Si se pasa `cache` (services.cache_matriz.CacheMatriz) solo se calculan las filas/columnas
+    de los puntos que no estaban en la matriz guardada.
+    `ejecutar_cpu(funcion, *args)` decide donde corre el ACO (por defecto en este mismo hilo;
+    services.trabajos lo manda a un ProcessPoolExecutor).
+    Con `islas` > 1 corren varias colonias en paralelo sobre memoria compartida (algorithms.aco_islas).
+    `opciones`: tiempo_limite_ms, sin_mejora y semilla del ACO. Devuelve (rutas, estadisticas del ACO).
+    `objetivo`: criterio a minimizar ("length" o "weight"); los totales de la ruta salen en todos los criterios.
+    """
+    opciones = opciones or {}
     lista_nodos = [p["id"] for p in puntos]
     #print(lista_nodos)
-    #Creamos matriz distancia con dijkstra entre los nodos
-    dist_matrix, paths = compute_distance_matrix_dijkstra(driver,lista_nodos)
-    #Guardamos los calculos hechos
-    np.save("dist_matrix.npy", dist_matrix)
+    #Creamos las matrices (distancia y tiempo) con dijkstra entre los nodos
+    matrices, dist_matrix = matrices_objetivo(backend, lista_nodos, cache, objetivo)
 
     #Ejecutamos optimizacion
-    ##Creamos la matriz de feromonas
-    tau = crear_matriz_feromonas(dist_matrix)
-    #print("Matriz de distancias:")
-    #for row in dist_matrix:
-        #print(row)
-    ##Inicializamos ACO
-    aco = ACO(dist_matrix,tau)
-    mejor_ruta, mejor_costo = aco.correr(n_ants=10,n_iteraciones=30)
+    if islas > 1:
+        from algorithms.aco_islas import resolver_ruta_islas
+        mejor_ruta, mejor_costo, estadisticas = resolver_ruta_islas(dist_matrix, n_islas=islas, ejecutar_cpu=ejecutar_cpu,
+                                                                    umbral_cercania=UMBRAL_CERCANIA[objetivo], **opciones)
+    else:
+        mejor_ruta, mejor_costo, estadisticas = ejecutar_cpu(
+            partial(resolver_ruta, umbral_cercania=UMBRAL_CERCANIA[objetivo], **opciones), dist_matrix
+        )
     
     #Parsear la mejor ruta
     head = lista_nodos[mejor_ruta[0]] # type: ignore
@@ -189,13 +307,17 @@ def ejecutarOptimizacion(driver,puntos):
         optimal_path.append((head,second))
         head = second
 
-    #Nuevo camino , filtra del diccionario paths y crea uno nuevo con new_paths solo con los caminos finales que usaremos
+    #Geometria solo de los tramos que forman la ruta final
+    paths = backend.geometria(optimal_path)
     new_path = {}
     for optimal in optimal_path:
-        new_path[optimal] = paths[optimal]
+        new_path[optimal] = paths.get(optimal, [])
 
     rutas_serializables = {
         f"{origen}-{destino}": path for (origen, destino), path in new_path.items()
     }
 
-    return rutas_serializables
\ No newline at end of file
+    return rutas_serializables, {
+        **estadisticas, "objetivo": objetivo, "costo": float(mejor_costo),
+        "totales": totales_ruta(matrices, backend.criterios, mejor_ruta),
+    }
\ No newline at end of file
@@ -1,6 +1,10 @@
 from collections import defaultdict
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
 import numpy as np
-import random
+from algorithms.busqueda_local import mejorar_tour
+from algorithms.criterio_parada import CriterioParada, criterios_por_defecto
 
 """
 Este algoritmo en especifico primero corre un preprocesado en la base de Neo4j que consiste en calcular un k-caminos yens entre todos los nodos (clientes)
@@ -10,59 +14,100 @@ y nodos (centro de distribucion),
 """
 
 
-def obtener_caminos_yens(driver,k=3, source=4801, target=61):
-    query = """
-    CALL gds.shortestPath.yens.stream('mapa-logistico', {
-      sourceNode: $source,
-      targetNode: $target,
-      k: $k,
-      relationshipWeightProperty: 'length'
-    })
-    YIELD index, nodeIds
-    RETURN index, 
-      [nodeId IN nodeIds | 
-        {id: nodeId, lat: gds.util.asNode(nodeId).lat, lon: gds.util.asNode(nodeId).lon}
-      ] AS camino
-    ORDER BY index
-    """
+CY_YENS_LOTE = """
+UNWIND $pares AS par
+MATCH (a:Point {id: par[0]}), (b:Point {id: par[1]})
+CALL gds.shortestPath.yens.stream($proyeccion, {
+  sourceNode: id(a),
+  targetNode: id(b),
+  k: $k,
+  relationshipWeightProperty: 'length'
+})
+YIELD index, totalCost, nodeIds
+RETURN par[0] AS source_id, par[1] AS target_id, index, totalCost,
+  [nodeId IN nodeIds | gds.util.asNode(nodeId) {.id, .lat, .lon}] AS camino
+ORDER BY index
+"""
 
-    with driver.session() as session:
-        result = session.run(query, source=source, target=target, k=k)
-        return [(record["index"], record["camino"]) for record in result]
-    
+TAMANO_LOTE_PARES = 25
+HILOS_YENS = 4
 
 
-def euclidean_distance(a, b):
-    return ((a['lat'] - b['lat'])**2 + (a['lon'] - b['lon'])**2)**0.5
+def obtener_caminos_yens(driver, pares, k=3, proyeccion='mapa-logistico'):
+    """
+    Yen's k caminos para un lote de pares (origen_id, destino_id) en una sola consulta.
+    Devuelve {(origen_id, destino_id): [(index, costo, camino), ...]} ordenado por index.
+    """
+    caminos = defaultdict(list)
+    with driver.session() as session:
+        result = session.run(CY_YENS_LOTE, pares=[list(par) for par in pares], k=k, proyeccion=proyeccion)
+        for record in result:
+            caminos[(record["source_id"], record["target_id"])].append(
+                (record["index"], record["totalCost"], record["camino"])
+            )
+    return caminos
 
-def procesar_caminos_yens(poi_origen, poi_destino, caminos_yens):
-    dist = defaultdict(lambda: defaultdict(list))
-    pheromone = defaultdict(lambda: defaultdict(list))
-    paths = defaultdict(lambda: defaultdict(list))
 
-    for (index, camino) in caminos_yens:
-        costo = 0.0
-        for i in range(len(camino) - 1):
-            costo += euclidean_distance(camino[i], camino[i+1])
+def obtener_caminos_yens_paralelo(driver, poi_ids, k=3, proyeccion='mapa-logistico',
+                                  tamano_lote=TAMANO_LOTE_PARES, hilos=HILOS_YENS, progreso=None):
+    """
+    Calcula los k caminos para todos los pares ordenados de `poi_ids`, repartiendo lotes de
+    `tamano_lote` pares entre `hilos` sesiones en paralelo. Devuelve (caminos, tiempo).
+    `progreso(hechos, total)` se llama al terminar cada lote (p. ej. para actualizar el estado del trabajo).
+    """
+    pares = [(a, b) for a in poi_ids for b in poi_ids if a != b]
+    lotes = [pares[i:i + tamano_lote] for i in range(0, len(pares), tamano_lote)]
+    caminos = {}
+    inicio = time.perf_counter()
+    hechos = 0
+
+    with ThreadPoolExecutor(max_workers=hilos) as executor:
+        futuros = {executor.submit(obtener_caminos_yens, driver, lote, k, proyeccion): lote for lote in lotes}
+        for futuro in as_completed(futuros):
+            caminos.update(futuro.result())
+            hechos += len(futuros[futuro])
+            if progreso is not None:
+                progreso(hechos, len(pares))
+
+    tiempo = {"pares": len(pares), "consultas": len(lotes), "segundos": round(time.perf_counter() - inicio, 3)}
+    return caminos, tiempo
+    
 
-        i = poi_origen
-        j = poi_destino
-        dist[i][j].append(costo)
-        pheromone[i][j].append(1.0)  # inicialización
-        paths[i][j].append(camino)
 
-    return dist, pheromone, paths
+def construir_tensores(poi_ids, caminos, k):
+    """
+    A partir de {(origen_id, destino_id): [(index, costo, camino), ...]} arma:
+    - dist: float32 [n, n, k] con el costo de cada camino (inf donde el par tiene menos de k caminos)
+    - pheromone: float32 [n, n, k] inicializada en 1.0 en los caminos validos
+    - mask: bool [n, n, k] con los caminos que existen
+    - paths: paths[i][j][c] = lista de nodos (con lat/lon), solo se usa para serializar
+    """
+    n = len(poi_ids)
+    dist = np.full((n, n, k), np.inf, dtype=np.float32)
+    paths = [[[] for _ in range(n)] for _ in range(n)]
+    for i, src_id in enumerate(poi_ids):
+        for j, tgt_id in enumerate(poi_ids):
+            if i == j:
+                continue
+            for c, (index, costo, camino) in enumerate(caminos.get((src_id, tgt_id), [])[:k]):
+                dist[i, j, c] = costo
+                paths[i][j].append(camino)
+    mask = np.isfinite(dist)
+    pheromone = np.where(mask, 1.0, 0.0).astype(np.float32)
+    return dist, pheromone, mask, paths
 
 
 class ACO:
-    def __init__(self, dist, pheromone, alpha=1.0, beta=2.0, evaporation=0.5, q=100.0):
+    def __init__(self, dist, pheromone, alpha=1.0, beta=2.0, evaporation=0.5, q=100.0, mask=None, semilla=None):
         """
-        dist: matriz (n x n) donde cada celda dist[i][j] es una lista de hasta k costos
-        pheromone: misma estructura que dist, pheromone[i][j][c] representa la feromona del camino c entre i y j
+        dist: tensor float32 [n, n, k]; dist[i, j, c] es el costo del camino c entre i y j (inf si no existe)
+        pheromone: tensor [n, n, k], pheromone[i, j, c] representa la feromona del camino c entre i y j
+        mask: tensor bool [n, n, k] de caminos validos (por defecto los de costo finito)
         """
-        self.dist = dist
-        self.pheromone = pheromone
-        self.n = len(dist)
+        self.dist = np.asarray(dist, dtype=np.float32)
+        self.pheromone = np.array(pheromone, dtype=np.float32)
+        self.n, _, self.k = self.dist.shape
+        self.mask = np.isfinite(self.dist) if mask is None else np.asarray(mask, dtype=bool)
         self.alpha = alpha
         self.beta = beta
         self.evaporation = evaporation
@@ -70,81 +115,131 @@ class ACO:
         self.best_route = None
         self.best_cost = np.inf
         self.log_detallado = []
-
-    def _calcular_probabilidades(self, actual, no_visitados):
-        """Devuelve una lista de tuplas (j, c, probabilidad)"""
-        numeradores = []
-        transiciones = []
-
-        for j in no_visitados:
-            for c in range(len(self.dist[actual][j])):
-                tau = self.pheromone[actual][j][c]
-                eta = 1.0 / self.dist[actual][j][c]
-                valor = (tau ** self.alpha) * (eta ** self.beta)
-                numeradores.append(valor)
-                transiciones.append((j, c))
-
-        total = sum(numeradores)
-        probabilidades = [(j, c, v / total) for (j, c), v in zip(transiciones, numeradores)]
-        return probabilidades
-
-    def _elegir_siguiente(self, actual, no_visitados):
-        """Elige el siguiente nodo y camino según las probabilidades"""
-        probs = self._calcular_probabilidades(actual, no_visitados)
-        r = random.random()
-        acumulado = 0.0
-        for j, c, p in probs:
-            acumulado += p
-            if r <= acumulado:
-                return j, c
-        return probs[-1][0], probs[-1][1]  # por fallback
-
-    def _construir_solucion(self):
-        """Construye una solución recorriendo todos los nodos una vez"""
-        camino = []
-        costo_total = 0.0
-        no_visitados = list(range(self.n))
-        actual = random.choice(no_visitados)
-        inicio = actual
-        no_visitados.remove(actual)
-
-        while no_visitados:
-            siguiente, camino_idx = self._elegir_siguiente(actual, no_visitados)
-            camino.append((actual, siguiente, camino_idx))
-            costo_total += self.dist[actual][siguiente][camino_idx]
+        self.estadisticas = None
+        self._rng = np.random.default_rng(semilla)
+        # eta^beta no cambia entre iteraciones
+        dist_valida = np.where(self.mask, np.maximum(self.dist, 1e-6), 1.0)
+        self._eta = np.where(self.mask, (1.0 / dist_valida) ** self.beta, 0.0).astype(np.float32)
+        # Para la busqueda local: el mejor camino valido entre cada par
+        dist_min = np.where(self.mask, self.dist, np.inf)
+        self._camino_min = np.argmin(dist_min, axis=2)
+        self._dist_min = np.take_along_axis(dist_min, self._camino_min[:, :, None], axis=2)[:, :, 0].astype(np.float64)
+
+    def _construir_soluciones(self, n_hormigas):
+        """
+        Construye n_hormigas soluciones a la vez. Cada paso elige (j, c) sobre la fila aplanada n*k
+        del nodo actual de cada hormiga, enmascarando caminos invalidos y nodos visitados.
+        Devuelve (origenes, destinos, caminos_idx, costos) con forma [n_hormigas, n] (incluye la vuelta).
+        """
+        n, k = self.n, self.k
+        atractivo = ((self.pheromone ** self.alpha) * self._eta).reshape(n, n * k)
+        hormigas = np.arange(n_hormigas)
+        actual = self._rng.integers(0, n, size=n_hormigas)
+        inicio = actual.copy()
+        visitados = np.zeros((n_hormigas, n), dtype=bool)
+        visitados[hormigas, actual] = True
+
+        origenes = np.zeros((n_hormigas, n), dtype=np.int64)
+        destinos = np.zeros((n_hormigas, n), dtype=np.int64)
+        caminos_idx = np.zeros((n_hormigas, n), dtype=np.int64)
+
+        for paso in range(n - 1):
+            disponibles = np.repeat(~visitados, k, axis=1)
+            pesos = np.where(disponibles, atractivo[actual], 0.0)
+            acumulado = np.cumsum(pesos, axis=1)
+            total = acumulado[:, -1]
+            # Sin caminos validos hacia los no visitados: se elige uno al azar con el camino 0
+            sin_info = total <= 0
+            if sin_info.any():
+                uniforme = np.zeros((sin_info.sum(), n * k))
+                uniforme[:, ::k] = ~visitados[sin_info]
+                acumulado[sin_info] = np.cumsum(uniforme, axis=1)
+                total = acumulado[:, -1]
+            r = np.minimum(self._rng.random(n_hormigas) * total, np.nextafter(total, 0))
+            eleccion = np.argmax(acumulado > r[:, None], axis=1)
+            siguiente, camino = eleccion // k, eleccion % k
+
+            origenes[:, paso] = actual
+            destinos[:, paso] = siguiente
+            caminos_idx[:, paso] = camino
+            visitados[hormigas, siguiente] = True
             actual = siguiente
-            no_visitados.remove(actual)
 
-        # Volver al inicio
-        if inicio in range(self.n):
-            if len(self.dist[actual][inicio]) > 0:
-                camino.append((actual, inicio, 0))
-                costo_total += self.dist[actual][inicio][0]
+        # Volver al inicio por el camino mas corto (index 0)
+        origenes[:, n - 1] = actual
+        destinos[:, n - 1] = inicio
+        caminos_idx[:, n - 1] = 0
 
-        return camino, costo_total
+        costos_tramo = self.dist[origenes, destinos, caminos_idx].astype(np.float64)
+        # La vuelta solo se cuenta si existe (igual que antes); los demas tramos invalidos quedan en inf
+        vuelta_valida = self.mask[actual, inicio, 0]
+        costos_tramo[~vuelta_valida, n - 1] = 0.0
+        return origenes, destinos, caminos_idx, costos_tramo.sum(axis=1), vuelta_valida
 
-    def _actualizar_feromonas(self, soluciones):
+    def _actualizar_feromonas(self, origenes, destinos, caminos_idx, costos, vuelta_valida):
         """Evaporación y refuerzo de feromonas"""
-        for i in range(self.n):
-            for j in range(self.n):
-                for c in range(len(self.pheromone[i][j])):
-                    self.pheromone[i][j][c] *= (1 - self.evaporation)
-
-        for camino, costo in soluciones:
-            for i, j, c in camino:
-                self.pheromone[i][j][c] += self.q / costo
-
-    def run(self, iteraciones=100, n_hormigas=10):
-        for _ in range(iteraciones):
-            soluciones = []
-            for _ in range(n_hormigas):
-                camino, costo = self._construir_solucion()
-                soluciones.append((camino, costo))
-                if costo < self.best_cost:
-                    self.best_cost = costo
-                    self.best_route = camino
-            self._actualizar_feromonas(soluciones)
-
+        self.pheromone *= (1 - self.evaporation)
+        with np.errstate(divide="ignore"):
+            refuerzo = np.where(np.isfinite(costos) & (costos > 0), self.q / costos, 0.0)
+        refuerzo = np.broadcast_to(refuerzo[:, None], origenes.shape).copy()
+        refuerzo[~vuelta_valida, -1] = 0.0
+        np.add.at(self.pheromone, (origenes, destinos, caminos_idx), refuerzo.astype(np.float32))
+        # Los caminos inexistentes nunca acumulan feromona
+        self.pheromone[~self.mask] = 0.0
+
+    def _mejorar(self, orden, hasta=None):
+        """
+        2-opt / Or-opt sobre el orden de visita usando el mejor camino de cada par.
+        Devuelve (origenes, destinos, caminos_idx, costo, vuelta_valida) con el mismo criterio de costo que
+        _construir_soluciones (la vuelta solo cuenta si existe).
+        """
+        tour, _ = mejorar_tour(self._dist_min, orden, hasta=hasta)
+        origenes = np.asarray(tour, dtype=np.int64)
+        destinos = np.roll(origenes, -1)
+        caminos_idx = self._camino_min[origenes, destinos]
+        costos_tramo = self._dist_min[origenes, destinos]
+        vuelta_valida = bool(np.isfinite(costos_tramo[-1]))
+        if not vuelta_valida:
+            costos_tramo[-1] = 0.0
+        return origenes, destinos, caminos_idx, float(costos_tramo.sum()), vuelta_valida
+
+    def run(self, iteraciones=100, n_hormigas=10, busqueda_local=None, tiempo_limite_ms=None, sin_mejora=None):
+        """
+        busqueda_local: None, "iteracion" (se mejora la mejor hormiga de cada iteracion antes de actualizar
+        feromonas) o "final" (solo la mejor ruta encontrada)
+        tiempo_limite_ms / sin_mejora: cortes anticipados (algorithms.criterio_parada); `iteraciones` es el tope.
+        """
+        parada = CriterioParada(iteraciones, tiempo_limite_ms, sin_mejora, busqueda_local)
+        if self.n <= 1:
+            self.best_route, self.best_cost = [], 0.0
+            self.estadisticas = parada.estadisticas()
+            return self.best_route, self.best_cost
+
+        while parada.continuar():
+            origenes, destinos, caminos_idx, costos, vuelta_valida = self._construir_soluciones(n_hormigas)
+            mejor = int(np.argmin(costos))
+            if busqueda_local == "iteracion":
+                o, d, c, costo, vuelta = self._mejorar(origenes[mejor], parada.hasta_aco)
+                if costo < costos[mejor]:
+                    origenes[mejor], destinos[mejor], caminos_idx[mejor] = o, d, c
+                    costos[mejor], vuelta_valida[mejor] = costo, vuelta
+            mejoro = costos[mejor] < self.best_cost
+            if mejoro:
+                self.best_cost = float(costos[mejor])
+                pasos = self.n if vuelta_valida[mejor] else self.n - 1
+                self.best_route = list(zip(origenes[mejor, :pasos].tolist(),
+                                           destinos[mejor, :pasos].tolist(),
+                                           caminos_idx[mejor, :pasos].tolist()))
+            self._actualizar_feromonas(origenes, destinos, caminos_idx, costos, vuelta_valida)
+            parada.registrar(mejoro)
+
+        if busqueda_local == "final" and self.best_route:
+            o, d, c, costo, vuelta = self._mejorar([i for i, _, _ in self.best_route], parada.hasta)
+            if costo < self.best_cost:
+                pasos = self.n if vuelta else self.n - 1
+                self.best_route = list(zip(o[:pasos].tolist(), d[:pasos].tolist(), c[:pasos].tolist()))
+                self.best_cost = costo
+        self.estadisticas = parada.estadisticas()
         return self.best_route, self.best_cost
 
 
@@ -160,38 +255,46 @@ def serializar_camino(mejor_ruta, paths, poi_ids):
     for i, j, c in mejor_ruta:
         id_origen = poi_ids[i]
         id_destino = poi_ids[j]
-        tramo = paths[i][j][c]
+        tramo = paths[i][j][c] if c < len(paths[i][j]) else []
 
         rutas_serializables[f"{id_origen}-{id_destino}"] = tramo
 
     return rutas_serializables
 
 
-def ejecutarOptimizacion(driver):
-    poi_ids = [4801, 187, 17258, 61, 13, 21, 831, 999, 666, 10, 121, 123, 354] # Source Ids
-    # Inicialización
-    n = len(poi_ids)
-    dist = [[[] for _ in range(n)] for _ in range(n)]
-    pheromone = [[[] for _ in range(n)] for _ in range(n)]
-    paths = [[[] for _ in range(n)] for _ in range(n)]
-    k = 3 #Numero de caminos por cada nodo
+# Igual que en optimizacion_1: N_ITERACIONES es el tope y sin otro criterio se corta antes por convergencia
+BUSQUEDA_LOCAL = "final"
+N_ITERACIONES = 30
 
-    # Para cada par (i, j)
-    for i, src_id in enumerate(poi_ids):
-        for j, tgt_id in enumerate(poi_ids):
-            if src_id == tgt_id:
-                continue
-            caminos_yens = obtener_caminos_yens(driver, k, src_id, tgt_id)
-            dist_ij, pheromone_ij, paths_ij = procesar_caminos_yens(i, j, caminos_yens)
 
-            dist[i][j] = dist_ij[i][j]
-            pheromone[i][j] = pheromone_ij[i][j]
-            paths[i][j] = paths_ij[i][j]
+def resolver_ruta(dist, pheromone, mask, iteraciones=None, n_hormigas=10, busqueda_local=BUSQUEDA_LOCAL,
+                  semilla=None, tiempo_limite_ms=None, sin_mejora=None):
+    """Fase de CPU (ACO) separada para poder correrla en otro proceso. Devuelve (ruta, costo, estadisticas)"""
+    iteraciones, sin_mejora = criterios_por_defecto(iteraciones, tiempo_limite_ms, sin_mejora, N_ITERACIONES)
+    aco = ACO(dist, pheromone, alpha=1.0, beta=2.0, evaporation=0.3, q=100.0, mask=mask, semilla=semilla)
+    ruta, costo = aco.run(iteraciones=iteraciones, n_hormigas=n_hormigas, busqueda_local=busqueda_local,
+                          tiempo_limite_ms=tiempo_limite_ms, sin_mejora=sin_mejora)
+    return ruta, costo, {**aco.estadisticas, "semilla": semilla}
+
+
+def _ejecutar_local(funcion, *args):
+    return funcion(*args)
+
+
+def ejecutarOptimizacion(backend, puntos, ejecutar_cpu=_ejecutar_local, opciones=None, progreso=None):
+    """
+    `backend` (services.backend_grafo) da los k caminos: Yen de GDS o Yen sobre el grafo en memoria.
+    `opciones`: tiempo_limite_ms, sin_mejora y semilla del ACO. `progreso(hechos, total)`: avance de los pares
+    de Yen. Devuelve (rutas, estadisticas del ACO y de los k caminos).
+    """
+    poi_ids = [p["id"] for p in puntos]
+    k = 3 #Numero de caminos por cada nodo
+
+    caminos, tiempo_caminos = backend.k_caminos(poi_ids, k, ejecutar_cpu=ejecutar_cpu, progreso=progreso)
 
-    aco = ACO(dist, pheromone, alpha=1.0, beta=2.0, evaporation=0.3, q=100.0)
+    dist, pheromone, mask, paths = construir_tensores(poi_ids, caminos, k)
 
-    mejor_camino, mejor_costo = aco.run(iteraciones=30, n_hormigas=10)
-    print(mejor_costo)
+    mejor_camino, mejor_costo, estadisticas = ejecutar_cpu(partial(resolver_ruta, **(opciones or {})), dist, pheromone, mask)
     rutas_serializadas = serializar_camino(mejor_camino,paths,poi_ids)
 
-    return rutas_serializadas
\ No newline at end of file
+    return rutas_serializadas, {**estadisticas, "costo": float(mejor_costo), "caminos": tiempo_caminos}
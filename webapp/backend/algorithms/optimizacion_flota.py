@@ -0,0 +1,188 @@
+import math
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import numpy as np
+from algorithms import optimizacion_1
+
+"""
+Ruteo de una flota con capacidad (CVRP) en dos fases: primero agrupar, despues rutear.
+
+Los vehiculos disponibles (Vehicle.capacity_kg) y la demanda de cada punto (suma de los Shipment no entregados
+que van a ese Point) se leen del grafo. Las paradas se ordenan por angulo alrededor del centro de distribucion
+y se reparten en barrido (sweep) entre los vehiculos, de mayor a menor capacidad, con una carga objetivo
+proporcional a la capacidad de cada uno. Despues cada vehiculo resuelve su recorrido (deposito -> paradas ->
+deposito) con el ACO de optimizacion_1 sobre su submatriz; los recorridos son independientes y se mandan
+todos a la vez a `ejecutar_cpu` (en la API, el pool de procesos de services.trabajos). La flota y la demanda se
+leen con `driver`; las distancias y la geometria salen del backend de grafo (services.backend_grafo).
+"""
+
+CY_VEHICULOS = """
+MATCH (v:Vehicle)
+WHERE coalesce(v.available, true) AND v.capacity_kg IS NOT NULL
+RETURN elementId(v) AS id, v.type AS tipo, toFloat(v.capacity_kg) AS capacidad_kg
+ORDER BY capacidad_kg DESC
+"""
+
+# Shipment no tiene peso en el modelo original: si falta weight_kg cada envio cuenta como `peso_defecto`.
+# `ruteable`: el Point tiene id y esta sobre el grafo de calles; los demas no se pueden rutear y van a sin_asignar
+# (identificados por elementId si no tienen id)
+CY_DEMANDAS = """
+MATCH (s:Shipment)-[:TO]->(p:Point)
+WHERE NOT coalesce(s.delivered, false)
+RETURN coalesce(p.id, elementId(p)) AS id, p.lat AS lat, p.lon AS lon,
+       p.id IS NOT NULL AND EXISTS { (p)-[:STREET]-() } AS ruteable,
+       sum(toFloat(coalesce(s.weight_kg, $peso_defecto))) AS demanda_kg,
+       count(s) AS envios
+"""
+
+PESO_ENVIO_DEFECTO = 1.0
+# Hilos que esperan a ejecutar_cpu (uno por vehiculo); mas que procesos en el pool solo encola
+HILOS_VEHICULOS = 4
+
+
+def leer_flota(driver, peso_defecto=PESO_ENVIO_DEFECTO):
+    """Vehiculos disponibles (de mayor a menor capacidad) y demanda pendiente por punto"""
+    with driver.session() as session:
+        vehiculos = [record.data() for record in session.run(CY_VEHICULOS)]
+        demandas = [record.data() for record in session.run(CY_DEMANDAS, peso_defecto=peso_defecto)]
+    return vehiculos, demandas
+
+
+def agrupar_por_barrido(deposito, paradas, capacidades):
+    """
+    deposito: {lat, lon}; paradas: [{lat, lon, demanda_kg}]; capacidades: en el orden en que se llenan.
+    Devuelve (grupos, sin_asignar): una lista de indices de paradas por vehiculo y los que no entran en ninguno.
+    """
+    grupos = [[] for _ in capacidades]
+    if not paradas:
+        return grupos, []
+
+    kx = math.cos(math.radians(deposito["lat"]))
+    angulos = np.array([math.atan2(p["lat"] - deposito["lat"], (p["lon"] - deposito["lon"]) * kx) for p in paradas])
+    orden = np.argsort(angulos, kind="stable")
+    # Empezar despues del mayor hueco angular, asi ningun grupo queda partido a ambos lados de ese hueco
+    ordenados = angulos[orden]
+    huecos = np.diff(np.concatenate((ordenados, [ordenados[0] + 2 * math.pi])))
+    inicio = (int(np.argmax(huecos)) + 1) % len(orden)
+    orden = np.roll(orden, -inicio).tolist()
+
+    demanda = [float(p["demanda_kg"]) for p in paradas]
+    total = sum(demanda)
+    capacidad_total = sum(capacidades)
+    # Carga objetivo proporcional a la capacidad: reparte el trabajo si sobra capacidad en la flota
+    objetivos = [min(c, total * c / capacidad_total) if capacidad_total >= total and capacidad_total > 0 else c
+                 for c in capacidades]
+    cargas = [0.0] * len(capacidades)
+
+    restantes = []
+    v = 0
+    for i in orden:
+        while v < len(capacidades) and cargas[v] > 0 and cargas[v] + demanda[i] > objetivos[v] + 1e-9:
+            v += 1
+        if v < len(capacidades) and cargas[v] + demanda[i] <= capacidades[v] + 1e-9:
+            grupos[v].append(i)
+            cargas[v] += demanda[i]
+        else:
+            restantes.append(i)
+
+    # Lo que no entro en el barrido va al vehiculo con lugar cuyo grupo queda mas cerca (centroide)
+    sin_asignar = []
+    for i in restantes:
+        candidatos = [v for v in range(len(capacidades)) if cargas[v] + demanda[i] <= capacidades[v] + 1e-9]
+        if not candidatos:
+            sin_asignar.append(i)
+            continue
+
+        def distancia(v):
+            miembros = grupos[v] or None
+            lat = np.mean([paradas[j]["lat"] for j in miembros]) if miembros else deposito["lat"]
+            lon = np.mean([paradas[j]["lon"] for j in miembros]) if miembros else deposito["lon"]
+            return (paradas[i]["lat"] - lat) ** 2 + ((paradas[i]["lon"] - lon) * kx) ** 2
+
+        v = min(candidatos, key=distancia)
+        grupos[v].append(i)
+        cargas[v] += demanda[i]
+    return grupos, sin_asignar
+
+
+def resolver_vehiculo(dist_matrix, n_ants=10, n_iteraciones=None, **opciones):
+    """Recorrido de un vehiculo; la fila/columna 0 de dist_matrix es el deposito. Devuelve (ruta, costo, estadisticas)"""
+    return optimizacion_1.resolver_ruta(dist_matrix, n_ants=n_ants, n_iteraciones=n_iteraciones, **opciones)
+
+
+def _ejecutar_local(funcion, *args):
+    return funcion(*args)
+
+
+def ejecutarOptimizacionFlota(driver, puntos, backend, cache=None, ejecutar_cpu=_ejecutar_local, deposito_id=None,
+                              peso_defecto=PESO_ENVIO_DEFECTO, opciones=None, objetivo=optimizacion_1.OBJETIVO_DEFECTO,
+                              hilos=HILOS_VEHICULOS):
+    """
+    puntos: los de backend.puntos() (de ahi sale el centro de distribucion); las demandas en puntos que no
+    estan ahi o fuera del grafo de calles no se rutean y vuelven en sin_asignar.
+    opciones: tiempo_limite_ms, sin_mejora y semilla del ACO de cada vehiculo (corren a la vez).
+    objetivo: criterio que minimiza cada vehiculo ("length" o "weight"), ver optimizacion_1.matrices_objetivo.
+    hilos: maximo de vehiculos resolviendose a la vez (en la API, los procesos del pool).
+    Devuelve {"vehiculos": [{vehiculo, tipo, capacidad_kg, carga_kg, paradas, costo, totales, rutas, solver}],
+              "sin_asignar": [ids], "costo_total", "totales"} donde `rutas` tiene el formato de optimizacion_1.
+    """
+    centros = [p for p in puntos if p["tipo"] == "CentroDeDistribucion"]
+    if deposito_id is not None:
+        centros = [p for p in puntos if p["id"] == deposito_id]
+    if not centros:
+        raise ValueError("No hay centro de distribucion para usar como deposito")
+    deposito = centros[0]
+
+    vehiculos, demandas = leer_flota(driver, peso_defecto)
+    ruteables = {p["id"] for p in puntos}
+    pendientes = [d for d in demandas if d["id"] != deposito["id"] and d["demanda_kg"] > 0]
+    paradas = [d for d in pendientes if d["ruteable"] and d["id"] in ruteables]
+    no_ruteables = [d["id"] for d in pendientes if not (d["ruteable"] and d["id"] in ruteables)]
+    grupos, sin_asignar = agrupar_por_barrido(deposito, paradas, [v["capacidad_kg"] for v in vehiculos])
+
+    ids = [deposito["id"]] + [p["id"] for p in paradas]
+    matrices, dist = optimizacion_1.matrices_objetivo(backend, ids, cache, objetivo)
+
+    # Submatriz de cada vehiculo: deposito (0) + sus paradas
+    activos = [(v, [0] + [i + 1 for i in grupo]) for v, grupo in enumerate(grupos) if grupo]
+
+    def resolver(indices):
+        umbral = optimizacion_1.UMBRAL_CERCANIA[objetivo]
+        return ejecutar_cpu(partial(resolver_vehiculo, umbral_cercania=umbral, **(opciones or {})),
+                            dist[np.ix_(indices, indices)])
+
+    # Cada llamada a ejecutar_cpu bloquea hasta que termina su proceso: un hilo por vehiculo para que corran juntos,
+    # hasta `hilos` a la vez
+    with ThreadPoolExecutor(max_workers=max(1, min(len(activos), hilos))) as executor:
+        soluciones = list(executor.map(resolver, [indices for _, indices in activos]))
+
+    pares_por_vehiculo = []
+    for (v, indices), (ruta, costo, _) in zip(activos, soluciones):
+        visita = [ids[indices[k]] for k in ruta]
+        pares_por_vehiculo.append(list(zip(visita, visita[1:])))
+    todos = [par for pares in pares_por_vehiculo for par in pares]
+    caminos = backend.geometria(todos)
+
+    resultado = []
+    for (v, indices), (ruta, costo, estadisticas), pares in zip(activos, soluciones, pares_por_vehiculo):
+        vehiculo = vehiculos[v]
+        resultado.append({
+            "vehiculo": vehiculo["id"],
+            "tipo": vehiculo["tipo"],
+            "capacidad_kg": vehiculo["capacidad_kg"],
+            "carga_kg": float(sum(paradas[i - 1]["demanda_kg"] for i in indices[1:])),
+            "paradas": [destino for _, destino in pares[:-1]],
+            "costo": float(costo),
+            "totales": optimizacion_1.totales_ruta(matrices, backend.criterios, [indices[k] for k in ruta]),
+            "rutas": {f"{origen}-{destino}": caminos.get((origen, destino), []) for origen, destino in pares},
+            "solver": estadisticas,
+        })
+
+    return {
+        "deposito": deposito["id"],
+        "vehiculos": resultado,
+        "sin_asignar": [paradas[i]["id"] for i in sin_asignar] + no_ruteables,
+        "objetivo": objetivo,
+        "costo_total": float(sum(v["costo"] for v in resultado)),
+        "totales": {c: float(sum(v["totales"][c] for v in resultado)) for c in backend.criterios},
+    }
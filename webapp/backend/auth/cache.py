@@ -0,0 +1,80 @@
+"""
+Cache de usuarios autenticados
+LRU + TTL en memoria del proceso, con Redis opcional como segundo nivel
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+import redis
+from auth.models import UserResponse
+from auth.security import SecurityConfig
+
+class CacheUsuarios:
+    """Cache de UserResponse por id de usuario"""
+
+    def __init__(self, max_size: int = SecurityConfig.USER_CACHE_MAX_SIZE, ttl_seconds: int = SecurityConfig.USER_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entradas: "OrderedDict[int, tuple[float, UserResponse]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _clave_redis(user_id: int) -> str:
+        return f"user:{user_id}"
+
+    def get(self, user_id: int, redis_client=None) -> Optional[UserResponse]:
+        """Busca primero en memoria y despues en Redis"""
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(user_id)
+            if entrada is not None:
+                vence, user = entrada
+                if vence > ahora:
+                    self._entradas.move_to_end(user_id)
+                    return user
+                del self._entradas[user_id]
+
+        if redis_client:
+            try:
+                datos = redis_client.get(self._clave_redis(user_id))
+            except redis.RedisError:
+                datos = None
+            if datos:
+                user = UserResponse(**json.loads(datos))
+                self._guardar_local(user)
+                return user
+        return None
+
+    def _guardar_local(self, user: UserResponse):
+        with self._lock:
+            self._entradas[user.id] = (time.monotonic() + self.ttl_seconds, user)
+            self._entradas.move_to_end(user.id)
+            while len(self._entradas) > self.max_size:
+                self._entradas.popitem(last=False)
+
+    def set(self, user: UserResponse, redis_client=None):
+        self._guardar_local(user)
+        if redis_client:
+            try:
+                redis_client.setex(self._clave_redis(user.id), self.ttl_seconds, user.model_dump_json())
+            except redis.RedisError:
+                pass
+
+    def invalidate(self, user_id: int, redis_client=None):
+        """Elimina al usuario de ambos niveles (cambio de contraseña, cambios de admin, logout)"""
+        with self._lock:
+            self._entradas.pop(user_id, None)
+        if redis_client:
+            try:
+                redis_client.delete(self._clave_redis(user_id))
+            except redis.RedisError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            self._entradas.clear()
+
+# Instancia compartida por todo el proceso (AuthService se crea por request)
+user_cache = CacheUsuarios()
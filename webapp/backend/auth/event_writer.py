@@ -0,0 +1,151 @@
+"""
+Escritura asincrónica de eventos de seguridad
+Los eventos se encolan en memoria y un hilo los guarda en Neo4j por lotes (UNWIND),
+así el login no espera la transacción de auditoría
+"""
+import json
+import queue
+import threading
+import time
+from typing import Optional, Dict, Any
+from neo4j import Driver
+from auth.models import SecurityEvent
+
+CREATE_SECURITY_EVENTS = """
+UNWIND $events AS e
+CREATE (:SecurityEvent {
+    event_type: e.event_type,
+    user_id: e.user_id,
+    username: e.username,
+    ip_address: e.ip_address,
+    user_agent: e.user_agent,
+    details: e.details,
+    timestamp: datetime(e.timestamp)
+})
+"""
+
+class SecurityEventWriter:
+    """Cola acotada de SecurityEvent que se vacía por tamaño de lote o por tiempo"""
+
+    def __init__(self, neo4j_driver: Driver, max_queue_size: int = 10000, batch_size: int = 200, flush_interval: float = 1.0):
+        self.driver = neo4j_driver
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max_queue_size)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="security-event-writer", daemon=True)
+        self._stats_lock = threading.Lock()
+        self._stats = {"enqueued": 0, "written": 0, "dropped": 0, "failed": 0, "batches": 0, "max_queue_depth": 0}
+
+    def start(self):
+        self._thread.start()
+
+    @staticmethod
+    def _to_row(event: SecurityEvent) -> Dict[str, Any]:
+        return {
+            "event_type": event.event_type,
+            "user_id": event.user_id,
+            "username": event.username,
+            "ip_address": event.ip_address,
+            "user_agent": event.user_agent,
+            "details": json.dumps(event.details) if event.details else None,
+            "timestamp": event.timestamp.isoformat()
+        }
+
+    def _count(self, key: str, amount: int = 1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def enqueue(self, event: SecurityEvent) -> bool:
+        """Encola sin bloquear; si la cola está llena el evento se descarta y se cuenta"""
+        try:
+            self._queue.put_nowait(self._to_row(event))
+        except queue.Full:
+            self._count("dropped")
+            return False
+        self._count("enqueued")
+        depth = self._queue.qsize()
+        with self._stats_lock:
+            if depth > self._stats["max_queue_depth"]:
+                self._stats["max_queue_depth"] = depth
+        return True
+
+    def _write(self, batch):
+        try:
+            with self.driver.session() as session:
+                session.execute_write(lambda tx: tx.run(CREATE_SECURITY_EVENTS, events=batch).consume())
+            self._count("written", len(batch))
+            self._count("batches")
+        except Exception as e:
+            self._count("failed", len(batch))
+            print(f"⚠️  No se pudieron guardar {len(batch)} eventos de seguridad: {e}")
+
+    def _drain(self, limit: Optional[int] = None):
+        batch = []
+        while limit is None or len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            deadline = time.monotonic() + self.flush_interval
+            batch = []
+            # Junta eventos hasta completar el lote o hasta que pase flush_interval
+            while len(batch) < self.batch_size and not self._stop.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+        self.flush()
+
+    def flush(self):
+        """Escribe todo lo que quede en la cola"""
+        while True:
+            batch = self._drain(self.batch_size)
+            if not batch:
+                return
+            self._write(batch)
+
+    def stop(self, timeout: float = 10.0):
+        """Detiene el hilo vaciando la cola antes de salir"""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+        else:
+            self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["queue_capacity"] = self._queue.maxsize
+        # Backpressure: qué tan llena está la cola (1.0 = se empiezan a descartar eventos)
+        stats["queue_utilization"] = round(stats["queue_depth"] / self._queue.maxsize, 3) if self._queue.maxsize else None
+        return stats
+
+# Instancia del proceso, creada en el lifespan de la aplicación
+_writer: Optional[SecurityEventWriter] = None
+
+def start_event_writer(neo4j_driver: Driver, **kwargs) -> SecurityEventWriter:
+    global _writer
+    if _writer is None:
+        _writer = SecurityEventWriter(neo4j_driver, **kwargs)
+        _writer.start()
+    return _writer
+
+def stop_event_writer():
+    global _writer
+    if _writer is not None:
+        _writer.stop()
+        _writer = None
+
+def get_event_writer() -> Optional[SecurityEventWriter]:
+    return _writer
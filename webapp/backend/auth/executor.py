@@ -0,0 +1,32 @@
+"""
+Executor dedicado para el trabajo bloqueante de autenticación
+bcrypt, sesiones de Neo4j y Redis síncrono corren acá y no en el event loop
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Callable, Any
+from auth.security import SecurityConfig
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+def get_auth_executor() -> ThreadPoolExecutor:
+    """Executor acotado: limita cuántos bcrypt corren a la vez sin ocupar el pool por defecto de Starlette"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=SecurityConfig.AUTH_EXECUTOR_WORKERS,
+            thread_name_prefix="auth"
+        )
+    return _executor
+
+async def run_blocking(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Ejecuta func(*args, **kwargs) en el executor de auth y espera el resultado sin bloquear el loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_auth_executor(), functools.partial(func, *args, **kwargs))
+
+def shutdown_auth_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
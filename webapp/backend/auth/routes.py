@@ -11,55 +11,25 @@ from auth.models import (
 )
 from auth.service import AuthService
 from auth.security import TokenManager, RateLimiter, SecurityConfig, get_client_ip
-from services.neo4j_connection import Neo4jConnection
-import redis
-import os
+from auth.event_writer import get_event_writer
+from auth.executor import run_blocking
+from services import recursos
 
 # Router de autenticación
 auth_router = APIRouter(prefix="/auth", tags=["authentication"])
 
 # Dependencias globales
-def get_auth_service():
-    """Obtiene una instancia del servicio de autenticación"""
-    import config
-    from services.neo4j_connection import Neo4jConnection
-    
-    neo4j_conn = Neo4jConnection(
-        uri=config.URI,
-        user=config.USER,
-        password=config.PASSWORD
-    )
-    
-    try:
-        redis_client = redis.Redis(
-            host=config.REDIS_HOST,
-            port=config.REDIS_PORT,
-            db=0,
-            decode_responses=True
-        )
-        # Test connection
-        redis_client.ping()
-    except:
-        redis_client = None
-        print("⚠️  Redis no disponible - usando fallback sin cache")
-    
-    return AuthService(neo4j_conn.driver, redis_client)
+def get_auth_service(
+    neo4j_driver = Depends(recursos.get_neo4j_driver),
+    redis_client = Depends(recursos.get_redis),
+    event_writer = Depends(get_event_writer)
+):
+    """Obtiene una instancia del servicio de autenticación sobre las conexiones compartidas del proceso"""
+    return AuthService(neo4j_driver, redis_client, event_writer=event_writer)
 
-def get_rate_limiter():
-    """Obtiene una instancia del rate limiter"""
-    import config
-    
-    try:
-        redis_client = redis.Redis(
-            host=config.REDIS_HOST,
-            port=config.REDIS_PORT,
-            db=1,  # Base diferente para rate limiting
-            decode_responses=True
-        )
-        redis_client.ping()
-        return RateLimiter(redis_client)
-    except:
-        return RateLimiter(None)
+def get_rate_limiter(redis_client = Depends(recursos.get_redis_rate_limit)):
+    """Obtiene una instancia del rate limiter (base de Redis separada para rate limiting)"""
+    return RateLimiter(redis_client)
 
 def get_current_user(request: Request, auth_service: AuthService = Depends(get_auth_service)):
     """Obtiene el usuario actual del token"""
@@ -121,7 +91,7 @@ async def register(
     client_ip = get_client_ip(request)
     
     # Rate limiting para registro
-    rate_check = rate_limiter.check_rate_limit(f"register:{client_ip}")
+    rate_check = await run_blocking(rate_limiter.check_rate_limit, f"register:{client_ip}")
     if not rate_check["allowed"]:
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
@@ -129,18 +99,18 @@ async def register(
         )
     
     try:
-        user = auth_service.create_user(user_data)
-        rate_limiter.clear_attempts(f"register:{client_ip}")
+        user = await run_blocking(auth_service.create_user, user_data)
+        await run_blocking(rate_limiter.clear_attempts, f"register:{client_ip}")
         return user
         
     except ValueError as e:
-        rate_limiter.record_failed_attempt(f"register:{client_ip}")
+        await run_blocking(rate_limiter.record_failed_attempt, f"register:{client_ip}")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e)
         )
     except Exception as e:
-        rate_limiter.record_failed_attempt(f"register:{client_ip}")
+        await run_blocking(rate_limiter.record_failed_attempt, f"register:{client_ip}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error interno del servidor"
@@ -159,7 +129,7 @@ async def login(
     user_agent = request.headers.get("User-Agent", "unknown")
     
     # Rate limiting
-    rate_check = rate_limiter.check_rate_limit(f"login:{client_ip}")
+    rate_check = await run_blocking(rate_limiter.check_rate_limit, f"login:{client_ip}")
     if not rate_check["allowed"]:
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
@@ -167,7 +137,8 @@ async def login(
         )
     
     # Autenticar usuario
-    user = auth_service.authenticate_user(
+    user = await run_blocking(
+        auth_service.authenticate_user,
         form_data.username, 
         form_data.password, 
         client_ip, 
@@ -175,16 +146,16 @@ async def login(
     )
     
     if not user:
-        rate_limiter.record_failed_attempt(f"login:{client_ip}")
-        rate_limiter.record_failed_attempt(f"login:{form_data.username}")
+        await run_blocking(rate_limiter.record_failed_attempt, f"login:{client_ip}")
+        await run_blocking(rate_limiter.record_failed_attempt, f"login:{form_data.username}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Credenciales incorrectas"
         )
     
     # Limpiar intentos fallidos
-    rate_limiter.clear_attempts(f"login:{client_ip}")
-    rate_limiter.clear_attempts(f"login:{form_data.username}")
+    await run_blocking(rate_limiter.clear_attempts, f"login:{client_ip}")
+    await run_blocking(rate_limiter.clear_attempts, f"login:{form_data.username}")
     
     # Crear tokens
     token_data = {"sub": str(user.id), "username": user.username}
@@ -192,7 +163,7 @@ async def login(
     refresh_token = auth_service.token_manager.create_refresh_token(token_data)
     
     # Crear sesión
-    session_id = auth_service.create_session(user.id, client_ip, user_agent)
+    session_id = await run_blocking(auth_service.create_session, user.id, client_ip, user_agent)
     
     return TokenResponse(
         access_token=access_token,
@@ -220,7 +191,7 @@ async def refresh_token(
             )
         
         # Obtener usuario
-        user = auth_service.get_user_by_id(int(user_id))
+        user = await run_blocking(auth_service.get_user_by_id, int(user_id))
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -254,7 +225,8 @@ async def logout(
     authorization = request.headers.get("Authorization", "")
     if authorization.startswith("Bearer "):
         token = authorization.split(" ")[1]
-        auth_service.token_manager.revoke_token(token)
+        await run_blocking(auth_service.token_manager.revoke_token, token)
+    await run_blocking(auth_service.invalidate_user_cache, current_user.id)
     
     return {"message": "Sesión cerrada exitosamente"}
 
@@ -272,7 +244,8 @@ async def change_password(
     """Cambia la contraseña del usuario actual"""
     
     try:
-        success = auth_service.change_password(
+        success = await run_blocking(
+            auth_service.change_password,
             current_user.id,
             password_data.current_password,
             password_data.new_password
@@ -300,7 +273,7 @@ async def check_rate_limit(
     """Verifica el estado del rate limiting para el cliente"""
     
     client_ip = get_client_ip(request)
-    rate_check = rate_limiter.check_rate_limit(f"login:{client_ip}")
+    rate_check = await run_blocking(rate_limiter.check_rate_limit, f"login:{client_ip}")
     
     message = None
     if not rate_check["allowed"]:
@@ -326,7 +299,7 @@ async def admin_create_user(
 ):
     """Crea un usuario (solo administradores)"""
     try:
-        return auth_service.create_user(user_data, created_by_admin=True)
+        return await run_blocking(auth_service.create_user, user_data, created_by_admin=True)
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -346,8 +319,10 @@ async def admin_list_users(
 @auth_router.get("/health")
 async def health_check():
     """Verifica el estado del servicio de autenticación"""
+    writer = get_event_writer()
     return {
         "status": "healthy",
         "service": "authentication",
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "security_events": writer.stats() if writer else None
     }
@@ -32,6 +32,18 @@ class SecurityConfig:
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7
     
+    # Cache de usuarios autenticados (get_current_user)
+    USER_CACHE_TTL_SECONDS: int = 60
+    USER_CACHE_MAX_SIZE: int = 1024
+    
+    # Escritura de eventos de seguridad en segundo plano
+    SECURITY_EVENT_QUEUE_SIZE: int = 10000
+    SECURITY_EVENT_BATCH_SIZE: int = 200
+    SECURITY_EVENT_FLUSH_SECONDS: float = 1.0
+    
+    # Hilos para bcrypt / Neo4j / Redis de los endpoints de auth (fuera del event loop)
+    AUTH_EXECUTOR_WORKERS: int = 4
+    
     # Rate limiting
     MAX_LOGIN_ATTEMPTS: int = 5
     LOCKOUT_DURATION_MINUTES: int = 15
@@ -7,16 +7,21 @@ from datetime import datetime, timedelta
 from neo4j import Driver
 from auth.models import UserCreate, UserResponse, UserSession, SecurityEvent
 from auth.security import PasswordHasher, TokenManager, SecurityConfig
+from auth.cache import CacheUsuarios, user_cache
+from auth.event_writer import SecurityEventWriter
 import uuid
 import json
 
 class AuthService:
     """Servicio principal de autenticación"""
     
-    def __init__(self, neo4j_driver: Driver, redis_client=None):
+    def __init__(self, neo4j_driver: Driver, redis_client=None, cache: CacheUsuarios = user_cache,
+                 event_writer: Optional[SecurityEventWriter] = None):
         self.driver = neo4j_driver
         self.redis_client = redis_client
         self.token_manager = TokenManager(redis_client)
+        self.user_cache = cache
+        self.event_writer = event_writer
         
     def create_user(self, user_data: UserCreate, created_by_admin: bool = False) -> UserResponse:
         """Crea un nuevo administrador en Neo4j"""
@@ -82,6 +87,9 @@ class AuthService:
                 role=user_data.role
             ).single()
             
+            # Un id reutilizado no debe devolver datos de un usuario anterior
+            self.invalidate_user_cache(result["id"]) # type: ignore
+            
             # Log del evento de seguridad
             self.log_security_event(SecurityEvent(
                 event_type="admin_created",
@@ -182,7 +190,11 @@ class AuthService:
             )
     
     def get_user_by_id(self, user_id: int) -> Optional[UserResponse]:
-        """Obtiene un administrador por ID"""
+        """Obtiene un administrador por ID (primero desde el cache de usuarios)"""
+        cached = self.user_cache.get(user_id, self.redis_client)
+        if cached:
+            return cached
+        
         with self.driver.session() as session:
             result = session.run(
                 """
@@ -199,15 +211,21 @@ class AuthService:
             ).single()
             
             if result:
-                return UserResponse(
+                user = UserResponse(
                 id=result["id"], # pyright: ignore[reportIndexIssue] # type: ignore
                 username=result["username"], # type: ignore
                 email=result["email"], # type: ignore
                 first_name=result["first_name"], # type: ignore
                 last_name=result["last_name"] # type: ignore
                 )
+                self.user_cache.set(user, self.redis_client)
+                return user
             return None
     
+    def invalidate_user_cache(self, user_id: int):
+        """Descarta el usuario cacheado (cambio de contraseña, cambios de admin, logout)"""
+        self.user_cache.invalidate(user_id, self.redis_client)
+    
     def get_user_by_username(self, username: str) -> Optional[UserResponse]:
         """Obtiene un administrador por username"""
         with self.driver.session() as session:
@@ -310,6 +328,7 @@ class AuthService:
                 user_id=user_id,
                 password_hash=new_password_hash
             )
+            self.invalidate_user_cache(user_id)
             
             # Log del evento
             self.log_security_event(SecurityEvent(
@@ -323,7 +342,11 @@ class AuthService:
             return True
     
     def log_security_event(self, event: SecurityEvent):
-        """Registra un evento de seguridad"""
+        """Registra un evento de seguridad (en segundo plano si hay un SecurityEventWriter)"""
+        if self.event_writer is not None:
+            self.event_writer.enqueue(event)
+            return
+        
         with self.driver.session() as session:
             session.run(
                 """
@@ -0,0 +1,56 @@
+"""
+Benchmark del ACO en islas (algorithms.aco_islas).
+
+Primero corre una sola colonia durante `--epocas` epocas y toma su costo como objetivo; despues mide cuanto
+tarda cada cantidad de islas (cada una en su proceso) en llegar a ese costo. Con nucleos libres, el tiempo
+hasta el objetivo deberia bajar al aumentar las islas. Los puntos son aleatorios con semilla fija.
+
+Uso, desde webapp/backend:
+    python benchmarks/aco_islas.py --puntos 200 --islas 1 2 4 8
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from algorithms.aco_islas import resolver_ruta_islas  # noqa: E402
+from services.trabajos import GestorTrabajos  # noqa: E402
+
+
+def main(args):
+    rng = np.random.default_rng(args.semilla)
+    coordenadas = rng.random((args.puntos, 2)) * 10000
+    dist = np.linalg.norm(coordenadas[:, None] - coordenadas[None], axis=2)
+
+    trabajos = GestorTrabajos(procesos=max(args.islas))
+    try:
+        trabajos.ejecutar_cpu(abs, 0)  # levantar el pool antes de medir
+        _, objetivo, _ = resolver_ruta_islas(dist, n_islas=1, epocas=args.epocas, semilla=args.semilla,
+                                          ejecutar_cpu=trabajos.ejecutar_cpu)
+        resultados = {"puntos": args.puntos, "nucleos": os.cpu_count(), "costo_objetivo": round(objetivo, 1), "islas": []}
+        for n_islas in args.islas:
+            inicio = time.perf_counter()
+            _, costo, _ = resolver_ruta_islas(dist, n_islas=n_islas, epocas=args.epocas * 4, semilla=args.semilla,
+                                           ejecutar_cpu=trabajos.ejecutar_cpu, costo_objetivo=objetivo)
+            resultados["islas"].append({
+                "islas": n_islas,
+                "costo": round(costo, 1),
+                "alcanzo_objetivo": bool(costo <= objetivo),
+                "segundos": round(time.perf_counter() - inicio, 3),
+            })
+    finally:
+        trabajos.cerrar()
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--puntos", type=int, default=200)
+    parser.add_argument("--islas", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--epocas", type=int, default=5)
+    parser.add_argument("--semilla", type=int, default=42)
+    main(parser.parse_args())
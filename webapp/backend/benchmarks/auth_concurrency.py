@@ -0,0 +1,95 @@
+"""
+Benchmark de concurrencia del login.
+
+Mide la latencia de /health sola y mientras se disparan logins concurrentes contra el backend levantado,
+junto con el throughput de /auth/login. Si bcrypt o Neo4j bloquearan el event loop, la latencia de
+/health crece al nivel del costo de bcrypt mientras hay logins en curso.
+
+Uso:
+    python benchmarks/auth_concurrency.py --url http://localhost:8000 --username admin --password 'Admin123!Dev'
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import httpx
+
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def resumen(latencias):
+    return {
+        "n": len(latencias),
+        "p50_ms": round(percentil(latencias, 50) * 1000, 2) if latencias else None,
+        "p95_ms": round(percentil(latencias, 95) * 1000, 2) if latencias else None,
+        "max_ms": round(max(latencias) * 1000, 2) if latencias else None,
+        "media_ms": round(statistics.mean(latencias) * 1000, 2) if latencias else None,
+    }
+
+
+async def sondear_health(client, duracion_s, intervalo_s=0.02):
+    latencias = []
+    fin = time.perf_counter() + duracion_s
+    while time.perf_counter() < fin:
+        inicio = time.perf_counter()
+        await client.get("/health")
+        latencias.append(time.perf_counter() - inicio)
+        await asyncio.sleep(intervalo_s)
+    return latencias
+
+
+async def logins(client, total, concurrencia, username, password):
+    semaforo = asyncio.Semaphore(concurrencia)
+    latencias = []
+    codigos = {}
+
+    async def uno():
+        async with semaforo:
+            inicio = time.perf_counter()
+            r = await client.post("/auth/login", data={"username": username, "password": password})
+            latencias.append(time.perf_counter() - inicio)
+            codigos[r.status_code] = codigos.get(r.status_code, 0) + 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(uno() for _ in range(total)))
+    return latencias, codigos, time.perf_counter() - inicio
+
+
+async def main(args):
+    async with httpx.AsyncClient(base_url=args.url, timeout=60) as client:
+        base = await sondear_health(client, args.duracion_base)
+
+        tarea_logins = asyncio.create_task(logins(client, args.logins, args.concurrencia, args.username, args.password))
+        durante = []
+        while not tarea_logins.done():
+            durante.extend(await sondear_health(client, 0.5))
+        lat_login, codigos, segundos = await tarea_logins
+
+    resultado = {
+        "health_sin_carga": resumen(base),
+        "health_durante_logins": resumen(durante),
+        "login": {
+            **resumen(lat_login),
+            "codigos": codigos,
+            "segundos": round(segundos, 3),
+            "logins_por_segundo": round(len(lat_login) / segundos, 2) if segundos > 0 else None,
+        },
+    }
+    print(json.dumps(resultado, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--concurrencia", type=int, default=20)
+    parser.add_argument("--duracion-base", type=float, default=3.0)
+    asyncio.run(main(parser.parse_args()))
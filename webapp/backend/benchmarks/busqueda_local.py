@@ -0,0 +1,93 @@
+"""
+Benchmark de la busqueda local 2-opt / Or-opt despues del ACO.
+
+Carga nodes.csv / edges.csv en un GrafoCSR (sin Neo4j), toma muestras de puntos de la componente fuertemente
+conexa con semilla fija y compara, para cada tamano, el ACO solo con muchas iteraciones contra el ACO con
+pocas iteraciones mas busqueda local ("final" o "iteracion"). Para optimizacion_2 los k caminos alternativos
+se simulan a partir del camino minimo (costo * U(1, 1.3)), mas rapido que correr Yen para todos los pares.
+
+Uso, desde webapp/backend:
+    python benchmarks/busqueda_local.py --tamanos 20 50 150 --repeticiones 3
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from algorithms import optimizacion_1, optimizacion_2  # noqa: E402
+from services.grafo_memoria import GrafoCSR  # noqa: E402
+
+CONFIGURACIONES = [
+    {"iteraciones": 30, "busqueda_local": None},
+    {"iteraciones": 100, "busqueda_local": None},
+    {"iteraciones": 10, "busqueda_local": "final"},
+    {"iteraciones": 10, "busqueda_local": "iteracion"},
+]
+
+
+def componente_conexa(grafo):
+    """Ids de la mayor componente fuertemente conexa (aproximada desde el nodo con mas alcance)"""
+    dist = grafo.matriz_distancias(grafo.ids)
+    alcanza = np.isfinite(dist)
+    raiz = int(np.argmax(alcanza.sum(axis=0) + alcanza.sum(axis=1)))
+    return [grafo.ids[i] for i in np.flatnonzero(alcanza[raiz] & alcanza[:, raiz])]
+
+
+def medir(funcion, repeticiones):
+    costos, tiempos = [], []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        _, costo, _ = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+        costos.append(costo)
+    return {
+        "costo_medio": round(float(np.mean(costos)), 1),
+        "costo_min": round(float(np.min(costos)), 1),
+        "segundos_medio": round(float(np.mean(tiempos)), 4),
+    }
+
+
+def tensores_simulados(dist, k, rng):
+    n = dist.shape[0]
+    factores = np.concatenate((np.ones((n, n, 1)), rng.uniform(1.0, 1.3, (n, n, k - 1))), axis=2)
+    tensor = (dist[:, :, None] * np.sort(factores, axis=2)).astype(np.float32)
+    tensor[np.arange(n), np.arange(n)] = np.inf
+    mask = np.isfinite(tensor)
+    return tensor, np.where(mask, 1.0, 0.0).astype(np.float32), mask
+
+
+def main(args):
+    grafo = GrafoCSR.desde_csv(args.nodes, args.edges)
+    candidatos = componente_conexa(grafo)
+    rng = np.random.default_rng(args.semilla)
+    resultados = []
+    for tamano in args.tamanos:
+        ids = rng.choice(candidatos, size=min(tamano, len(candidatos)), replace=False).tolist()
+        dist = grafo.matriz_distancias(ids)
+        tensor, feromona, mask = tensores_simulados(dist, 3, rng)
+        for config in CONFIGURACIONES:
+            it, ls = config["iteraciones"], config["busqueda_local"]
+            resultados.append({
+                "algoritmo": "optimizacion_1", "puntos": len(ids), **config,
+                **medir(lambda: optimizacion_1.resolver_ruta(dist, n_iteraciones=it, busqueda_local=ls), args.repeticiones),
+            })
+            resultados.append({
+                "algoritmo": "optimizacion_2", "puntos": len(ids), **config,
+                **medir(lambda: optimizacion_2.resolver_ruta(tensor, feromona, mask, iteraciones=it, busqueda_local=ls),
+                        args.repeticiones),
+            })
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", default="nodes.csv")
+    parser.add_argument("--edges", default="edges.csv")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[20, 50, 150])
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--semilla", type=int, default=42)
+    main(parser.parse_args())
@@ -0,0 +1,110 @@
+"""
+Benchmark de la consulta de tramo cercano en Neo4j.
+
+Compara la consulta anterior (point() construido por cada Point, sin indice) con la actual
+(point.withinBBox sobre Point.location con indice espacial y distancia real al tramo) y, como
+referencia, el indice en memoria. Las coordenadas se sortean con semilla fija dentro del mapa cargado
+(por defecto el de Mendoza que genera POST /Mapa).
+
+Uso, desde webapp/backend con config.py y el mapa ya importado:
+    python benchmarks/proximidad_neo4j.py --consultas 200
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import numpy as np
+from fastapi import HTTPException
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+from map_graph.import_data import asegurar_indice_espacial  # noqa: E402
+from models.schemes import Coordenadas  # noqa: E402
+from services.grafo_memoria import GrafoCSR  # noqa: E402
+from services.neo4j_connection import Neo4jConnection  # noqa: E402
+from services.point_service import obtener_tramo_cercano, obtener_tramos_cercanos  # noqa: E402
+
+# Consulta tal como estaba antes de guardar Point.location
+CY_TRAMO_CERCANO_ANTERIOR = """
+WITH point({latitude: $lat, longitude: $lon}) AS input
+MATCH (n1:Point)
+WHERE point.distance(point({latitude: n1.lat, longitude: n1.lon}), input) < 1000
+WITH n1, input
+MATCH (n1)-[r:STREET]->(n2:Point)
+RETURN n1.id AS from_id, n2.id AS to_id, r.name AS calle,
+       point.distance(point({latitude: n1.lat, longitude: n1.lon}), input) AS dist_from,
+       point.distance(point({latitude: n2.lat, longitude: n2.lon}), input) AS dist_to
+ORDER BY dist_from + dist_to ASC
+LIMIT 1
+"""
+
+
+def resumen(latencias):
+    ordenadas = sorted(latencias)
+    return {
+        "n": len(ordenadas),
+        "p50_ms": round(ordenadas[len(ordenadas) // 2] * 1000, 3),
+        "p95_ms": round(ordenadas[min(len(ordenadas) - 1, int(0.95 * len(ordenadas)))] * 1000, 3),
+        "media_ms": round(statistics.mean(ordenadas) * 1000, 3),
+    }
+
+
+def medir(funcion, coordenadas):
+    latencias = []
+    for coord in coordenadas:
+        inicio = time.perf_counter()
+        funcion(coord)
+        latencias.append(time.perf_counter() - inicio)
+    return resumen(latencias)
+
+
+def main(args):
+    conn = Neo4jConnection(config.URI, config.USER, config.PASSWORD)
+    try:
+        asegurar_indice_espacial(conn)
+        grafo = GrafoCSR.desde_neo4j(conn.driver)
+        if grafo.n == 0:
+            raise SystemExit("No hay mapa cargado (POST /Mapa)")
+
+        rng = np.random.default_rng(args.semilla)
+        lats = rng.uniform(grafo.lat.min(), grafo.lat.max(), args.consultas)
+        lons = rng.uniform(grafo.lon.min(), grafo.lon.max(), args.consultas)
+        coordenadas = [Coordenadas(lat=float(la), lon=float(lo)) for la, lo in zip(lats, lons)]
+
+        def anterior(coord):
+            with conn.driver.session() as session:
+                session.run(CY_TRAMO_CERCANO_ANTERIOR, lat=coord.lat, lon=coord.lon).single()
+
+        def actual(coord):
+            try:
+                obtener_tramo_cercano(coord, conn)
+            except HTTPException:
+                # Sin tramos dentro del radio: igual cuenta como consulta
+                pass
+
+        # Calentamiento: planes de consulta en cache y el indice en memoria construido
+        for funcion in (anterior, actual):
+            funcion(coordenadas[0])
+        grafo.indice_segmentos()
+
+        resultado = {
+            "nodos": grafo.n,
+            "aristas": grafo.m,
+            "consultas": args.consultas,
+            "neo4j_sin_indice": medir(anterior, coordenadas),
+            "neo4j_indice_location": medir(actual, coordenadas),
+            "memoria_grilla": medir(lambda c: obtener_tramos_cercanos(c, grafo, 1), coordenadas),
+        }
+        print(json.dumps(resultado, indent=2))
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--consultas", type=int, default=200)
+    parser.add_argument("--semilla", type=int, default=42)
+    main(parser.parse_args())
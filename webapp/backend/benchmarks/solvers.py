@@ -0,0 +1,213 @@
+"""
+Suite de benchmarks de los solvers, sin Neo4j.
+
+Carga nodes.csv / edges.csv en un GrafoCSR y arma conjuntos de puntos de 10, 50, 200 y 500 con semilla fija.
+El grafo de ejemplo tiene menos nodos que el conjunto mas grande, asi que los puntos son locales sinteticos:
+se insertan partiendo tramos de la componente fuertemente conexa (igual que insertar_nuevo_punto), elegidos
+al azar con la semilla. Para cada tamano se mide una vez la matriz de distancias (y las de distancia y
+tiempo juntas, GrafoCSR.matrices_costos) y, para cada variante de solver, el tiempo, el pico de memoria
+(tracemalloc, en una corrida aparte para no inflar el tiempo) y el costo del recorrido. Las variantes de optimizacion_2 usan un solo camino por par (k = 1): Yen en memoria
+(GrafoCSR.k_caminos) para todos los pares de 500 puntos tardaria mas que el benchmark entero.
+
+El resultado es JSON (con el commit y las versiones) para guardar y comparar entre commits.
+
+Uso, desde webapp/backend:
+    python benchmarks/solvers.py --salida base.json
+    python benchmarks/solvers.py --tamanos 10 50 --comparar base.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime, timezone
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from algorithms import optimizacion_1, optimizacion_2  # noqa: E402
+from algorithms.aco_islas import resolver_ruta_islas  # noqa: E402
+from services.grafo_memoria import GrafoCSR, leer_csv  # noqa: E402
+
+TAMANOS = [10, 50, 200, 500]
+PREFIJO_PUNTO = "bench-"
+
+
+def _opt2(dist, semilla, **kwargs):
+    tensor = dist[:, :, None].astype(np.float32)
+    tensor[np.arange(len(dist)), np.arange(len(dist))] = np.inf
+    mask = np.isfinite(tensor)
+    ruta, costo, estadisticas = optimizacion_2.resolver_ruta(tensor, mask.astype(np.float32), mask, semilla=semilla,
+                                                             **kwargs)
+    # optimizacion_2 devuelve tramos (origen, destino, camino): pasarlos a la secuencia de nodos de optimizacion_1
+    return [o for o, _, _ in ruta] + [ruta[0][0]], costo, estadisticas
+
+
+# nombre -> (funcion(dist, semilla), tamano maximo o None)
+VARIANTES = {
+    "opt1": (lambda dist, s: optimizacion_1.resolver_ruta(dist, n_iteraciones=30, busqueda_local=None, semilla=s), None),
+    "opt1_final": (lambda dist, s: optimizacion_1.resolver_ruta(dist, busqueda_local="final", semilla=s), None),
+    "opt1_iteracion": (lambda dist, s: optimizacion_1.resolver_ruta(dist, busqueda_local="iteracion", semilla=s), 200),
+    "opt1_islas": (lambda dist, s: resolver_ruta_islas(dist, semilla=s), 200),
+    # Corte por convergencia: deterministico con la semilla, a diferencia de un presupuesto de tiempo
+    "opt1_convergencia": (lambda dist, s: optimizacion_1.resolver_ruta(dist, sin_mejora=15, semilla=s), None),
+    "opt2": (lambda dist, s: _opt2(dist, s, iteraciones=30, busqueda_local=None), None),
+    "opt2_final": (lambda dist, s: _opt2(dist, s, busqueda_local="final"), None),
+}
+
+
+def _componente_conexa(nodos, aristas):
+    grafo = GrafoCSR.desde_listas(nodos, aristas)
+    alcanza = np.isfinite(grafo.matriz_distancias(grafo.ids))
+    raiz = int(np.argmax(alcanza.sum(axis=0) + alcanza.sum(axis=1)))
+    return {grafo.ids[i] for i in np.flatnonzero(alcanza[raiz] & alcanza[:, raiz])}
+
+
+def grafo_con_puntos(nodes_path, edges_path, cantidad, semilla):
+    """
+    GrafoCSR con `cantidad` puntos nuevos insertados sobre tramos al azar de la componente conexa.
+    Cada punto parte su tramo (y el de la mano contraria, si existe) en proporcion a la distancia, como
+    services.point_service. Devuelve (grafo, ids de los puntos en orden de creacion).
+    """
+    nodos, aristas = leer_csv(nodes_path, edges_path)
+    conexos = _componente_conexa(nodos, aristas)
+    coordenadas = {nid: (lat, lon) for nid, lat, lon, *_ in nodos}
+    # Un tramo por par de nodos sin importar la mano: las dos manos se parten en el mismo lugar
+    tramos = sorted({tuple(sorted((u, v))) for u, v, *_ in aristas if u in conexos and v in conexos and u != v})
+    rng = np.random.default_rng(semilla)
+    elegidos = rng.integers(len(tramos), size=cantidad)
+    fracciones = rng.uniform(0.1, 0.9, size=cantidad)
+
+    cortes = defaultdict(list)
+    ids = []
+    for k, (t, f) in enumerate(zip(elegidos, fracciones)):
+        a, b = tramos[t]
+        (lat_a, lon_a), (lat_b, lon_b) = coordenadas[a], coordenadas[b]
+        nid = f"{PREFIJO_PUNTO}{k}"
+        nodos.append((nid, lat_a + f * (lat_b - lat_a), lon_a + f * (lon_b - lon_a), "Local"))
+        cortes[(a, b)].append((f, nid))
+        ids.append(nid)
+
+    nuevas = []
+    for u, v, longitud, peso, nombre in aristas:
+        clave = (u, v) if (u, v) in cortes else (v, u)
+        if clave not in cortes:
+            nuevas.append((u, v, longitud, peso, nombre))
+            continue
+        # Los cortes se ordenan desde u: en la mano contraria la fraccion se mide desde el otro extremo
+        puntos = sorted((f if clave == (u, v) else 1 - f, nid) for f, nid in cortes[clave])
+        cadena = [(0.0, u)] + puntos + [(1.0, v)]
+        for (f1, n1), (f2, n2) in zip(cadena, cadena[1:]):
+            nuevas.append((n1, n2, longitud * (f2 - f1), peso * (f2 - f1), nombre))
+    return GrafoCSR.desde_listas(nodos, nuevas), ids
+
+
+def medir(funcion, repeticiones):
+    """Tiempos sin trazar y, aparte, una corrida con tracemalloc para el pico de memoria"""
+    tiempos, resultado = [], None
+    for r in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion(r)
+        tiempos.append(time.perf_counter() - inicio)
+    tracemalloc.start()
+    try:
+        funcion(0)
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return tiempos, pico, resultado
+
+
+def _metadatos(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "fecha": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "nucleos": os.cpu_count(),
+        "semilla": args.semilla,
+        "repeticiones": args.repeticiones,
+    }
+
+
+def correr(args):
+    # Siempre el mismo grafo y una semilla por tamano: el conjunto de N puntos no depende de los otros tamanos pedidos
+    grafo, puntos = grafo_con_puntos(args.nodes, args.edges, max(TAMANOS + args.tamanos), args.semilla)
+    resultados = []
+    for tamano in args.tamanos:
+        ids = np.random.default_rng([args.semilla, tamano]).choice(puntos, size=tamano, replace=False).tolist()
+        tiempos, pico, dist = medir(lambda _: grafo.matriz_distancias(ids), args.repeticiones)
+        matriz = {"segundos": round(min(tiempos), 4), "memoria_pico_mb": round(pico / 2 ** 20, 2)}
+        tiempos, _, _ = medir(lambda _: grafo.matrices_costos(ids), args.repeticiones)
+        matriz["criterios_segundos"] = round(min(tiempos), 4)
+        for nombre in args.variantes:
+            funcion, maximo = VARIANTES[nombre]
+            if maximo is not None and tamano > maximo and not args.todas:
+                continue
+            tiempos, pico, (ruta, costo, estadisticas) = medir(lambda r: funcion(dist, args.semilla + r), args.repeticiones)
+            resultados.append({
+                "variante": nombre,
+                "puntos": tamano,
+                "matriz_segundos": matriz["segundos"],
+                "matriz_memoria_pico_mb": matriz["memoria_pico_mb"],
+                "matrices_criterios_segundos": matriz["criterios_segundos"],
+                "solver_segundos": round(float(np.median(tiempos)), 4),
+                "solver_memoria_pico_mb": round(pico / 2 ** 20, 2),
+                "costo": round(float(costo), 1),
+                "iteraciones": estadisticas["iteraciones"],
+                "ruta_valida": sorted(ruta[:-1]) == list(range(tamano)) and ruta[0] == ruta[-1],
+            })
+            print(f"{nombre:>17} {tamano:>4} puntos: {resultados[-1]['solver_segundos']:.3f} s, "
+                  f"costo {resultados[-1]['costo']}", file=sys.stderr)
+    return {"metadatos": _metadatos(args), "resultados": resultados}
+
+
+def comparar(actual, base):
+    """Diferencia relativa de tiempo y costo contra un JSON anterior, por (variante, puntos)"""
+    anteriores = {(r["variante"], r["puntos"]): r for r in base["resultados"]}
+    filas = []
+    for r in actual["resultados"]:
+        previo = anteriores.get((r["variante"], r["puntos"]))
+        if previo is None:
+            continue
+        fila = {"variante": r["variante"], "puntos": r["puntos"]}
+        for campo in ("matriz_segundos", "solver_segundos", "solver_memoria_pico_mb", "costo"):
+            fila[campo] = round((r[campo] - previo[campo]) / previo[campo] * 100, 1) if previo[campo] else None
+        filas.append(fila)
+    return {"base": base["metadatos"].get("commit"), "actual": actual["metadatos"].get("commit"),
+            "diferencia_porcentual": filas}
+
+
+def main(args):
+    actual = correr(args)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(actual, f, indent=2)
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            print(json.dumps(comparar(actual, json.load(f)), indent=2))
+    elif not args.salida:
+        print(json.dumps(actual, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", default="nodes.csv")
+    parser.add_argument("--edges", default="edges.csv")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=TAMANOS)
+    parser.add_argument("--variantes", nargs="+", choices=list(VARIANTES), default=list(VARIANTES))
+    parser.add_argument("--todas", action="store_true", help="correr tambien las variantes lentas en tamanos grandes")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--salida", help="archivo JSON donde guardar los resultados")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior contra el que comparar")
+    main(parser.parse_args())
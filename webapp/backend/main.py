@@ -1,21 +1,81 @@
-from fastapi import FastAPI, HTTPException, Depends, status, Form
+from contextlib import asynccontextmanager, contextmanager
+from typing import Literal
+from fastapi import FastAPI, HTTPException, Depends, status, Form, UploadFile, File, Query
 from services.neo4j_connection import Neo4jConnection
-from services.point_service import delete_map_point, insertar_nuevo_punto, list_map_points, obtener_tramo_cercano
-from services.queries import obtener_puntos ,asegurar_proyeccion_grafo
+from services import recursos
+from auth.event_writer import start_event_writer, stop_event_writer
+from auth.executor import shutdown_auth_executor
+from auth.security import SecurityConfig
+from services.point_service import (
+    delete_map_point, insertar_nuevo_punto, list_map_points, obtener_tramos_cercanos,
+    insertar_puntos_masivo, eliminar_puntos_masivo, leer_locales_csv,
+)
 from services.graph_services import crear_mapa_logistico, eliminar_mapa
+from services.version_grafo import VersionGrafo
+from services.cache_matriz import CacheMatriz
+from services.proyeccion import GestorProyeccion
+from services.trabajos import GestorTrabajos
+from services.grafo_memoria import GrafoEnMemoria
+from services.backend_grafo import (
+    BACKEND_MEMORIA, BACKEND_NEO4J, MAX_PUNTOS_K_CAMINOS, OBJETIVOS, BackendMemoria, BackendNeo4j,
+)
+from services.geometria import FORMATO_COMPLETO, compactar_rutas
 import config
-from algorithms import optimizacion_1,optimizacion_2 # type: ignore
+from algorithms import optimizacion_1,optimizacion_2,optimizacion_flota # type: ignore
 from fastapi.middleware.cors import CORSMiddleware
-from models.schemes import Coordenadas, Intersection, PuntoEstablecimiento, InsercionRequest, MapaRequest
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse
+from models.schemes import Coordenadas, Intersection, PuntoEstablecimiento, InsercionRequest, MapaRequest, InsercionMasivaRequest, BorradoMasivoRequest
 from auth.routes import auth_router, get_current_user
 from auth.service import AuthService
 from auth.models import UserResponse
 import redis
 
-conn = Neo4jConnection(config.URI, config.USER, config.PASSWORD)
-# Conexión a Redis
-redis_client = redis.Redis(host='redis', port=6379, db=0, decode_responses=True)
-app = FastAPI()
+# Conexiones compartidas (driver de Neo4j y pools de Redis): se crean en lifespan
+conn: Neo4jConnection = None # type: ignore
+# Version del mapa y cache de matrices de distancia (la matriz se guarda en binario)
+version_mapa: VersionGrafo = None # type: ignore
+cache_matriz: CacheMatriz = None # type: ignore
+# Version de datos (cualquier escritura sobre el grafo) y proyeccion GDS que se reconstruye solo si quedo vieja
+version_datos: VersionGrafo = None # type: ignore
+proyecciones: GestorProyeccion = None # type: ignore
+# Grafo en memoria con indice espacial de tramos: las altas/bajas de un punto se le aplican en el lugar,
+# el resto de los cambios de version_datos lo recargan
+grafo_memoria: GrafoEnMemoria = None # type: ignore
+# Pool de procesos para la fase de CPU de las optimizaciones
+trabajos = GestorTrabajos(
+    procesos=getattr(config, "OPTIMIZATION_WORKERS", None),
+    timeout_s=getattr(config, "OPTIMIZATION_TIMEOUT_S", 300),
+    redis_client=recursos.get_redis,
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global conn, version_mapa, cache_matriz, version_datos, proyecciones, grafo_memoria
+    recursos.iniciar()
+    recursos.verificar_redis()
+    conn = recursos.get_neo4j()
+    # Redis se resuelve en cada uso: si estaba caido al arrancar, las versiones y la cache lo toman cuando vuelve
+    version_mapa = VersionGrafo(recursos.get_redis)
+    cache_matriz = CacheMatriz(version_mapa, recursos.get_redis_binario)
+    version_datos = VersionGrafo(recursos.get_redis, clave="grafo:version:datos")
+    proyecciones = GestorProyeccion(conn.driver, version_datos, redis_client=recursos.get_redis)
+    grafo_memoria = GrafoEnMemoria(conn.driver, version_datos, redis_client=recursos.get_redis)
+    start_event_writer(
+        conn.driver,
+        max_queue_size=SecurityConfig.SECURITY_EVENT_QUEUE_SIZE,
+        batch_size=SecurityConfig.SECURITY_EVENT_BATCH_SIZE,
+        flush_interval=SecurityConfig.SECURITY_EVENT_FLUSH_SECONDS,
+    )
+    yield
+    trabajos.cerrar()
+    shutdown_auth_executor()
+    # Vaciar la cola de eventos antes de cerrar el driver
+    stop_event_writer()
+    recursos.cerrar()
+
+# orjson para todas las respuestas; las rutas devuelven ORJSONResponse directo para evitar jsonable_encoder
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # Incluir rutas de autenticación
 app.include_router(auth_router)
@@ -37,50 +97,222 @@ def read_root():
 def health_check():
     return {"status": "healthy", "service": "logistics-api"}
 
+@app.get("/health/pools")
+def pool_stats():
+    """Estado de los pools de conexiones de Neo4j y Redis"""
+    return recursos.estadisticas()
+
 @app.post("/Mapa")
 def crear_mapa(data: MapaRequest, current_user: UserResponse = Depends(get_current_user)):
     """Crear mapa - requiere autenticación"""
-    return crear_mapa_logistico(data,conn)
+    resultado = crear_mapa_logistico(data,conn)
+    version_mapa.incrementar()
+    version_datos.incrementar()
+    return resultado
 
 @app.delete("/Mapa")
 def borrar_mapa(current_user: UserResponse = Depends(get_current_user)):
     """Borrar mapa - requiere autenticación"""
     eliminar_mapa(conn)
+    version_mapa.incrementar()
+    version_datos.incrementar()
     return {"Borrado": "Exitoso"}
 
 @app.get("/puntos/mapa")
-def get_puntos_mapa():
-    return list_map_points(conn)
+def get_puntos_mapa(formato: Literal["json", "ndjson"] = "json"):
+    return list_map_points(conn, ndjson=formato == "ndjson")
 
 @app.delete("/punto/{id}")
 def delete_punto(id: str, current_user: UserResponse = Depends(get_current_user)):
     """Eliminar punto - requiere autenticación"""
-    return delete_map_point(id,conn)
+    resultado, cambio = delete_map_point(id,conn)
+    cache_matriz.invalidar_punto(id)
+    version = version_datos.incrementar()
+    if cambio is not None:
+        grafo_memoria.registrar_cambio(version, cambio)
+    return resultado
 
 @app.post("/ubicacion/tramo-cercano")
 def get_tramo_cercano(coord: Coordenadas):
-    return obtener_tramo_cercano(coord,conn)
+    tramos = obtener_tramos_cercanos(coord, grafo_memoria.obtener(), k=1)
+    if not tramos:
+        raise HTTPException(status_code=404, detail="No se encontró un tramo cercano.")
+    return tramos[0]
+
+@app.post("/ubicacion/tramos-cercanos")
+def get_tramos_cercanos(coord: Coordenadas, k: int = 5):
+    """Los k tramos mas cercanos, ordenados por distancia real al tramo"""
+    return obtener_tramos_cercanos(coord, grafo_memoria.obtener(), k=max(1, min(k, 50)))
 
 @app.post("/ubicacion/insertar-local")
 def insertar_local(data: InsercionRequest, current_user: UserResponse = Depends(get_current_user)):
     """Insertar local - requiere autenticación"""
-    return insertar_nuevo_punto(data,conn)
+    resultado, cambio = insertar_nuevo_punto(data,conn)
+    cache_matriz.invalidar_punto(data.local.id)
+    grafo_memoria.registrar_cambio(version_datos.incrementar(), cambio)
+    return resultado
 
-@app.get("/calcularRuta")
-def calcular_ruta_optima():
-    asegurar_proyeccion_grafo(conn.driver)
-    puntos_ids = obtener_puntos(conn.driver)
+def _insertar_locales(locales):
+    resultado = insertar_puntos_masivo(
+        locales, conn, grafo_memoria.obtener(),
+        tamano_lote=getattr(config, "BULK_BATCH_SIZE", 500),
+    )
+    for id_ in resultado["insertados"]:
+        cache_matriz.invalidar_punto(id_)
+    if resultado["insertados"]:
+        version_datos.incrementar()
+    return resultado
+
+@app.post("/ubicacion/insertar-locales")
+def insertar_locales(data: InsercionMasivaRequest, current_user: UserResponse = Depends(get_current_user)):
+    """Alta masiva de locales: se ajustan a la calle mas cercana y se insertan por lotes"""
+    return _insertar_locales(data.locales)
+
+@app.post("/ubicacion/insertar-locales/csv")
+async def insertar_locales_csv(archivo: UploadFile = File(...), current_user: UserResponse = Depends(get_current_user)):
+    """Igual que /ubicacion/insertar-locales pero desde un CSV (id,name,lat,lon[,tipo])"""
+    locales = leer_locales_csv((await archivo.read()).decode("utf-8-sig"))
+    return await run_in_threadpool(_insertar_locales, locales)
+
+@app.post("/puntos/borrar")
+def borrar_puntos(data: BorradoMasivoRequest, current_user: UserResponse = Depends(get_current_user)):
+    """Baja masiva de locales, volviendo a unir las calles"""
+    resultado = eliminar_puntos_masivo(data.ids, conn, tamano_lote=getattr(config, "BULK_BATCH_SIZE", 500))
+    for id_ in resultado["borrados"]:
+        cache_matriz.invalidar_punto(id_)
+    if resultado["borrados"]:
+        version_datos.incrementar()
+    return resultado
+
+def _formatear_rutas(rutas, geometria, tolerancia_m):
+    """Geometria completa ({tramo: [{id, lat, lon}]}) o compacta (services.geometria)"""
+    if geometria == FORMATO_COMPLETO:
+        return rutas
+    return compactar_rutas(rutas, formato=geometria, tolerancia_m=tolerancia_m)
+
+@contextmanager
+def usar_backend(nombre=None):
+    """Backend de grafo para los algoritmos: el pedido en el request o GRAPH_BACKEND ("neo4j" por defecto)"""
+    nombre = nombre or getattr(config, "GRAPH_BACKEND", BACKEND_NEO4J)
+    if nombre == BACKEND_MEMORIA:
+        yield BackendMemoria(grafo_memoria.obtener(),
+                             max_puntos_k_caminos=getattr(config, "MEMORY_KPATHS_MAX_POINTS", MAX_PUNTOS_K_CAMINOS))
+    else:
+        with proyecciones.usar() as proyeccion:
+            yield BackendNeo4j(conn.driver, proyeccion)
+
+def opciones_solver(tiempo_limite_ms: int | None = Query(None, ge=1, le=600000), sin_mejora: int | None = Query(None, ge=1),
+                    semilla: int | None = None):
+    """Corte del ACO por tiempo o por convergencia y semilla fija; sin parametros valen ACO_TIME_LIMIT_MS / ACO_NO_IMPROVEMENT"""
+    return {
+        "tiempo_limite_ms": tiempo_limite_ms or getattr(config, "ACO_TIME_LIMIT_MS", None),
+        "sin_mejora": sin_mejora or getattr(config, "ACO_NO_IMPROVEMENT", None),
+        "semilla": semilla,
+    }
+
+def ejecutar_optimizacion_1(ejecutar_cpu, geometria=FORMATO_COMPLETO, tolerancia_m=0.0, islas=None, backend=None, opciones=None,
+                            objetivo="distancia"):
+    # Una isla por proceso del pool: con mas islas que procesos las epocas se encolan en lugar de correr a la vez,
+    # y un solo request no puede ocupar mas lugares de los que tiene el pool
+    islas = min(islas or getattr(config, "ACO_ISLANDS", 1), trabajos.procesos)
     #ordenar centro de distrubcion.
-    result = optimizacion_1.ejecutarOptimizacion(conn.driver,puntos_ids)
-    return result
+    with usar_backend(backend) as grafo:
+        rutas, solver = optimizacion_1.ejecutarOptimizacion(grafo,grafo.puntos(),cache=cache_matriz,ejecutar_cpu=ejecutar_cpu,
+                                                            islas=islas,opciones=opciones,objetivo=OBJETIVOS[objetivo])
+    # "solver" no es una lista de nodos: el frontend lo saltea al unir los tramos
+    return {**_formatear_rutas(rutas, geometria, tolerancia_m), "solver": solver}
+
+def ejecutar_optimizacion_2(ejecutar_cpu, geometria=FORMATO_COMPLETO, tolerancia_m=0.0, backend=None, opciones=None,
+                            progreso=None):
+    with usar_backend(backend) as grafo:
+        rutas, solver = optimizacion_2.ejecutarOptimizacion(grafo, grafo.puntos(), ejecutar_cpu=ejecutar_cpu, opciones=opciones,
+                                                            progreso=progreso)
+    return {**_formatear_rutas(rutas, geometria, tolerancia_m), "solver": solver}
+
+def ejecutar_optimizacion_flota(ejecutar_cpu, geometria=FORMATO_COMPLETO, tolerancia_m=0.0, deposito_id=None, backend=None,
+                                opciones=None, objetivo="distancia"):
+    with usar_backend(backend) as grafo:
+        resultado = optimizacion_flota.ejecutarOptimizacionFlota(
+            conn.driver, grafo.puntos(), grafo, cache=cache_matriz,
+            ejecutar_cpu=ejecutar_cpu, deposito_id=deposito_id, opciones=opciones, objetivo=OBJETIVOS[objetivo],
+            hilos=trabajos.procesos,
+        )
+    for vehiculo in resultado["vehiculos"]:
+        vehiculo["rutas"] = _formatear_rutas(vehiculo["rutas"], geometria, tolerancia_m)
+    return resultado
+
+# geometria=polyline|delta devuelve un arreglo de coordenadas compartido con offsets por tramo;
+# tolerancia_m > 0 simplifica cada tramo con Douglas-Peucker
+FormatoGeometria = Literal["completa", "polyline", "delta"]
+# backend=memoria resuelve matriz, caminos y geometria dentro del proceso, sin consultas a GDS
+BackendGrafoNombre = Literal["neo4j", "memoria"]
+# objetivo=tiempo minimiza la suma de weight (length / maxspeed); distancia y tiempo salen de la misma matriz cacheada
+Objetivo = Literal["distancia", "tiempo"]
+
+# islas > 1: colonias ACO en paralelo (una por proceso) que intercambian sus mejores rutas; se limita a los
+# procesos del pool (OPTIMIZATION_WORKERS), el valor usado vuelve en solver.islas
+@app.get("/calcularRuta")
+def calcular_ruta_optima(geometria: FormatoGeometria = FORMATO_COMPLETO, tolerancia_m: float = Query(0.0, ge=0),
+                         islas: int | None = Query(None, ge=1, le=32), backend: BackendGrafoNombre | None = None,
+                         opciones: dict = Depends(opciones_solver), objetivo: Objetivo = "distancia"):
+    return ORJSONResponse(ejecutar_optimizacion_1(trabajos.ejecutar_cpu, geometria, tolerancia_m, islas, backend, opciones,
+                                                  objetivo))
 
 @app.get("/Optimizacion2")
-def correr_optimizacion2():
-    result = optimizacion_2.ejecutarOptimizacion(conn.driver)
-    return result
+def correr_optimizacion2(geometria: FormatoGeometria = FORMATO_COMPLETO, tolerancia_m: float = Query(0.0, ge=0),
+                         backend: BackendGrafoNombre | None = None, opciones: dict = Depends(opciones_solver)):
+    try:
+        return ORJSONResponse(ejecutar_optimizacion_2(trabajos.ejecutar_cpu, geometria, tolerancia_m, backend, opciones))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/calcularRutaFlota")
+def calcular_ruta_flota(geometria: FormatoGeometria = FORMATO_COMPLETO, tolerancia_m: float = Query(0.0, ge=0),
+                        deposito_id: str | None = None, backend: BackendGrafoNombre | None = None,
+                        opciones: dict = Depends(opciones_solver), objetivo: Objetivo = "distancia"):
+    """Un recorrido por vehiculo disponible respetando capacity_kg y la demanda de los Shipment pendientes"""
+    try:
+        return ORJSONResponse(ejecutar_optimizacion_flota(trabajos.ejecutar_cpu, geometria, tolerancia_m, deposito_id,
+                                                          backend, opciones, objetivo))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/trabajos/calcularRuta", status_code=status.HTTP_202_ACCEPTED)
+def encolar_calcular_ruta(geometria: FormatoGeometria = FORMATO_COMPLETO, tolerancia_m: float = Query(0.0, ge=0),
+                          islas: int | None = Query(None, ge=1, le=32), backend: BackendGrafoNombre | None = None,
+                          opciones: dict = Depends(opciones_solver), objetivo: Objetivo = "distancia"):
+    """Encola la optimizacion 1 y devuelve el id del trabajo para consultarlo en /trabajos/{id}"""
+    return {"trabajo_id": trabajos.enviar("calcularRuta", ejecutar_optimizacion_1, geometria=geometria,
+                                          tolerancia_m=tolerancia_m, islas=islas, backend=backend, opciones=opciones,
+                                          objetivo=objetivo)}
+
+@app.post("/trabajos/Optimizacion2", status_code=status.HTTP_202_ACCEPTED)
+def encolar_optimizacion2(geometria: FormatoGeometria = FORMATO_COMPLETO, tolerancia_m: float = Query(0.0, ge=0),
+                          backend: BackendGrafoNombre | None = None, opciones: dict = Depends(opciones_solver)):
+    """El avance de Yen (pares resueltos) se ve en el campo "progreso" de /trabajos/{id}"""
+    return {"trabajo_id": trabajos.enviar("Optimizacion2", ejecutar_optimizacion_2, con_progreso=True, geometria=geometria,
+                                          tolerancia_m=tolerancia_m, backend=backend, opciones=opciones)}
+
+@app.post("/trabajos/calcularRutaFlota", status_code=status.HTTP_202_ACCEPTED)
+def encolar_ruta_flota(geometria: FormatoGeometria = FORMATO_COMPLETO, tolerancia_m: float = Query(0.0, ge=0),
+                       deposito_id: str | None = None, backend: BackendGrafoNombre | None = None,
+                       opciones: dict = Depends(opciones_solver), objetivo: Objetivo = "distancia"):
+    return {"trabajo_id": trabajos.enviar("calcularRutaFlota", ejecutar_optimizacion_flota, geometria=geometria,
+                                          tolerancia_m=tolerancia_m, deposito_id=deposito_id, backend=backend,
+                                          opciones=opciones, objetivo=objetivo)}
+
+@app.get("/trabajos/{trabajo_id}")
+def consultar_trabajo(trabajo_id: str):
+    trabajo = trabajos.obtener(trabajo_id)
+    if trabajo is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return ORJSONResponse(trabajo)
 
 @app.get("/redis-test")
 def test_redis():
+    redis_client = recursos.get_redis()
+    if redis_client is None:
+        return {"redis_status": "error", "message": "Redis no disponible"}
     try:
         # Guardar un valor
         redis_client.set("test_key", "¡Redis funciona!")
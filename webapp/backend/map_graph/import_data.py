@@ -1,43 +1,186 @@
 import csv
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
 from services.neo4j_connection import Neo4jConnection
 
-def importar_csv(conn: Neo4jConnection, nodes_path: str, edges_path: str):
-    
-    with open(nodes_path, newline='', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            query = """
-            MERGE (p:Point {id: $id})
-            SET p.lat = toFloat($lat),
-                p.lon = toFloat($lon),
-                p.tipo = $tipo
-            """
-            conn.query(query, {
-                'id': row['node_id:ID'],
-                'lat': float(row['lat:float']),
-                'lon': float(row['lon:float']),
-                'tipo': row['tipo:string']
-            })
-
-    with open(edges_path, newline='', encoding='utf-8') as csvfile:
+"""
+Importacion de nodes.csv / edges.csv (formato de graph_to_csv) a Neo4j.
+
+Los CSV se leen en lotes de `tamano_lote` filas y cada lote se escribe con UNWIND $rows dentro de una
+sola transaccion (en lugar de una transaccion por fila). Los lotes pueden enviarse en paralelo con `hilos`;
+session.execute_write reintenta si dos lotes chocan por locks.
+Si los archivos ya estan en el directorio import de Neo4j se puede usar LOAD CSV (`directorio_import`).
+Ademas de lat/lon cada Point guarda `location` (point WGS-84) con un indice espacial, para que las
+consultas de proximidad filtren por indice en lugar de construir point() por cada nodo. El indice se crea y
+`location` se completa en los Point que no la tengan (Locales de antes de que existiera) al importar un mapa,
+no al arrancar la API: asi el arranque no depende de que Neo4j ya este levantado. En bases que no se
+volvieron a importar lo hace services.point_service la primera vez que se consulta o inserta un punto.
+"""
+
+TAMANO_LOTE = 5000
+
+CONSTRAINT_POINT_ID = """
+CREATE CONSTRAINT point_id IF NOT EXISTS
+FOR (p:Point) REQUIRE p.id IS UNIQUE
+"""
+
+INDICE_POINT_LOCATION = """
+CREATE POINT INDEX point_location IF NOT EXISTS
+FOR (p:Point) ON (p.location)
+"""
+
+# Para Points escritos antes de que existiera `location`
+CY_COMPLETAR_LOCATION = """
+MATCH (p:Point)
+WHERE p.location IS NULL AND p.lat IS NOT NULL AND p.lon IS NOT NULL
+SET p.location = point({latitude: p.lat, longitude: p.lon})
+RETURN count(p) AS completados
+"""
+
+CY_NODOS_LOTE = """
+UNWIND $rows AS row
+MERGE (p:Point {id: row.id})
+SET p.lat = row.lat,
+    p.lon = row.lon,
+    p.location = point({latitude: row.lat, longitude: row.lon}),
+    p.tipo = row.tipo
+"""
+
+CY_ARISTAS_LOTE = """
+UNWIND $rows AS row
+MATCH (a:Point {id: row.start_id}), (b:Point {id: row.end_id})
+CREATE (a)-[:STREET {
+    name: row.name,
+    length: row.length,
+    maxspeed: row.maxspeed,
+    weight: row.weight
+}]->(b)
+"""
+
+CY_NODOS_LOAD_CSV = """
+LOAD CSV WITH HEADERS FROM $url AS row
+CALL {
+    WITH row
+    MERGE (p:Point {id: row['node_id:ID']})
+    SET p.lat = toFloat(row['lat:float']),
+        p.lon = toFloat(row['lon:float']),
+        p.location = point({latitude: toFloat(row['lat:float']), longitude: toFloat(row['lon:float'])}),
+        p.tipo = row['tipo:string']
+} IN TRANSACTIONS OF $lote ROWS
+RETURN count(row) AS filas
+"""
+
+CY_ARISTAS_LOAD_CSV = """
+LOAD CSV WITH HEADERS FROM $url AS row
+CALL {
+    WITH row
+    MATCH (a:Point {id: row[':START_ID']}), (b:Point {id: row[':END_ID']})
+    CREATE (a)-[:STREET {
+        name: row['name:string'],
+        length: toFloat(row['length:float']),
+        maxspeed: toInteger(row['maxspeed:int']),
+        weight: toFloat(row['weight:float'])
+    }]->(b)
+} IN TRANSACTIONS OF $lote ROWS
+RETURN count(row) AS filas
+"""
+
+
+def _fila_nodo(row):
+    return {
+        'id': row['node_id:ID'],
+        'lat': float(row['lat:float']),
+        'lon': float(row['lon:float']),
+        'tipo': row['tipo:string']
+    }
+
+
+def _fila_arista(row):
+    return {
+        'start_id': row[':START_ID'],
+        'end_id': row[':END_ID'],
+        'name': row['name:string'],
+        'length': float(row['length:float']),
+        'maxspeed': int(row['maxspeed:int']),
+        'weight': float(row['weight:float'])
+    }
+
+
+def leer_lotes(path, convertir, tamano_lote=TAMANO_LOTE):
+    """Genera listas de a lo sumo `tamano_lote` filas ya convertidas, sin cargar todo el archivo"""
+    with open(path, newline='', encoding='utf-8') as csvfile:
         reader = csv.DictReader(csvfile)
-        for row in reader:
-            query = """
-            MATCH (a:Point {id: $start_id}), (b:Point {id: $end_id})
-            CREATE (a)-[:STREET {
-                name: $name,
-                length: toFloat($length),
-                maxspeed: toInteger($maxspeed),
-                weight: toFloat($weight)
-            }]->(b)
-            """
-            conn.query(query, {
-                'start_id': row[':START_ID'],
-                'end_id': row[':END_ID'],
-                'name': row['name:string'],
-                'length': float(row['length:float']),
-                'maxspeed': int(row['maxspeed:int']),
-                'weight': float(row['weight:float'])
-            })  
-
-    return {"status": "ok", "mensaje": "Datos importados manualmente desde CSV"}
\ No newline at end of file
+        while True:
+            lote = [convertir(row) for row in islice(reader, tamano_lote)]
+            if not lote:
+                break
+            yield lote
+
+
+def _escribir_lote(driver, query, lote):
+    with driver.session() as session:
+        session.execute_write(lambda tx: tx.run(query, rows=lote).consume())
+    return len(lote)
+
+
+def _importar_lotes(driver, query, lotes, hilos):
+    if hilos <= 1:
+        return sum(_escribir_lote(driver, query, lote) for lote in lotes)
+
+    # Como mucho 2 lotes pendientes por hilo, asi no se carga todo el CSV en memoria
+    filas = 0
+    pendientes = set()
+    with ThreadPoolExecutor(max_workers=hilos) as executor:
+        for lote in lotes:
+            if len(pendientes) >= hilos * 2:
+                terminados, pendientes = wait(pendientes, return_when=FIRST_COMPLETED)
+                filas += sum(f.result() for f in terminados)
+            pendientes.add(executor.submit(_escribir_lote, driver, query, lote))
+        filas += sum(f.result() for f in pendientes)
+    return filas
+
+
+def asegurar_indice_espacial(conn: Neo4jConnection):
+    """Crea el indice de `location` y completa la propiedad en los Point que no la tengan"""
+    conn.query(INDICE_POINT_LOCATION)
+    return conn.query(CY_COMPLETAR_LOCATION)[0]["completados"]
+
+
+def _estadisticas(filas, inicio):
+    segundos = time.perf_counter() - inicio
+    return {"filas": filas, "segundos": round(segundos, 3), "filas_por_segundo": round(filas / segundos, 1) if segundos > 0 else None}
+
+
+def importar_csv(conn: Neo4jConnection, nodes_path: str, edges_path: str,
+                 tamano_lote: int = TAMANO_LOTE, hilos: int = 1, directorio_import: str | None = None):
+    driver = conn.driver
+    conn.query(CONSTRAINT_POINT_ID)
+
+    archivos_en_import = directorio_import is not None and all(
+        os.path.exists(os.path.join(directorio_import, os.path.basename(p))) for p in (nodes_path, edges_path)
+    )
+
+    if archivos_en_import:
+        # Camino rapido: el servidor lee los archivos directamente
+        estadisticas = {}
+        for nombre, query, path in (("nodos", CY_NODOS_LOAD_CSV, nodes_path), ("aristas", CY_ARISTAS_LOAD_CSV, edges_path)):
+            inicio = time.perf_counter()
+            with driver.session() as session:
+                filas = session.run(query, url=f"file:///{os.path.basename(path)}", lote=tamano_lote).single()["filas"]
+            estadisticas[nombre] = _estadisticas(filas, inicio)
+        modo = "LOAD CSV"
+    else:
+        inicio = time.perf_counter()
+        filas = _importar_lotes(driver, CY_NODOS_LOTE, leer_lotes(nodes_path, _fila_nodo, tamano_lote), hilos)
+        estadisticas = {"nodos": _estadisticas(filas, inicio)}
+
+        inicio = time.perf_counter()
+        filas = _importar_lotes(driver, CY_ARISTAS_LOTE, leer_lotes(edges_path, _fila_arista, tamano_lote), hilos)
+        estadisticas["aristas"] = _estadisticas(filas, inicio)
+        modo = "UNWIND por lotes"
+
+    # Indice de location y location en los Points que ya estaban en la base
+    estadisticas["location_completados"] = asegurar_indice_espacial(conn)
+    return {"status": "ok", "mensaje": f"Datos importados desde CSV ({modo})", "estadisticas": estadisticas}
@@ -35,6 +35,12 @@ class InsercionRequest(BaseModel):
     calle: str
     local: PuntoEstablecimiento
 
+class InsercionMasivaRequest(BaseModel):
+    locales: list[PuntoEstablecimiento]
+
+class BorradoMasivoRequest(BaseModel):
+    ids: list[str]
+
 class LoginRequest(BaseModel):
     username: str
     password: str
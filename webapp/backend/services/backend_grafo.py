@@ -0,0 +1,122 @@
+import time
+from abc import ABC, abstractmethod
+from algorithms.optimizacion_1 import (
+    compute_cost_matrices_dijkstra, obtener_geometria_tramos, PROYECCION_DEFECTO,
+)
+from algorithms.optimizacion_2 import HILOS_YENS, obtener_caminos_yens_paralelo
+from services.grafo_memoria import CRITERIOS
+from services.queries import obtener_puntos
+
+"""
+Backends de grafo para los algoritmos de ruteo.
+
+Los algoritmos no hablan con Neo4j directamente: reciben un backend con estas operaciones
+- puntos(): puntos de interes [{id, nombre, lat, lon, tipo}]
+- matrices_costos(origenes, destinos): una matriz por criterio de `criterios` (length y weight), apiladas;
+  cada una es el costo del camino minimo por ese criterio (mismo resultado en los dos backends, que comparten
+  services.cache_matriz)
+- k_caminos(ids, k, ejecutar_cpu, progreso): ({(origen, destino): [(index, costo, camino)]}, tiempo) para todos los pares
+  ordenados de `ids`; tiempo es {pares, segundos, ...} y termina en las estadisticas del solver;
+  progreso(hechos, total) informa los pares resueltos (por lote en Neo4j, al final en memoria)
+- geometria(pares): {(origen, destino): [{id, lon, lat}]} del camino minimo de cada par
+
+BackendNeo4j usa GDS sobre una proyeccion; BackendMemoria resuelve todo dentro del proceso con un GrafoCSR
+(services.grafo_memoria), sin ida y vuelta a la base. Cual se usa se elige por request o con GRAPH_BACKEND.
+Yen en memoria es Python puro sobre n·(n-1) pares: corre en el pool de procesos (`ejecutar_cpu`) para no tomar
+el GIL del proceso de la API, y se rechaza por encima de `max_puntos_k_caminos` puntos.
+"""
+
+BACKEND_NEO4J = "neo4j"
+BACKEND_MEMORIA = "memoria"
+# Objetivo del solver (parametro de la API) -> criterio / propiedad de STREET
+OBJETIVOS = {"distancia": "length", "tiempo": "weight"}
+# Tope de puntos para Yen en memoria (MEMORY_KPATHS_MAX_POINTS): 30 puntos son ~4 s de CPU con el grafo de ejemplo
+MAX_PUNTOS_K_CAMINOS = 40
+
+
+def _ejecutar_local(funcion, *args):
+    return funcion(*args)
+
+
+def k_caminos_memoria(grafo, ids, k):
+    """Yen sobre un GrafoCSR para todos los pares ordenados de `ids`; de modulo para poder correr en otro proceso"""
+    caminos = {}
+    for a in ids:
+        for b in ids:
+            if a != b:
+                caminos[(a, b)] = [
+                    (index, costo, grafo.geometria(camino))
+                    for index, (costo, camino) in enumerate(grafo.k_caminos(grafo.idx[a], grafo.idx[b], k))
+                ]
+    return caminos
+
+
+class BackendGrafo(ABC):
+    nombre = None
+    criterios = CRITERIOS
+
+    @abstractmethod
+    def puntos(self):
+        ...
+
+    @abstractmethod
+    def matrices_costos(self, origenes, destinos=None):
+        ...
+
+    @abstractmethod
+    def k_caminos(self, ids, k=3, ejecutar_cpu=_ejecutar_local, progreso=None):
+        ...
+
+    @abstractmethod
+    def geometria(self, pares):
+        ...
+
+
+class BackendNeo4j(BackendGrafo):
+    nombre = BACKEND_NEO4J
+
+    def __init__(self, driver, proyeccion=PROYECCION_DEFECTO, hilos=HILOS_YENS):
+        self.driver = driver
+        self.proyeccion = proyeccion
+        self.hilos = hilos
+
+    def puntos(self):
+        return obtener_puntos(self.driver)
+
+    def matrices_costos(self, origenes, destinos=None):
+        return compute_cost_matrices_dijkstra(self.driver, origenes, targets=destinos, proyeccion=self.proyeccion,
+                                              criterios=self.criterios)
+
+    def k_caminos(self, ids, k=3, ejecutar_cpu=_ejecutar_local, progreso=None):
+        # Consultas a GDS: es I/O, se queda en los hilos de este proceso
+        return obtener_caminos_yens_paralelo(self.driver, ids, k, self.proyeccion, hilos=self.hilos, progreso=progreso)
+
+    def geometria(self, pares):
+        return obtener_geometria_tramos(self.driver, pares, proyeccion=self.proyeccion)
+
+
+class BackendMemoria(BackendGrafo):
+    nombre = BACKEND_MEMORIA
+
+    def __init__(self, grafo, max_puntos_k_caminos=MAX_PUNTOS_K_CAMINOS):
+        self.grafo = grafo
+        self.max_puntos_k_caminos = max_puntos_k_caminos
+
+    def puntos(self):
+        return self.grafo.puntos()
+
+    def matrices_costos(self, origenes, destinos=None):
+        return self.grafo.matrices_costos(origenes, destinos, criterios=self.criterios)
+
+    def k_caminos(self, ids, k=3, ejecutar_cpu=_ejecutar_local, progreso=None):
+        if len(ids) > self.max_puntos_k_caminos:
+            raise ValueError(f"Yen en memoria admite hasta {self.max_puntos_k_caminos} puntos ({len(ids)} pedidos); "
+                             f"usar backend=neo4j")
+        inicio = time.perf_counter()
+        caminos = ejecutar_cpu(k_caminos_memoria, self.grafo, list(ids), k)
+        if progreso is not None:
+            progreso(len(caminos), len(caminos))
+        return caminos, {"pares": len(caminos), "segundos": round(time.perf_counter() - inicio, 3)}
+
+    def geometria(self, pares):
+        return self.grafo.caminos(pares)
@@ -0,0 +1,172 @@
+import glob
+import io
+import json
+import os
+import threading
+import numpy as np
+import redis
+
+"""
+Cache de la matriz de distancias entre POIs (Locales y Centros de distribucion).
+
+La entrada guardada se identifica por la version del mapa (VersionGrafo) y guarda junto a la matriz
+la lista de ids con la que fue calculada. Cuando se pide la matriz para otro conjunto de ids:
+- los ids que ya estaban se reutilizan (se reindexa la matriz guardada)
+- los que faltan se calculan solo como filas (nuevo -> todos) y columnas (viejos -> nuevo)
+- los que ya no estan se descartan
+
+Esto es correcto porque insertar_nuevo_punto parte la arista proporcionalmente (la suma de los
+nuevos tramos es el length original) y delete_map_point vuelve a unirlos, asi las distancias
+entre los demas puntos no cambian.
+
+Tambien puede guardar varias matrices apiladas (criterio, n, n), como las de distancia y tiempo que se
+calculan juntas (obtener_criterios): la reutilizacion por ids aplica igual a todas.
+
+Se guarda en Redis (cliente con decode_responses=False) y, si no esta disponible, en disco. Como en
+VersionGrafo, `redis_client` puede ser una funcion que devuelve el cliente (recursos.get_redis_binario).
+"""
+
+DIRECTORIO_DEFECTO = ".cache_matrices"
+CLAVE_CRITERIOS = "criterios"
+# Entradas que se invalidan al cambiar un punto: hoy solo las matrices apiladas de obtener_criterios
+CLAVES = (CLAVE_CRITERIOS,)
+
+
+class CacheMatriz:
+    def __init__(self, version_grafo, redis_client=None, directorio=DIRECTORIO_DEFECTO):
+        self.version_grafo = version_grafo
+        self._redis = redis_client
+        self.directorio = directorio
+        self._lock = threading.Lock()
+
+    @property
+    def redis_client(self):
+        return self._redis() if callable(self._redis) else self._redis
+
+    def _clave(self, peso):
+        return f"matriz:{peso}:{self.version_grafo.actual()}"
+
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, clave.replace(":", "_") + ".npz")
+
+    @staticmethod
+    def _serializar(ids, dist):
+        buffer = io.BytesIO()
+        np.savez(buffer, dist=dist, ids=np.array(json.dumps(ids)))
+        return buffer.getvalue()
+
+    @staticmethod
+    def _deserializar(datos):
+        with np.load(io.BytesIO(datos)) as npz:
+            return json.loads(str(npz["ids"])), npz["dist"]
+
+    def _leer(self, clave):
+        redis_client = self.redis_client
+        if redis_client:
+            try:
+                datos = redis_client.get(clave)
+                return self._deserializar(datos) if datos else None
+            except redis.RedisError:
+                pass
+        ruta = self._ruta(clave)
+        if not os.path.exists(ruta):
+            return None
+        with open(ruta, "rb") as f:
+            return self._deserializar(f.read())
+
+    def _escribir(self, clave, ids, dist):
+        datos = self._serializar(ids, dist)
+        redis_client = self.redis_client
+        if redis_client:
+            try:
+                # Las entradas de versiones anteriores ya no sirven
+                prefijo = clave.rsplit(":", 1)[0]
+                for vieja in redis_client.scan_iter(match=f"{prefijo}:*"):
+                    if vieja.decode() != clave:
+                        redis_client.delete(vieja)
+                redis_client.set(clave, datos)
+                return
+            except redis.RedisError:
+                pass
+        os.makedirs(self.directorio, exist_ok=True)
+        ruta = self._ruta(clave)
+        for vieja in glob.glob(os.path.join(self.directorio, clave.rsplit(":", 1)[0].replace(":", "_") + "_*.npz")):
+            if vieja != ruta:
+                os.remove(vieja)
+        temporal = ruta + ".tmp"
+        with open(temporal, "wb") as f:
+            f.write(datos)
+        os.replace(temporal, ruta)
+
+    def _borrar(self, clave):
+        redis_client = self.redis_client
+        if redis_client:
+            try:
+                redis_client.delete(clave)
+            except redis.RedisError:
+                pass
+        ruta = self._ruta(clave)
+        if os.path.exists(ruta):
+            os.remove(ruta)
+
+    def obtener(self, poi_ids, calcular, peso="length"):
+        """
+        Devuelve la matriz para `poi_ids` (en ese orden).
+        calcular(origenes, destinos) debe devolver la matriz len(origenes) x len(destinos), o un array
+        (..., len(origenes), len(destinos)) con varias matrices apiladas.
+        """
+        poi_ids = list(poi_ids)
+        with self._lock:
+            clave = self._clave(peso)
+            previo = self._leer(clave)
+            if previo is None:
+                dist = calcular(poi_ids, poi_ids)
+                self._escribir(clave, poi_ids, dist)
+                return dist
+
+            ids_previos, dist_previa = previo
+            if ids_previos == poi_ids:
+                return dist_previa
+
+            idx_previo = {nid: i for i, nid in enumerate(ids_previos)}
+            posicion = {nid: i for i, nid in enumerate(poi_ids)}
+            conservados = [nid for nid in poi_ids if nid in idx_previo]
+            nuevos = [nid for nid in poi_ids if nid not in idx_previo]
+
+            n = len(poi_ids)
+            dist = np.full(dist_previa.shape[:-2] + (n, n), np.inf)
+            i_cons = [posicion[nid] for nid in conservados]
+            i_prev = [idx_previo[nid] for nid in conservados]
+            # Indices sobre las dos ultimas dimensiones: sirve para una matriz o para varias apiladas
+            dist[(...,) + np.ix_(i_cons, i_cons)] = dist_previa[(...,) + np.ix_(i_prev, i_prev)]
+            if nuevos:
+                i_nuevos = [posicion[nid] for nid in nuevos]
+                dist[..., i_nuevos, :] = calcular(nuevos, poi_ids)
+                if conservados:
+                    dist[(...,) + np.ix_(i_cons, i_nuevos)] = calcular(conservados, nuevos)
+
+            self._escribir(clave, poi_ids, dist)
+            return dist
+
+    def obtener_criterios(self, poi_ids, calcular):
+        """Matrices apiladas (criterio, n, n) de calcular(origenes, destinos), guardadas en una sola entrada"""
+        return self.obtener(poi_ids, calcular, peso=CLAVE_CRITERIOS)
+
+    def invalidar_punto(self, punto_id):
+        """Quita la fila y columna de un punto (insertado, movido o borrado) de todas las matrices guardadas"""
+        with self._lock:
+            for peso in CLAVES:
+                clave = self._clave(peso)
+                previo = self._leer(clave)
+                if previo is None:
+                    continue
+                ids, dist = previo
+                if punto_id not in ids:
+                    continue
+                quedan = [i for i, nid in enumerate(ids) if nid != punto_id]
+                self._escribir(clave, [ids[i] for i in quedan], dist[(...,) + np.ix_(quedan, quedan)])
+
+    def invalidar(self):
+        with self._lock:
+            for peso in CLAVES:
+                self._borrar(self._clave(peso))
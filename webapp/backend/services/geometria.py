@@ -0,0 +1,129 @@
+import math
+import numpy as np
+
+"""
+Salida compacta de la geometria de las rutas.
+
+Las rutas se devuelven como {"origen-destino": [{id, lat, lon}, ...]}. En modo compacto todos los tramos
+comparten un solo arreglo de coordenadas (el punto de union entre un tramo y el siguiente no se repite)
+y cada tramo indica su rango [inicio, fin] dentro de ese arreglo. Las coordenadas van como polyline
+codificada (algoritmo de Google, precision 5 por defecto) o como enteros delta
+[lat0, lon0, dlat1, dlon1, ...] escalados por 10^precision. Opcionalmente cada tramo se simplifica
+con Douglas-Peucker conservando sus extremos.
+"""
+
+FORMATO_COMPLETO = "completa"
+FORMATO_POLYLINE = "polyline"
+FORMATO_DELTA = "delta"
+FORMATOS = (FORMATO_COMPLETO, FORMATO_POLYLINE, FORMATO_DELTA)
+
+PRECISION = 5
+RADIO_TIERRA_M = 6371008.8
+
+
+def douglas_peucker(lat, lon, tolerancia_m):
+    """Mascara de los puntos que se conservan; siempre incluye el primero y el ultimo"""
+    n = len(lat)
+    conservar = np.zeros(n, dtype=bool)
+    if n == 0:
+        return conservar
+    conservar[0] = conservar[-1] = True
+    if n < 3 or tolerancia_m <= 0:
+        conservar[:] = True
+        return conservar
+
+    # Metros en una equirectangular local: suficiente para distancias de tolerancia
+    ky = RADIO_TIERRA_M * math.pi / 180
+    kx = ky * math.cos(math.radians(float(np.mean(lat))))
+    x = (np.asarray(lon) - lon[0]) * kx
+    y = (np.asarray(lat) - lat[0]) * ky
+
+    pila = [(0, n - 1)]
+    while pila:
+        i, j = pila.pop()
+        if j - i < 2:
+            continue
+        dx, dy = x[j] - x[i], y[j] - y[i]
+        px, py = x[i + 1:j] - x[i], y[i + 1:j] - y[i]
+        largo = math.hypot(dx, dy)
+        if largo == 0:
+            d = np.hypot(px, py)
+        else:
+            d = np.abs(px * dy - py * dx) / largo
+        k = int(np.argmax(d))
+        if d[k] > tolerancia_m:
+            m = i + 1 + k
+            conservar[m] = True
+            pila.append((i, m))
+            pila.append((m, j))
+    return conservar
+
+
+def codificar_polyline(enteros):
+    """Codifica un arreglo (n, 2) de enteros lat/lon ya escalados como polyline"""
+    deltas = np.diff(enteros, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    # Zigzag: el signo va en el bit menos significativo
+    valores = np.where(deltas < 0, ~(deltas << 1), deltas << 1).tolist()
+    salida = []
+    for valor in valores:
+        while valor >= 0x20:
+            salida.append(chr((0x20 | (valor & 0x1f)) + 63))
+            valor >>= 5
+        salida.append(chr(valor + 63))
+    return "".join(salida)
+
+
+def decodificar_polyline(texto, precision=PRECISION):
+    """Inversa de codificar_polyline, devuelve [(lat, lon)]"""
+    valores, valor, desplazamiento = [], 0, 0
+    for caracter in texto:
+        b = ord(caracter) - 63
+        valor |= (b & 0x1f) << desplazamiento
+        desplazamiento += 5
+        if b < 0x20:
+            valores.append(~(valor >> 1) if valor & 1 else valor >> 1)
+            valor, desplazamiento = 0, 0
+    coordenadas = np.cumsum(np.array(valores, dtype=np.int64).reshape(-1, 2), axis=0) / 10 ** precision
+    return [tuple(c) for c in coordenadas.tolist()]
+
+
+def compactar_rutas(rutas, formato=FORMATO_POLYLINE, tolerancia_m=0.0, precision=PRECISION):
+    """
+    rutas: {"origen-destino": [{id, lat, lon}, ...]} en el orden del recorrido.
+    Devuelve {"formato", "precision", "coordenadas", "tramos": [{"id", "inicio", "fin"}], "puntos"};
+    los indices de `tramos` son posiciones en el arreglo de coordenadas (fin inclusivo).
+    """
+    if formato not in (FORMATO_POLYLINE, FORMATO_DELTA):
+        raise ValueError(f"Formato de geometria desconocido: {formato}")
+
+    escala = 10 ** precision
+    bloques, tramos = [], []
+    total = 0
+    ultimo = None
+    for tramo_id, nodos in rutas.items():
+        if not nodos:
+            tramos.append({"id": tramo_id, "inicio": None, "fin": None})
+            continue
+        lat = np.fromiter((nodo["lat"] for nodo in nodos), dtype=np.float64, count=len(nodos))
+        lon = np.fromiter((nodo["lon"] for nodo in nodos), dtype=np.float64, count=len(nodos))
+        conservar = douglas_peucker(lat, lon, tolerancia_m)
+        enteros = np.rint(np.column_stack((lat[conservar], lon[conservar])) * escala).astype(np.int64)
+
+        # Si el tramo empieza donde termino el anterior, ese punto ya esta en el arreglo
+        if ultimo is not None and (enteros[0] == ultimo).all():
+            inicio = total - 1
+            enteros = enteros[1:]
+        else:
+            inicio = total
+        if len(enteros):
+            bloques.append(enteros)
+            total += len(enteros)
+            ultimo = enteros[-1]
+        tramos.append({"id": tramo_id, "inicio": inicio, "fin": total - 1})
+
+    todos = np.concatenate(bloques) if bloques else np.zeros((0, 2), dtype=np.int64)
+    if formato == FORMATO_POLYLINE:
+        coordenadas = codificar_polyline(todos)
+    else:
+        coordenadas = np.diff(todos, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel().tolist()
+    return {"formato": formato, "precision": precision, "coordenadas": coordenadas, "tramos": tramos, "puntos": total}
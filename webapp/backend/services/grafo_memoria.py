@@ -0,0 +1,483 @@
+import csv
+import heapq
+import math
+import threading
+import numpy as np
+import orjson
+import redis
+
+"""
+Representacion en memoria (CSR) del grafo de calles (:Point)-[:STREET]->(:Point).
+Permite correr Dijkstra / A* dentro del proceso del backend, sin ir a GDS por cada consulta.
+
+- offsets[i]:offsets[i+1] es el rango de aristas salientes del nodo i dentro de targets/length/weight
+- ids[i] es el id del Point en Neo4j y idx[id] su indice
+- tipos[i] / etiquetas[i]: tipo y nombre del Point, para listar los puntos de interes sin ir a Neo4j
+"""
+
+RADIO_TIERRA_M = 6371008.8
+
+CY_NODOS = """
+MATCH (p:Point)
+RETURN p.id AS id, p.lat AS lat, p.lon AS lon, p.tipo AS tipo, p.name AS nombre
+"""
+
+TIPOS_PUNTO_INTERES = ("Local", "CentroDeDistribucion")
+# Pesos de STREET: length en metros, weight = length / maxspeed (proporcional al tiempo de viaje)
+CRITERIOS = ("length", "weight")
+
+# Cambios de un punto guardados por version (GrafoEnMemoria.registrar_cambio); con mas versiones pendientes
+# que MAX_CAMBIOS_PENDIENTES es mas barato recargar todo
+PREFIJO_CAMBIO = "grafo:cambio"
+TTL_CAMBIOS_S = 3600
+MAX_CAMBIOS_PENDIENTES = 50
+
+CY_ARISTAS = """
+MATCH (a:Point)-[r:STREET]->(b:Point)
+RETURN a.id AS origen, b.id AS destino, r.length AS length, r.weight AS weight, r.name AS nombre
+"""
+
+
+def leer_csv(nodes_path, edges_path):
+    """(nodos, aristas) en el formato de desde_listas a partir de los CSV de map_graph.graph_to_csv"""
+    with open(nodes_path, newline="", encoding="utf-8") as f:
+        nodos = [(r["node_id:ID"], float(r["lat:float"]), float(r["lon:float"]), r.get("tipo:string"))
+                 for r in csv.DictReader(f)]
+    with open(edges_path, newline="", encoding="utf-8") as f:
+        aristas = [(r[":START_ID"], r[":END_ID"], float(r["length:float"]), float(r["weight:float"]), r["name:string"])
+                   for r in csv.DictReader(f)]
+    return nodos, aristas
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Distancia en metros; acepta escalares o arrays de numpy (en grados)"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RADIO_TIERRA_M * np.arcsin(np.sqrt(a))
+
+
+class GrafoCSR:
+    def __init__(self, ids, lat, lon, offsets, targets, length, weight, nombres=None, tipos=None, etiquetas=None):
+        self.ids = list(ids)
+        self.idx = {nid: i for i, nid in enumerate(self.ids)}
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.offsets = np.asarray(offsets, dtype=np.int32)
+        self.targets = np.asarray(targets, dtype=np.int32)
+        self.pesos = {
+            "length": np.asarray(length, dtype=np.float32),
+            "weight": np.asarray(weight, dtype=np.float32),
+        }
+        self.n = len(self.ids)
+        self.m = len(self.targets)
+        # Nombre de la calle de cada arista (mismo orden que targets), solo para respuestas
+        self.nombres = list(nombres) if nombres is not None else [None] * self.m
+        self.tipos = list(tipos) if tipos is not None else [None] * self.n
+        self.etiquetas = list(etiquetas) if etiquetas is not None else [None] * self.n
+        self._indice_segmentos = None
+        # Vistas como listas de Python: indexar listas en el bucle de Dijkstra es mucho mas rapido que numpy escalar
+        self._offsets_l = self.offsets.tolist()
+        self._targets_l = self.targets.tolist()
+        self._pesos_l = {nombre: arr.tolist() for nombre, arr in self.pesos.items()}
+
+    def __getstate__(self):
+        # Para mandarlo a otro proceso (services.trabajos): sin el indice espacial ni las vistas como listas,
+        # que se reconstruyen del otro lado
+        estado = dict(self.__dict__)
+        for clave in ("_indice_segmentos", "_offsets_l", "_targets_l", "_pesos_l"):
+            estado.pop(clave)
+        return estado
+
+    def __setstate__(self, estado):
+        self.__dict__.update(estado)
+        self._indice_segmentos = None
+        self._offsets_l = self.offsets.tolist()
+        self._targets_l = self.targets.tolist()
+        self._pesos_l = {nombre: arr.tolist() for nombre, arr in self.pesos.items()}
+
+    @classmethod
+    def desde_listas(cls, nodos, aristas):
+        """
+        nodos: iterable de (id, lat, lon[, tipo[, nombre]])
+        aristas: iterable de (origen_id, destino_id, length, weight[, nombre]); las aristas a nodos desconocidos se ignoran
+        """
+        nodos = list(nodos)
+        ids = [n[0] for n in nodos]
+        idx = {nid: i for i, nid in enumerate(ids)}
+        lat = np.array([n[1] for n in nodos], dtype=np.float64)
+        lon = np.array([n[2] for n in nodos], dtype=np.float64)
+        tipos = [n[3] if len(n) > 3 else None for n in nodos]
+        etiquetas = [n[4] if len(n) > 4 else None for n in nodos]
+
+        origen, destino, length, weight, nombres = [], [], [], [], []
+        for arista in aristas:
+            a, b, l, w = arista[:4]
+            if a in idx and b in idx:
+                origen.append(idx[a])
+                destino.append(idx[b])
+                length.append(l)
+                weight.append(w if w is not None else l)
+                nombres.append(arista[4] if len(arista) > 4 else None)
+        origen = np.array(origen, dtype=np.int32)
+        destino = np.array(destino, dtype=np.int32)
+        length = np.array(length, dtype=np.float32)
+        weight = np.array(weight, dtype=np.float32)
+
+        orden = np.argsort(origen, kind="stable")
+        offsets = np.zeros(len(ids) + 1, dtype=np.int32)
+        np.cumsum(np.bincount(origen, minlength=len(ids)), out=offsets[1:])
+        return cls(ids, lat, lon, offsets, destino[orden], length[orden], weight[orden], [nombres[e] for e in orden],
+                   tipos, etiquetas)
+
+    @classmethod
+    def desde_neo4j(cls, driver):
+        with driver.session() as session:
+            nodos = [(r["id"], r["lat"], r["lon"], r["tipo"], r["nombre"]) for r in session.run(CY_NODOS)]
+            aristas = [(r["origen"], r["destino"], r["length"], r["weight"], r["nombre"]) for r in session.run(CY_ARISTAS)]
+        return cls.desde_listas(nodos, aristas)
+
+    @classmethod
+    def desde_csv(cls, nodes_path, edges_path):
+        """Grafo a partir de nodes.csv / edges.csv, sin Neo4j (benchmarks, pruebas offline)"""
+        return cls.desde_listas(*leer_csv(nodes_path, edges_path))
+
+    def con_cambios(self, cambio):
+        """
+        Nuevo GrafoCSR con un cambio chico aplicado (alta/baja de un punto), sin volver a leer Neo4j:
+        {"nodos_nuevos": [(id, lat, lon, tipo, nombre)], "nodos_borrados": [id],
+         "aristas_borradas": [(origen_id, destino_id)], "aristas_nuevas": [(origen_id, destino_id, length, weight, nombre)]}
+        Las aristas de los nodos borrados se quitan solas. Si el indice espacial ya estaba construido se
+        actualiza en lugar de reconstruirse. Lanza KeyError/ValueError si el cambio no encaja en este grafo.
+        """
+        borrados = [self.idx[nid] for nid in cambio.get("nodos_borrados", [])]
+        nodos_nuevos = cambio.get("nodos_nuevos", [])
+        conservar = np.ones(self.n, dtype=bool)
+        conservar[borrados] = False
+        mapa = np.full(self.n, -1, dtype=np.int64)
+        mapa[conservar] = np.arange(int(conservar.sum()))
+
+        ids = [nid for nid, sigue in zip(self.ids, conservar.tolist()) if sigue] + [n[0] for n in nodos_nuevos]
+        idx = {nid: i for i, nid in enumerate(ids)}
+        if len(idx) != len(ids):
+            raise ValueError("Id de punto repetido")
+        lat = np.concatenate([self.lat[conservar], np.array([n[1] for n in nodos_nuevos], dtype=np.float64)])
+        lon = np.concatenate([self.lon[conservar], np.array([n[2] for n in nodos_nuevos], dtype=np.float64)])
+        tipos = [t for t, sigue in zip(self.tipos, conservar.tolist()) if sigue] + [n[3] for n in nodos_nuevos]
+        etiquetas = [t for t, sigue in zip(self.etiquetas, conservar.tolist()) if sigue] + [n[4] for n in nodos_nuevos]
+
+        origen = self.origenes_aristas()
+        activa = conservar[origen] & conservar[self.targets]
+        aristas_borradas = [(self.idx[o], self.idx[d]) for o, d in cambio.get("aristas_borradas", [])]
+        for o, d in aristas_borradas:
+            candidatas = np.flatnonzero(activa & (origen == o) & (self.targets == d))
+            if not len(candidatas):
+                raise ValueError(f"No existe el tramo {self.ids[o]} -> {self.ids[d]}")
+            activa[candidatas[0]] = False
+
+        aristas_nuevas = cambio.get("aristas_nuevas", [])
+        origen_nuevas = np.array([idx[a[0]] for a in aristas_nuevas], dtype=np.int64)
+        destino_nuevas = np.array([idx[a[1]] for a in aristas_nuevas], dtype=np.int64)
+        nombres_nuevas = [a[4] for a in aristas_nuevas]
+        origen = np.concatenate([mapa[origen[activa]], origen_nuevas]).astype(np.int32)
+        destino = np.concatenate([mapa[self.targets[activa]], destino_nuevas]).astype(np.int32)
+        length = np.concatenate([self.pesos["length"][activa], np.array([a[2] for a in aristas_nuevas], dtype=np.float32)])
+        weight = np.concatenate([self.pesos["weight"][activa], np.array(
+            [a[3] if a[3] is not None else a[2] for a in aristas_nuevas], dtype=np.float32)])
+        nombres = [nombre for nombre, sigue in zip(self.nombres, activa.tolist()) if sigue] + nombres_nuevas
+
+        orden = np.argsort(origen, kind="stable")
+        offsets = np.zeros(len(ids) + 1, dtype=np.int32)
+        np.cumsum(np.bincount(origen, minlength=len(ids)), out=offsets[1:])
+        grafo = GrafoCSR(ids, lat, lon, offsets, destino[orden], length[orden], weight[orden],
+                         [nombres[e] for e in orden.tolist()], tipos, etiquetas)
+        if self._indice_segmentos is not None:
+            grafo._indice_segmentos = self._indice_segmentos.con_cambios(
+                grafo, mapa, aristas_borradas, origen_nuevas, destino_nuevas, nombres_nuevas)
+        return grafo
+
+    def puntos(self, tipos=TIPOS_PUNTO_INTERES):
+        """Puntos de interes en el formato de services.queries.obtener_puntos"""
+        return [
+            {"id": nid, "nombre": self.etiquetas[i], "lat": float(self.lat[i]), "lon": float(self.lon[i]), "tipo": self.tipos[i]}
+            for i, nid in enumerate(self.ids) if self.tipos[i] in tipos
+        ]
+
+    def origenes_aristas(self):
+        """Indice del nodo origen de cada arista (inverso de offsets)"""
+        return np.repeat(np.arange(self.n, dtype=np.int32), np.diff(self.offsets))
+
+    def indice_segmentos(self):
+        """Indice espacial de las aristas, construido la primera vez que se pide"""
+        if self._indice_segmentos is None:
+            from services.indice_espacial import IndiceSegmentos
+            self._indice_segmentos = IndiceSegmentos(self)
+        return self._indice_segmentos
+
+    def vecinos(self, i, peso="length"):
+        inicio, fin = self._offsets_l[i], self._offsets_l[i + 1]
+        return zip(self._targets_l[inicio:fin], self._pesos_l[peso][inicio:fin])
+
+    def dijkstra(self, origen, destinos=None, peso="length"):
+        """
+        Dijkstra con heap desde el indice `origen`. Si se pasan `destinos` (indices) corta apenas
+        quedan todos asentados. Devuelve (dist, pred) como listas de largo n.
+        """
+        offsets, targets, pesos = self._offsets_l, self._targets_l, self._pesos_l[peso]
+        dist = [math.inf] * self.n
+        pred = [-1] * self.n
+        asentado = [False] * self.n
+        pendientes = set(destinos) if destinos is not None else None
+        dist[origen] = 0.0
+        heap = [(0.0, origen)]
+
+        while heap:
+            d, u = heapq.heappop(heap)
+            if asentado[u]:
+                continue
+            asentado[u] = True
+            if pendientes is not None:
+                pendientes.discard(u)
+                if not pendientes:
+                    break
+            for e in range(offsets[u], offsets[u + 1]):
+                v = targets[e]
+                nd = d + pesos[e]
+                if nd < dist[v]:
+                    dist[v] = nd
+                    pred[v] = u
+                    heapq.heappush(heap, (nd, v))
+
+        return dist, pred
+
+    def uno_a_muchos(self, origen, destinos, peso="length"):
+        """Costos desde el indice `origen` a cada indice de `destinos` (np.inf si no hay camino)"""
+        dist, _ = self.dijkstra(origen, destinos, peso)
+        return np.array([dist[j] for j in destinos], dtype=np.float64)
+
+    def _factor_heuristica(self, peso):
+        # Cota inferior de peso por metro: para 'length' es 1, para 'weight' (length/maxspeed) el minimo cociente
+        length = self.pesos["length"]
+        if peso == "length":
+            return 1.0
+        validas = length > 0
+        if not validas.any():
+            return 0.0
+        return float(np.min(self.pesos[peso][validas] / length[validas]))
+
+    def a_estrella(self, origen, destino, peso="length"):
+        """A* entre dos indices con heuristica haversine. Devuelve (costo, camino_indices)"""
+        offsets, targets, pesos = self._offsets_l, self._targets_l, self._pesos_l[peso]
+        h = (haversine(self.lat, self.lon, self.lat[destino], self.lon[destino]) * self._factor_heuristica(peso)).tolist()
+        dist = {origen: 0.0}
+        pred = {origen: -1}
+        cerrados = set()
+        heap = [(h[origen], 0.0, origen)]
+
+        while heap:
+            _, d, u = heapq.heappop(heap)
+            if u in cerrados:
+                continue
+            if u == destino:
+                return d, self._reconstruir(pred, destino)
+            cerrados.add(u)
+            for e in range(offsets[u], offsets[u + 1]):
+                v = targets[e]
+                nd = d + pesos[e]
+                if nd < dist.get(v, math.inf):
+                    dist[v] = nd
+                    pred[v] = u
+                    heapq.heappush(heap, (nd + h[v], nd, v))
+
+        return math.inf, []
+
+    @staticmethod
+    def _reconstruir(pred, destino):
+        camino = []
+        actual = destino
+        while actual != -1:
+            camino.append(actual)
+            actual = pred[actual]
+        camino.reverse()
+        return camino
+
+    def _camino_restringido(self, origen, destino, peso, nodos_bloqueados=(), aristas_bloqueadas=()):
+        """
+        Dijkstra de `origen` a `destino` sin pasar por `nodos_bloqueados` ni usar `aristas_bloqueadas`
+        (indices de arista). Devuelve (costo, nodos, aristas) o (inf, [], []) si no hay camino.
+        """
+        offsets, targets, pesos = self._offsets_l, self._targets_l, self._pesos_l[peso]
+        dist = {origen: 0.0}
+        pred = {origen: (-1, -1)}
+        cerrados = set(nodos_bloqueados)
+        heap = [(0.0, origen)]
+
+        while heap:
+            d, u = heapq.heappop(heap)
+            if u in cerrados:
+                continue
+            if u == destino:
+                nodos, aristas = [], []
+                while u != -1:
+                    nodos.append(u)
+                    u, e = pred[u]
+                    if e != -1:
+                        aristas.append(e)
+                return d, nodos[::-1], aristas[::-1]
+            cerrados.add(u)
+            for e in range(offsets[u], offsets[u + 1]):
+                v = targets[e]
+                nd = d + pesos[e]
+                if e not in aristas_bloqueadas and nd < dist.get(v, math.inf):
+                    dist[v] = nd
+                    pred[v] = (u, e)
+                    heapq.heappush(heap, (nd, v))
+
+        return math.inf, [], []
+
+    def k_caminos(self, origen, destino, k=3, peso="length"):
+        """
+        Yen: hasta `k` caminos simples de `origen` a `destino` (indices), de menor a mayor costo.
+        Devuelve [(costo, camino_indices)]. Las aristas paralelas cuentan como caminos distintos, como en GDS.
+        """
+        costo, nodos, aristas = self._camino_restringido(origen, destino, peso)
+        if not nodos:
+            return []
+        pesos = self._pesos_l[peso]
+        encontrados = [(costo, nodos, tuple(aristas))]
+        candidatos = []
+        vistos = {tuple(aristas)}
+
+        while len(encontrados) < k:
+            _, nodos_previo, aristas_previo = encontrados[-1]
+            for i in range(len(nodos_previo) - 1):
+                raiz = aristas_previo[:i]
+                # Se desvia en nodos_previo[i]: sin repetir la raiz ni la arista siguiente de los caminos que la comparten
+                bloqueadas = {a[i] for _, _, a in encontrados if len(a) > i and a[:i] == raiz}
+                costo, nodos, aristas = self._camino_restringido(
+                    nodos_previo[i], destino, peso, nodos_previo[:i], bloqueadas
+                )
+                total = raiz + tuple(aristas)
+                if not nodos or total in vistos:
+                    continue
+                vistos.add(total)
+                costo_raiz = sum(pesos[e] for e in raiz)
+                heapq.heappush(candidatos, (costo_raiz + costo, nodos_previo[:i] + nodos, total))
+            if not candidatos:
+                break
+            encontrados.append(heapq.heappop(candidatos))
+
+        return [(costo, nodos) for costo, nodos, _ in encontrados]
+
+    def camino(self, pred, origen, destino):
+        """Camino de indices desde `origen` a `destino` a partir de un arreglo pred de dijkstra"""
+        if origen != destino and pred[destino] == -1:
+            return []
+        return self._reconstruir(pred, destino)
+
+    def geometria(self, camino):
+        """Convierte un camino de indices al formato [{id, lon, lat}] que usan las rutas"""
+        return [{"id": self.ids[i], "lon": float(self.lon[i]), "lat": float(self.lat[i])} for i in camino]
+
+    def matriz_distancias(self, origenes, destinos=None, peso="length"):
+        """Matriz de costos minimos entre los Point de `origenes` (filas) y `destinos` (columnas, por defecto los mismos)"""
+        if destinos is None:
+            destinos = origenes
+        indices_destino = [self.idx[pid] for pid in destinos]
+        dist = np.full((len(origenes), len(destinos)), np.inf)
+        for i, pid in enumerate(origenes):
+            dist[i] = self.uno_a_muchos(self.idx[pid], indices_destino, peso)
+        return dist
+
+    def matrices_costos(self, origenes, destinos=None, criterios=CRITERIOS):
+        """
+        Array (len(criterios), len(origenes), len(destinos)) con el costo del camino minimo por cada criterio,
+        igual que optimizacion_1.compute_cost_matrices_dijkstra en Neo4j.
+        """
+        return np.stack([self.matriz_distancias(origenes, destinos, peso=criterio) for criterio in criterios])
+
+    def caminos(self, pares, peso="length"):
+        """{(origen_id, destino_id): [{id, lon, lat}, ...]} para cada par de ids"""
+        resultado = {}
+        for origen_id, destino_id in pares:
+            _, camino = self.a_estrella(self.idx[origen_id], self.idx[destino_id], peso)
+            resultado[(origen_id, destino_id)] = self.geometria(camino)
+        return resultado
+
+
+class GrafoEnMemoria:
+    """
+    Mantiene un GrafoCSR cargado desde Neo4j y lo actualiza cuando cambia la version de datos.
+    Varias consultas concurrentes comparten la misma carga.
+
+    Las altas y bajas de un punto (registrar_cambio) se aplican sobre el grafo ya cargado con
+    GrafoCSR.con_cambios. El cambio se guarda bajo la version que lo produjo (en Redis si hay, asi lo
+    aplican tambien los demas workers). Si falta el cambio de alguna version intermedia (operaciones
+    masivas, crear/borrar mapa) o no encaja, se recarga todo desde Neo4j.
+    `redis_client` puede ser un cliente o una funcion que lo devuelve, como en VersionGrafo.
+    """
+    def __init__(self, driver, version_grafo, redis_client=None, ttl_cambios_s=TTL_CAMBIOS_S):
+        self.driver = driver
+        self.version_grafo = version_grafo
+        self._redis = redis_client
+        self.ttl_cambios_s = ttl_cambios_s
+        self._grafo = None
+        self._version = None
+        self._cambios = {}
+        self._lock = threading.Lock()
+
+    @property
+    def redis_client(self):
+        return self._redis() if callable(self._redis) else self._redis
+
+    def registrar_cambio(self, version, cambio):
+        """Cambio (formato de GrafoCSR.con_cambios) que llevo los datos a `version`"""
+        with self._lock:
+            self._cambios[version] = cambio
+            for vieja in [v for v in self._cambios if v <= version - MAX_CAMBIOS_PENDIENTES]:
+                del self._cambios[vieja]
+        redis_client = self.redis_client
+        if redis_client:
+            try:
+                redis_client.set(f"{PREFIJO_CAMBIO}:{version}", orjson.dumps(cambio), ex=self.ttl_cambios_s)
+            except redis.RedisError:
+                pass
+
+    def _cambio(self, version):
+        if version in self._cambios:
+            return self._cambios[version]
+        redis_client = self.redis_client
+        if redis_client:
+            try:
+                datos = redis_client.get(f"{PREFIJO_CAMBIO}:{version}")
+            except redis.RedisError:
+                return None
+            if datos is not None:
+                return orjson.loads(datos)
+        return None
+
+    def _aplicar_cambios(self, version):
+        """Grafo cargado con los cambios hasta `version`, o None si hay que recargar"""
+        if self._grafo is None or self._version is None or not 0 < version - self._version <= MAX_CAMBIOS_PENDIENTES:
+            return None
+        grafo = self._grafo
+        for v in range(self._version + 1, version + 1):
+            cambio = self._cambio(v)
+            if cambio is None:
+                return None
+            try:
+                grafo = grafo.con_cambios(cambio)
+            except (KeyError, ValueError):
+                return None
+        return grafo
+
+    def obtener(self) -> GrafoCSR:
+        version = self.version_grafo.actual()
+        if self._grafo is not None and self._version == version:
+            return self._grafo
+        with self._lock:
+            version = self.version_grafo.actual()
+            if self._grafo is None or self._version != version:
+                grafo = self._aplicar_cambios(version)
+                self._grafo = grafo if grafo is not None else GrafoCSR.desde_neo4j(self.driver)
+                self._version = version
+            return self._grafo
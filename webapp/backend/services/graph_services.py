@@ -9,10 +9,20 @@ def crear_mapa_logistico(data: MapaRequest,conn):
     location = data.location # "Plaza Independencia, Mendoza, Argentina"
     radius = data.radio #3000
     graph_to_csv.graph_from_address_to_csv(location, radius)
-    #shutil.copy("nodes.csv", os.path.join(config.NEO4J_IMPORT_DIR, "nodes.csv"))
-    #shutil.copy("edges.csv", os.path.join(config.NEO4J_IMPORT_DIR, "edges.csv"))
-    import_data.importar_csv(conn, "nodes.csv", "edges.csv")
-    return {"Creado": "Exitoso"}
+    # Si el directorio import de Neo4j esta montado, se copian los CSV y se importa con LOAD CSV
+    directorio_import = getattr(config, "NEO4J_IMPORT_DIR", None)
+    if directorio_import and os.path.isdir(directorio_import):
+        shutil.copy("nodes.csv", os.path.join(directorio_import, "nodes.csv"))
+        shutil.copy("edges.csv", os.path.join(directorio_import, "edges.csv"))
+    else:
+        directorio_import = None
+    resultado = import_data.importar_csv(
+        conn, "nodes.csv", "edges.csv",
+        tamano_lote=getattr(config, "IMPORT_BATCH_SIZE", import_data.TAMANO_LOTE),
+        hilos=getattr(config, "IMPORT_THREADS", 1),
+        directorio_import=directorio_import,
+    )
+    return {"Creado": "Exitoso", "estadisticas": resultado["estadisticas"]}
 
 def eliminar_mapa(conn):
     query = """MATCH (n) DETACH DELETE n"""
@@ -0,0 +1,190 @@
+import copy
+import math
+import numpy as np
+
+"""
+Indice espacial (grilla uniforme) de los tramos de calle de un GrafoCSR.
+
+Las coordenadas se proyectan a metros con una equirectangular centrada en el mapa (error despreciable
+a escala de ciudad). Cada tramo se registra en todas las celdas que toca su bounding box; una consulta
+revisa anillos de celdas alrededor del punto hasta que el k-esimo candidato esta mas cerca que el
+radio ya cubierto, y calcula la distancia real punto-segmento por proyeccion perpendicular.
+
+Los tramos del indice tienen su propia numeracion (origen/destino/nombres): con_cambios quita tramos de sus
+celdas y agrega los nuevos al final, asi un alta o baja de un punto no obliga a reconstruir la grilla.
+"""
+
+RADIO_TIERRA_M = 6371008.8
+TAMANO_CELDA_M = 100.0
+
+
+class IndiceSegmentos:
+    def __init__(self, grafo, tamano_celda_m=TAMANO_CELDA_M):
+        self.grafo = grafo
+        self.tamano_celda = tamano_celda_m
+        self.lat0 = float(np.mean(grafo.lat)) if grafo.n else 0.0
+        self.lon0 = float(np.mean(grafo.lon)) if grafo.n else 0.0
+        self.ky = RADIO_TIERRA_M * math.pi / 180
+        self.kx = self.ky * math.cos(math.radians(self.lat0))
+
+        x, y = self._proyectar(grafo.lat, grafo.lon)
+        self.origen = grafo.origenes_aristas()
+        self.destino = grafo.targets
+        self.ax, self.ay = x[self.origen], y[self.origen]
+        self.bx, self.by = x[self.destino], y[self.destino]
+
+        self.nombres = list(grafo.nombres)
+        self.activo = np.ones(len(self.origen), dtype=bool)
+
+        celdas = {}
+        for e, celda in self._celdas_tramos(np.arange(len(self.origen))):
+            celdas.setdefault(celda, []).append(e)
+        self.celdas = {clave: np.array(aristas, dtype=np.int32) for clave, aristas in celdas.items()}
+        self._actualizar_limites()
+
+    def _celdas_tramos(self, aristas):
+        """(tramo, celda) para cada celda que cubre el bounding box de cada tramo"""
+        ax, ay, bx, by = self.ax[aristas], self.ay[aristas], self.bx[aristas], self.by[aristas]
+        cx0 = np.floor(np.minimum(ax, bx) / self.tamano_celda).astype(np.int64)
+        cx1 = np.floor(np.maximum(ax, bx) / self.tamano_celda).astype(np.int64)
+        cy0 = np.floor(np.minimum(ay, by) / self.tamano_celda).astype(np.int64)
+        cy1 = np.floor(np.maximum(ay, by) / self.tamano_celda).astype(np.int64)
+        for e, x0, x1, y0, y1 in zip(np.asarray(aristas).tolist(), cx0.tolist(), cx1.tolist(), cy0.tolist(), cy1.tolist()):
+            for cx in range(x0, x1 + 1):
+                for cy in range(y0, y1 + 1):
+                    yield e, (cx, cy)
+
+    def _actualizar_limites(self):
+        if self.celdas:
+            claves = np.array(list(self.celdas.keys()))
+            self.cx_min, self.cy_min = claves.min(axis=0).tolist()
+            self.cx_max, self.cy_max = claves.max(axis=0).tolist()
+
+    def con_cambios(self, grafo, mapa, aristas_borradas, origen_nuevas, destino_nuevas, nombres_nuevas):
+        """
+        Copia del indice para `grafo`, el resultado de GrafoCSR.con_cambios sobre el grafo de este indice.
+        mapa[i]: indice en `grafo` del nodo viejo i (-1 si se borro; sus tramos salen del indice).
+        aristas_borradas: pares (origen, destino) con indices viejos; se quita un tramo por par.
+        origen_nuevas/destino_nuevas: indices en `grafo` de los tramos agregados.
+        Solo se tocan las celdas de los tramos quitados o agregados; el indice original no se modifica.
+        """
+        nuevo = copy.copy(self)
+        nuevo.grafo = grafo
+        quitar = self.activo & ((mapa[self.origen] < 0) | (mapa[self.destino] < 0))
+        for o, d in aristas_borradas:
+            candidatos = np.flatnonzero(self.activo & ~quitar & (self.origen == o) & (self.destino == d))
+            if len(candidatos):
+                quitar[candidatos[0]] = True
+        nuevo.activo = np.concatenate([self.activo & ~quitar, np.ones(len(origen_nuevas), dtype=bool)])
+        # Los tramos inactivos conservan el indice viejo, que ya no se usa
+        nuevo.origen = np.concatenate([np.where(nuevo.activo[:len(self.origen)], mapa[self.origen], -1),
+                                       np.asarray(origen_nuevas, dtype=np.int64)]).astype(self.origen.dtype)
+        nuevo.destino = np.concatenate([np.where(nuevo.activo[:len(self.destino)], mapa[self.destino], -1),
+                                        np.asarray(destino_nuevas, dtype=np.int64)]).astype(self.destino.dtype)
+        x, y = self._proyectar(grafo.lat[nuevo.origen[len(self.origen):]], grafo.lon[nuevo.origen[len(self.origen):]])
+        nuevo.ax, nuevo.ay = np.concatenate([self.ax, x]), np.concatenate([self.ay, y])
+        x, y = self._proyectar(grafo.lat[nuevo.destino[len(self.destino):]], grafo.lon[nuevo.destino[len(self.destino):]])
+        nuevo.bx, nuevo.by = np.concatenate([self.bx, x]), np.concatenate([self.by, y])
+        nuevo.nombres = self.nombres + list(nombres_nuevas)
+
+        celdas = dict(self.celdas)
+        quitados = {}
+        for e, celda in self._celdas_tramos(np.flatnonzero(quitar)):
+            quitados.setdefault(celda, []).append(e)
+        for celda, aristas in quitados.items():
+            restantes = celdas[celda][~np.isin(celdas[celda], aristas)]
+            if len(restantes):
+                celdas[celda] = restantes
+            else:
+                del celdas[celda]
+        agregados = {}
+        for e, celda in nuevo._celdas_tramos(np.arange(len(self.origen), len(nuevo.origen))):
+            agregados.setdefault(celda, []).append(e)
+        for celda, aristas in agregados.items():
+            aristas = np.array(aristas, dtype=np.int32)
+            celdas[celda] = np.concatenate([celdas[celda], aristas]) if celda in celdas else aristas
+        nuevo.celdas = celdas
+        nuevo._actualizar_limites()
+        return nuevo
+
+    def _proyectar(self, lat, lon):
+        return (np.asarray(lon) - self.lon0) * self.kx, (np.asarray(lat) - self.lat0) * self.ky
+
+    def _distancias(self, aristas, px, py):
+        """Distancia punto-segmento y parametro t en [0, 1] de la proyeccion sobre cada tramo"""
+        ax, ay, bx, by = self.ax[aristas], self.ay[aristas], self.bx[aristas], self.by[aristas]
+        dx, dy = bx - ax, by - ay
+        largo2 = dx * dx + dy * dy
+        with np.errstate(invalid="ignore", divide="ignore"):
+            t = np.where(largo2 > 0, ((px - ax) * dx + (py - ay) * dy) / largo2, 0.0)
+        t = np.clip(t, 0.0, 1.0)
+        return np.hypot(px - (ax + t * dx), py - (ay + t * dy)), t
+
+    def _anillo(self, cx, cy, r):
+        if r == 0:
+            yield (cx, cy)
+            return
+        for i in range(-r, r + 1):
+            yield (cx + i, cy - r)
+            yield (cx + i, cy + r)
+        for j in range(-r + 1, r):
+            yield (cx - r, cy + j)
+            yield (cx + r, cy + j)
+
+    def k_cercanos(self, lat, lon, k=1):
+        """
+        Devuelve hasta k tramos ordenados por distancia real al punto:
+        [{arista, distancia_m, t, lat, lon}] donde lat/lon es el punto proyectado sobre el tramo.
+        """
+        if not self.celdas or k <= 0:
+            return []
+        px, py = self._proyectar(lat, lon)
+        px, py = float(px), float(py)
+        cx, cy = int(math.floor(px / self.tamano_celda)), int(math.floor(py / self.tamano_celda))
+        # Anillo a partir del cual ya no quedan celdas con tramos
+        r_max = max(abs(cx - self.cx_min), abs(cx - self.cx_max), abs(cy - self.cy_min), abs(cy - self.cy_max))
+
+        vistos = set()
+        candidatos, distancias, ts = [], [], []
+        for r in range(r_max + 1):
+            nuevas = []
+            for celda in self._anillo(cx, cy, r):
+                aristas = self.celdas.get(celda)
+                if aristas is None:
+                    continue
+                for e in aristas.tolist():
+                    if e not in vistos:
+                        vistos.add(e)
+                        nuevas.append(e)
+            if nuevas:
+                nuevas = np.array(nuevas, dtype=np.int32)
+                d, t = self._distancias(nuevas, px, py)
+                candidatos.append(nuevas)
+                distancias.append(d)
+                ts.append(t)
+            # Tras el anillo r esta cubierto todo lo que esta a menos de r celdas del punto
+            if candidatos and sum(len(c) for c in candidatos) >= k:
+                d_todas = np.concatenate(distancias)
+                if np.partition(d_todas, k - 1)[k - 1] <= r * self.tamano_celda:
+                    break
+
+        if not candidatos:
+            return []
+        aristas = np.concatenate(candidatos)
+        d = np.concatenate(distancias)
+        t = np.concatenate(ts)
+        orden = np.argsort(d, kind="stable")[:k]
+
+        resultado = []
+        for i in orden.tolist():
+            e = int(aristas[i])
+            x = self.ax[e] + t[i] * (self.bx[e] - self.ax[e])
+            y = self.ay[e] + t[i] * (self.by[e] - self.ay[e])
+            resultado.append({
+                "arista": e,
+                "distancia_m": float(d[i]),
+                "t": float(t[i]),
+                "lat": float(self.lat0 + y / self.ky),
+                "lon": float(self.lon0 + x / self.kx),
+            })
+        return resultado
@@ -1,8 +1,13 @@
 from neo4j import GraphDatabase
 
 class Neo4jConnection:
-    def __init__(self, uri, user, password):
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
+    def __init__(self, uri, user, password, max_connection_pool_size=100, connection_acquisition_timeout=60.0):
+        self.driver = GraphDatabase.driver(
+            uri,
+            auth=(user, password),
+            max_connection_pool_size=max_connection_pool_size,
+            connection_acquisition_timeout=connection_acquisition_timeout,
+        )
 
     def close(self):
         self.driver.close()
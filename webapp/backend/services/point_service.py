@@ -1,15 +1,36 @@
+import csv
+import io
+import math
+import threading
+from fastapi import HTTPException
 
+from models.schemes import Coordenadas, InsercionRequest, PuntoEstablecimiento
+from map_graph.import_data import asegurar_indice_espacial
+from services.grafo_memoria import haversine
+from services.indice_espacial import RADIO_TIERRA_M
+from services.streaming import respuesta_streaming
 
+RADIO_BUSQUEDA_M = 1000
+
+# Bases importadas antes de que existiera Point.location: se completa una vez por proceso en el primer uso
+# (no en el arranque, para no depender de que Neo4j este arriba cuando levanta la API)
+_location_completo = False
+_location_lock = threading.Lock()
 
-from fastapi import HTTPException
-from fastapi.responses import JSONResponse
 
-from models.schemes import Coordenadas, InsercionRequest
+def _asegurar_location(conn):
+    global _location_completo
+    if _location_completo:
+        return
+    with _location_lock:
+        if not _location_completo:
+            asegurar_indice_espacial(conn)
+            _location_completo = True
 
 
-def list_map_points(conn):
+def list_map_points(conn, ndjson: bool = False):
     """
-    Devuelve todos los puntos de tipo Local o CentroDeDistribucion.
+    Devuelve todos los puntos de tipo Local o CentroDeDistribucion, en streaming (arreglo JSON o NDJSON).
     """
 
     query = """
@@ -17,12 +38,13 @@ def list_map_points(conn):
     WHERE p.tipo <> 'Interseccion'
     RETURN p.id AS id, p.name AS nombre, p.lat AS lat, p.lon AS lon, p.tipo AS tipo
     """
-    with conn.driver.session() as session:
-        result = session.run(query)
-        puntos = [record.data() for record in result]
-    return JSONResponse(content=puntos)
+    return respuesta_streaming(conn.driver, query, ndjson=ndjson)
 
 def delete_map_point(id:str ,conn):
+    """
+    Borra el punto y une sus calles (a->n->b pasa a ser a->b).
+    Devuelve (respuesta, cambio) con el cambio en el formato de GrafoCSR.con_cambios, o (None, None) si no existe.
+    """
     query = """
     MATCH (n:Point {id: $id})
     OPTIONAL MATCH (a)-[r1:STREET]->(n)-[r2:STREET]->(b)
@@ -35,35 +57,64 @@ def delete_map_point(id:str ,conn):
             weight: r1.weight + r2.weight
         }]->(b)
     )
+    WITH n, collect(CASE WHEN a IS NOT NULL AND b IS NOT NULL THEN
+        [a.id, b.id, r1.length + r2.length, r1.weight + r2.weight, r1.name] END) AS unidas
     DETACH DELETE n
-    RETURN 'ok' AS status
+    RETURN 'ok' AS status, unidas
     """
     with conn.driver.session() as session:
-        result = session.run(query, id=id)
-        return result.single()
+        record = session.run(query, id=id).single()
+    if record is None:
+        return None, None
+    return {"status": record["status"]}, {"nodos_borrados": [id], "aristas_nuevas": record["unidas"]}
 
-def obtener_tramo_cercano(coord: Coordenadas,conn):
+def obtener_tramo_cercano(coord: Coordenadas, conn, radio_m: float = RADIO_BUSQUEDA_M):
+    """
+    Tramo mas cercano consultando Neo4j: los nodos candidatos salen del indice de `location` (bounding box
+    de radio_m alrededor de la coordenada) y los tramos se ordenan por distancia real punto-segmento.
+    """
+    _asegurar_location(conn)
     driver = conn.driver
+    ky = RADIO_TIERRA_M * math.pi / 180
+    kx = ky * math.cos(math.radians(coord.lat))
     query = """
     WITH point({latitude: $lat, longitude: $lon}) AS input
     MATCH (n1:Point)
-    WHERE point.distance(point({latitude: n1.lat, longitude: n1.lon}), input) < 1000
-    WITH n1, input
+    WHERE point.withinBBox(n1.location,
+                           point({latitude: $lat_min, longitude: $lon_min}),
+                           point({latitude: $lat_max, longitude: $lon_max}))
     MATCH (n1)-[r:STREET]->(n2:Point)
+    // Coordenadas en metros relativas a la consulta (equirectangular), la consulta queda en (0, 0)
+    WITH n1, n2, r, input,
+         (n1.lon - $lon) * $kx AS x1, (n1.lat - $lat) * $ky AS y1,
+         (n2.lon - $lon) * $kx AS x2, (n2.lat - $lat) * $ky AS y2
+    WITH n1, n2, r, input, x1, y1, x2 - x1 AS dx, y2 - y1 AS dy
+    WITH n1, n2, r, input, x1, y1, dx, dy,
+         CASE WHEN dx * dx + dy * dy = 0 THEN 0.0
+              ELSE -(x1 * dx + y1 * dy) / (dx * dx + dy * dy) END AS t0
+    WITH n1, n2, r, input, x1, y1, dx, dy,
+         CASE WHEN t0 < 0 THEN 0.0 WHEN t0 > 1 THEN 1.0 ELSE t0 END AS t
+    WITH n1, n2, r, input, t, x1 + t * dx AS px, y1 + t * dy AS py
     RETURN n1.id AS from_id, n1.lat AS from_lat, n1.lon AS from_lon,
            n2.id AS to_id, n2.lat AS to_lat, n2.lon AS to_lon,
-           r.name AS calle,
-           point.distance(point({latitude: n1.lat, longitude: n1.lon}), input) AS dist_from,
-           point.distance(point({latitude: n2.lat, longitude: n2.lon}), input) AS dist_to
-    ORDER BY dist_from + dist_to ASC
+           r.name AS calle, t,
+           $lat + py / $ky AS proy_lat, $lon + px / $kx AS proy_lon,
+           sqrt(px * px + py * py) AS dist_tramo,
+           point.distance(coalesce(n1.location, point({latitude: n1.lat, longitude: n1.lon})), input) AS dist_from,
+           point.distance(coalesce(n2.location, point({latitude: n2.lat, longitude: n2.lon})), input) AS dist_to
+    ORDER BY dist_tramo ASC
     LIMIT 1
     """
     with driver.session() as session:
-        result = session.run(query, lat=coord.lat, lon=coord.lon)
+        result = session.run(
+            query, lat=coord.lat, lon=coord.lon, kx=kx, ky=ky,
+            lat_min=coord.lat - radio_m / ky, lat_max=coord.lat + radio_m / ky,
+            lon_min=coord.lon - radio_m / kx, lon_max=coord.lon + radio_m / kx,
+        )
         record = result.single()
         if record is None:
             raise HTTPException(status_code=404, detail="No se encontró un tramo cercano.")
-        
+
         return {
             "calle": record["calle"],
             "from": {
@@ -77,52 +128,91 @@ def obtener_tramo_cercano(coord: Coordenadas,conn):
                 "lat": record["to_lat"],
                 "lon": record["to_lon"],
                 "distancia_m": record["dist_to"]
-            }
+            },
+            "proyeccion": {"lat": record["proy_lat"], "lon": record["proy_lon"], "t": record["t"]},
+            "distancia_m": record["dist_tramo"]
         }
-    
+
+
+def obtener_tramos_cercanos(coord: Coordenadas, grafo, k: int = 1):
+    """
+    Tramos mas cercanos a la coordenada usando el indice espacial del grafo en memoria.
+    Mismo formato que obtener_tramo_cercano.
+    """
+    indice = grafo.indice_segmentos()
+    tramos = []
+    for tramo in indice.k_cercanos(coord.lat, coord.lon, k):
+        e = tramo["arista"]
+        extremos = {}
+        for clave, i in (("from", int(indice.origen[e])), ("to", int(indice.destino[e]))):
+            lat, lon = float(grafo.lat[i]), float(grafo.lon[i])
+            extremos[clave] = {
+                "id": grafo.ids[i],
+                "lat": lat,
+                "lon": lon,
+                "distancia_m": float(haversine(coord.lat, coord.lon, lat, lon)),
+            }
+        tramos.append({
+            "calle": indice.nombres[e],
+            **extremos,
+            "proyeccion": {"lat": tramo["lat"], "lon": tramo["lon"], "t": tramo["t"]},
+            "distancia_m": tramo["distancia_m"],
+        })
+    return tramos
+
 
 def insertar_nuevo_punto(data: InsercionRequest,conn):
+    """
+    Inserta el local partiendo el tramo from->to en from->local->to.
+    Devuelve (respuesta, cambio) con el cambio en el formato de GrafoCSR.con_cambios.
+    """
+    _asegurar_location(conn)
     driver = conn.driver
     query = """
     WITH point({latitude: $lat, longitude: $lon}) AS nuevo_punto
 
     MATCH (a:Point {id: $from_id})-[r:STREET]->(b:Point {id: $to_id})
     
+    // Por si algun Point quedo sin location (ver _asegurar_location), se arma desde lat/lon
     WITH a, b, r, nuevo_punto,
-         point({latitude: a.lat, longitude: a.lon}) AS punto_a,
-         point({latitude: b.lat, longitude: b.lon}) AS punto_b
-
-    WITH a, b, r,
-         point.distance(punto_a, nuevo_punto) AS dist_a,
-         point.distance(punto_b, nuevo_punto) AS dist_b
+         point.distance(coalesce(a.location, point({latitude: a.lat, longitude: a.lon})), nuevo_punto) AS dist_a,
+         point.distance(coalesce(b.location, point({latitude: b.lat, longitude: b.lon})), nuevo_punto) AS dist_b
+    // Si a, b y el punto nuevo coinciden se parte a la mitad en lugar de dividir por cero
+    WITH a, b, r, nuevo_punto,
+         CASE WHEN dist_a + dist_b = 0 THEN 0.5 ELSE dist_a / (dist_a + dist_b) END AS fraccion
 
     CREATE (nuevo:Point {
         id: $local_id,
         lat: $lat,
         lon: $lon,
+        location: nuevo_punto,
         name: $local_name,
         tipo: $local_tipo
     })
 
-    CREATE (a)-[:STREET {
+    // length tambien se reparte en proporcion, asi a->nuevo->b suma lo mismo que a->b
+    // y las distancias entre los demas puntos no cambian
+    CREATE (a)-[r1:STREET {
         name: r.name,
-        length: dist_a,
+        length: r.length * fraccion,
         maxspeed: r.maxspeed,
-        weight: r.weight * (dist_a / (dist_a + dist_b))
+        weight: r.weight * fraccion
     }]->(nuevo)
 
-    CREATE (nuevo)-[:STREET {
+    CREATE (nuevo)-[r2:STREET {
         name: r.name,
-        length: dist_b,
+        length: r.length * (1 - fraccion),
         maxspeed: r.maxspeed,
-        weight: r.weight * (dist_b / (dist_a + dist_b))
+        weight: r.weight * (1 - fraccion)
     }]->(b)
 
     DELETE r
+    RETURN r1.name AS nombre, r1.length AS length_a, r1.weight AS weight_a,
+           r2.length AS length_b, r2.weight AS weight_b
     """
 
     with driver.session() as session:
-        result = session.run(
+        records = list(session.run(
             query,
             from_id=data.from_.id,
             to_id=data.to.id,
@@ -131,5 +221,281 @@ def insertar_nuevo_punto(data: InsercionRequest,conn):
             local_id=data.local.id,
             local_name=data.local.name,
             local_tipo=data.local.tipo
-        )
-    return {"status": "ok", "mensaje": f"Se insertó el nodo {data.local.name} entre {data.from_.id} y {data.to.id}"}
\ No newline at end of file
+        ))
+    cambio = {
+        "nodos_nuevos": [(data.local.id, data.local.lat, data.local.lon, data.local.tipo, data.local.name)],
+        "aristas_borradas": [(data.from_.id, data.to.id) for _ in records],
+        "aristas_nuevas": [
+            arista
+            for r in records
+            for arista in ((data.from_.id, data.local.id, r["length_a"], r["weight_a"], r["nombre"]),
+                           (data.local.id, data.to.id, r["length_b"], r["weight_b"], r["nombre"]))
+        ],
+    }
+    return {"status": "ok", "mensaje": f"Se insertó el nodo {data.local.name} entre {data.from_.id} y {data.to.id}"}, cambio
+
+# Alta y baja masiva de locales: el ajuste a calles se hace con el indice en memoria y las escrituras por lotes
+TAMANO_LOTE_MASIVO = 500
+
+CY_PUNTOS_EXISTENTES = """
+MATCH (p:Point)
+WHERE p.id IN $ids
+RETURN p.id AS id, p.tipo AS tipo
+"""
+
+# Cada fila es un tramo a->b con los locales ordenados a lo largo de la calle:
+# se reemplaza a->b por la cadena a->l1->...->ln->b repartiendo length/weight segun `fracciones`
+CY_DIVIDIR_TRAMOS = """
+UNWIND $tramos AS tramo
+MATCH (a:Point {id: tramo.from_id})-[r:STREET]->(b:Point {id: tramo.to_id})
+WITH tramo, a, b, collect(r)[0] AS r
+CALL {
+    WITH tramo
+    UNWIND tramo.locales AS local
+    CREATE (n:Point {
+        id: local.id,
+        lat: local.lat,
+        lon: local.lon,
+        location: point({latitude: local.lat, longitude: local.lon}),
+        name: local.name,
+        tipo: local.tipo
+    })
+    RETURN collect(n) AS nuevos
+}
+WITH tramo, r, [a] + nuevos + [b] AS cadena
+UNWIND range(0, size(cadena) - 2) AS i
+WITH tramo, r, cadena[i] AS desde, cadena[i + 1] AS hasta, tramo.fracciones[i] AS fraccion
+CREATE (desde)-[:STREET {
+    name: r.name,
+    length: r.length * fraccion,
+    maxspeed: r.maxspeed,
+    weight: r.weight * fraccion
+}]->(hasta)
+WITH DISTINCT tramo, r
+DELETE r
+RETURN tramo.from_id AS from_id, tramo.to_id AS to_id
+"""
+
+CY_TRAMOS_INCIDENTES = """
+MATCH (p:Point)
+WHERE p.id IN $ids
+MATCH (p)-[r:STREET]-()
+WITH DISTINCT r
+RETURN startNode(r).id AS origen, endNode(r).id AS destino,
+       r.name AS name, r.length AS length, r.maxspeed AS maxspeed, r.weight AS weight
+"""
+
+CY_UNIR_TRAMOS = """
+UNWIND $tramos AS tramo
+MATCH (a:Point {id: tramo.origen}), (b:Point {id: tramo.destino})
+CREATE (a)-[:STREET {
+    name: tramo.name,
+    length: tramo.length,
+    maxspeed: tramo.maxspeed,
+    weight: tramo.weight
+}]->(b)
+"""
+
+CY_BORRAR_PUNTOS = """
+UNWIND $ids AS id
+MATCH (p:Point {id: id})
+DETACH DELETE p
+RETURN count(*) AS borrados
+"""
+
+
+def leer_locales_csv(contenido: str):
+    """CSV con columnas id,name,lat,lon y opcionalmente tipo (por defecto Local)"""
+    locales = []
+    for n, fila in enumerate(csv.DictReader(io.StringIO(contenido)), start=2):
+        try:
+            locales.append(PuntoEstablecimiento(
+                id=fila["id"], name=fila["name"], lat=float(fila["lat"]), lon=float(fila["lon"]),
+                tipo=fila.get("tipo") or "Local",
+            ))
+        except (KeyError, TypeError, ValueError) as e:
+            raise HTTPException(status_code=422, detail=f"Fila {n} invalida: {e}")
+    return locales
+
+
+def _lotes(unidades, tamano_lote, tamano):
+    """Agrupa unidades indivisibles en lotes de aproximadamente `tamano_lote` elementos"""
+    lote, cuenta = [], 0
+    for unidad in unidades:
+        lote.append(unidad)
+        cuenta += tamano(unidad)
+        if cuenta >= tamano_lote:
+            yield lote
+            lote, cuenta = [], 0
+    if lote:
+        yield lote
+
+
+def _filtrar_ids(ids, conn):
+    """Tipo de cada id que ya existe en la base"""
+    with conn.driver.session() as session:
+        return {r["id"]: r["tipo"] for r in session.run(CY_PUNTOS_EXISTENTES, ids=list(ids))}
+
+
+def _agrupar_por_tramo(locales, grafo, distancia_max_m):
+    """
+    Ajusta cada local a su tramo mas cercano y devuelve {(from_id, to_id): [(t, local)]} ordenado por t,
+    de modo que varios locales sobre la misma calle quedan encadenados en orden.
+    """
+    indice = grafo.indice_segmentos()
+    tramos, rechazados = {}, []
+    for local in locales:
+        cercanos = indice.k_cercanos(local.lat, local.lon, 1)
+        if not cercanos or cercanos[0]["distancia_m"] > distancia_max_m:
+            rechazados.append({"id": local.id, "motivo": "sin tramo cercano"})
+            continue
+        e = cercanos[0]["arista"]
+        clave = (grafo.ids[int(indice.origen[e])], grafo.ids[int(indice.destino[e])])
+        tramos.setdefault(clave, []).append((cercanos[0]["t"], local))
+    for ubicados in tramos.values():
+        ubicados.sort(key=lambda x: x[0])
+    return tramos, rechazados
+
+
+def insertar_puntos_masivo(locales, conn, grafo, tamano_lote: int = TAMANO_LOTE_MASIVO,
+                           distancia_max_m: float = RADIO_BUSQUEDA_M):
+    """
+    Inserta muchos locales: todos se ajustan a su tramo con el indice espacial de `grafo` y los tramos
+    se dividen con UNWIND en transacciones de ~tamano_lote locales. Un tramo nunca se reparte entre lotes.
+    """
+    rechazados, unicos = [], {}
+    for local in locales:
+        if local.id in unicos:
+            rechazados.append({"id": local.id, "motivo": "id repetido"})
+        else:
+            unicos[local.id] = local
+    existentes = _filtrar_ids(unicos.keys(), conn)
+    for id_ in existentes:
+        rechazados.append({"id": id_, "motivo": "id existente"})
+        del unicos[id_]
+
+    tramos, sin_tramo = _agrupar_por_tramo(unicos.values(), grafo, distancia_max_m)
+    rechazados.extend(sin_tramo)
+
+    filas = []
+    for (from_id, to_id), ubicados in tramos.items():
+        ts = [0.0] + [t for t, _ in ubicados] + [1.0]
+        filas.append({
+            "from_id": from_id,
+            "to_id": to_id,
+            "locales": [local.model_dump() for _, local in ubicados],
+            "fracciones": [b - a for a, b in zip(ts, ts[1:])],
+        })
+
+    insertados, divididos = [], 0
+    with conn.driver.session() as session:
+        for lote in _lotes(filas, tamano_lote, lambda fila: len(fila["locales"])):
+            hechos = session.execute_write(
+                lambda tx: {(r["from_id"], r["to_id"]) for r in tx.run(CY_DIVIDIR_TRAMOS, tramos=lote)}
+            )
+            for fila in lote:
+                ids = [local["id"] for local in fila["locales"]]
+                if (fila["from_id"], fila["to_id"]) in hechos:
+                    insertados.extend(ids)
+                    divididos += 1
+                else:
+                    # El tramo ya no existe en la base (el grafo en memoria estaba desactualizado)
+                    rechazados.extend({"id": id_, "motivo": "tramo no encontrado"} for id_ in ids)
+
+    return {"status": "ok", "insertados": insertados, "tramos_divididos": divididos, "rechazados": rechazados}
+
+
+def _tramos_a_unir(borrar, aristas):
+    """
+    Para cada calle que entra al conjunto a borrar, sigue la cadena de puntos borrados hasta salir de el
+    y devuelve la arista equivalente (length/weight sumados, nombre y maxspeed del primer tramo).
+    `entrada` es el primer punto borrado de la cadena.
+    """
+    salientes = {}
+    for arista in aristas:
+        salientes.setdefault(arista["origen"], []).append(arista)
+
+    nuevas = {}
+
+    def seguir(primera, actual, length, weight, visitados):
+        for arista in salientes.get(actual, []):
+            destino = arista["destino"]
+            if destino in visitados:
+                continue
+            total_l = length + (arista["length"] or 0)
+            total_w = weight + (arista["weight"] or 0)
+            if destino in borrar:
+                seguir(primera, destino, total_l, total_w, visitados | {destino})
+            elif destino != primera["origen"]:
+                clave = (primera["origen"], destino)
+                if clave not in nuevas or total_l < nuevas[clave]["length"]:
+                    nuevas[clave] = {
+                        "origen": primera["origen"], "destino": destino, "entrada": primera["destino"],
+                        "name": primera["name"], "maxspeed": primera["maxspeed"],
+                        "length": total_l, "weight": total_w,
+                    }
+
+    for arista in aristas:
+        if arista["origen"] not in borrar and arista["destino"] in borrar:
+            seguir(arista, arista["destino"], arista["length"] or 0, arista["weight"] or 0, {arista["destino"]})
+    return list(nuevas.values())
+
+
+def _componentes(borrar, aristas):
+    """Puntos a borrar conectados entre si: se tienen que borrar en la misma transaccion"""
+    padre = {id_: id_ for id_ in borrar}
+
+    def raiz(x):
+        while padre[x] != x:
+            padre[x] = padre[padre[x]]
+            x = padre[x]
+        return x
+
+    for arista in aristas:
+        if arista["origen"] in borrar and arista["destino"] in borrar:
+            padre[raiz(arista["origen"])] = raiz(arista["destino"])
+    componentes = {}
+    for id_ in borrar:
+        componentes.setdefault(raiz(id_), set()).add(id_)
+    return list(componentes.values())
+
+
+def eliminar_puntos_masivo(ids, conn, tamano_lote: int = TAMANO_LOTE_MASIVO):
+    """
+    Borra muchos locales volviendo a unir las calles que cortaban, incluso cuando hay varios seguidos
+    sobre el mismo tramo. Las intersecciones no se borran por esta via.
+    """
+    existentes = _filtrar_ids(set(ids), conn)
+    rechazados = [{"id": id_, "motivo": "no existe"} for id_ in dict.fromkeys(ids) if id_ not in existentes]
+    rechazados += [{"id": id_, "motivo": "es una interseccion"} for id_, tipo in existentes.items() if tipo == 'Interseccion']
+    borrar = {id_ for id_, tipo in existentes.items() if tipo != 'Interseccion'}
+    if not borrar:
+        return {"status": "ok", "borrados": [], "tramos_unidos": 0, "rechazados": rechazados}
+
+    with conn.driver.session() as session:
+        aristas = [r.data() for r in session.run(CY_TRAMOS_INCIDENTES, ids=list(borrar))]
+    nuevas = _tramos_a_unir(borrar, aristas)
+
+    # Cada arista nueva se crea en la transaccion que borra la componente de su primer punto borrado
+    por_componente = []
+    componente_de = {}
+    for componente in _componentes(borrar, aristas):
+        por_componente.append((componente, []))
+        for id_ in componente:
+            componente_de[id_] = len(por_componente) - 1
+    for nueva in nuevas:
+        por_componente[componente_de[nueva["entrada"]]][1].append(nueva)
+
+    def escribir(tx, tramos, ids_lote):
+        tx.run(CY_UNIR_TRAMOS, tramos=tramos).consume()
+        return tx.run(CY_BORRAR_PUNTOS, ids=ids_lote).single()["borrados"]
+
+    borrados = []
+    with conn.driver.session() as session:
+        for lote in _lotes(por_componente, tamano_lote, lambda unidad: len(unidad[0])):
+            ids_lote = [id_ for componente, _ in lote for id_ in componente]
+            tramos = [nueva for _, tramos_componente in lote for nueva in tramos_componente]
+            session.execute_write(escribir, tramos, ids_lote)
+            borrados.extend(ids_lote)
+
+    return {"status": "ok", "borrados": borrados, "tramos_unidos": len(nuevas), "rechazados": rechazados}
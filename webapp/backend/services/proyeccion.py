@@ -0,0 +1,144 @@
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from services.queries import (
+    PROYECCION_DEFECTO, existe_proyeccion, proyectar_grafo, eliminar_proyeccion, listar_proyecciones,
+)
+
+"""
+Gestor de la proyeccion GDS del mapa.
+
+En lugar de borrar y volver a proyectar 'mapa-logistico' en cada request, cada proyeccion se nombra
+con la version de datos del grafo ('mapa-logistico-v<version>'). Las escrituras (insertar/borrar punto,
+crear/borrar mapa) incrementan esa version; la proxima consulta detecta que la proyeccion quedo vieja,
+construye la nueva y la publica. Las consultas que estaban usando la anterior la siguen usando hasta
+terminar, y recien ahi se libera.
+
+La version se comparte entre workers por Redis, asi que el resto del estado tambien vive ahi:
+- un lock por nombre de proyeccion (redis-py Lock): crear, empezar a usar y eliminar una proyeccion se
+  hacen bajo ese lock, asi dos workers no proyectan el mismo nombre ni uno elimina lo que otro va a usar
+- los usos en curso de cada proyeccion, en un sorted set con vencimiento (`duracion_uso_s`): si un worker
+  se cae sin liberar, su uso vence solo y la proyeccion se puede eliminar
+Al primer uso en cada proceso, y cada vez que se publica una version nueva, se eliminan las proyecciones
+'mapa-logistico*' viejas sin usos (incluida la 'mapa-logistico' sin version y las de procesos anteriores).
+Sin Redis el lock y los usos son del proceso (un solo worker).
+"""
+
+# Tiempo maximo que se considera en uso una proyeccion si el worker no la libera (cubre OPTIMIZATION_TIMEOUT_S)
+DURACION_USO_S = 900
+# Proyectar un mapa grande puede tardar: el lock vence solo pasado este tiempo
+DURACION_LOCK_S = 600
+
+
+class GestorProyeccion:
+    def __init__(self, driver, version_grafo, nombre_base=PROYECCION_DEFECTO, redis_client=None,
+                 duracion_uso_s=DURACION_USO_S):
+        self.driver = driver
+        self.version_grafo = version_grafo
+        self.nombre_base = nombre_base
+        # Cliente o funcion que lo devuelve (recursos.get_redis), como en VersionGrafo
+        self._redis = redis_client
+        self.duracion_uso_s = duracion_uso_s
+        # Proyecciones que este proceso ya vio creadas (evita preguntarle a GDS en cada request)
+        self._creadas = set()
+        self._barrido_hecho = False
+        self._en_uso = defaultdict(dict)
+        self._lock = threading.RLock()
+
+    @property
+    def redis_client(self):
+        return self._redis() if callable(self._redis) else self._redis
+
+    def _nombre(self, version):
+        return f"{self.nombre_base}-v{version}"
+
+    def _clave_usos(self, nombre):
+        return f"proyeccion:usos:{nombre}"
+
+    def _bloqueo(self, redis_client, nombre):
+        if redis_client is None:
+            return self._lock
+        return redis_client.lock(f"proyeccion:lock:{nombre}", timeout=DURACION_LOCK_S)
+
+    def _registrar_uso(self, redis_client, nombre):
+        uso = str(uuid.uuid4())
+        vence = time.time() + self.duracion_uso_s
+        if redis_client is None:
+            self._en_uso[nombre][uso] = vence
+        else:
+            redis_client.zadd(self._clave_usos(nombre), {uso: vence})
+            redis_client.expire(self._clave_usos(nombre), self.duracion_uso_s)
+        return uso
+
+    def _liberar_uso(self, redis_client, nombre, uso):
+        if redis_client is None:
+            self._en_uso[nombre].pop(uso, None)
+        else:
+            redis_client.zrem(self._clave_usos(nombre), uso)
+
+    def _usos_activos(self, redis_client, nombre):
+        ahora = time.time()
+        if redis_client is None:
+            usos = self._en_uso[nombre]
+            for uso in [u for u, vence in usos.items() if vence <= ahora]:
+                del usos[uso]
+            return len(usos)
+        redis_client.zremrangebyscore(self._clave_usos(nombre), "-inf", ahora)
+        return redis_client.zcard(self._clave_usos(nombre))
+
+    def _eliminar_si_libre(self, redis_client, nombre):
+        """Elimina `nombre` si no es la version vigente y nadie la esta usando (bajo el lock del nombre)"""
+        with self._bloqueo(redis_client, nombre):
+            if nombre == self._nombre(self.version_grafo.actual()) or self._usos_activos(redis_client, nombre):
+                return False
+            eliminar_proyeccion(self.driver, nombre)
+            with self._lock:
+                self._creadas.discard(nombre)
+            return True
+
+    def limpiar(self, redis_client=None):
+        """Elimina las proyecciones 'mapa-logistico*' viejas que nadie usa; devuelve sus nombres"""
+        eliminadas = []
+        for nombre in listar_proyecciones(self.driver, self.nombre_base):
+            if self._eliminar_si_libre(redis_client, nombre):
+                eliminadas.append(nombre)
+        return eliminadas
+
+    def _tomar(self, redis_client):
+        """Nombre de la proyeccion vigente, creada si hacia falta, con un uso registrado: (nombre, uso, creada)"""
+        while True:
+            version = self.version_grafo.actual()
+            nombre = self._nombre(version)
+            with self._bloqueo(redis_client, nombre):
+                # Si se publico otra version mientras se esperaba el lock, pedir la nueva
+                if self.version_grafo.actual() != version:
+                    continue
+                creada = False
+                if nombre not in self._creadas:
+                    # Otro worker pudo haberla creado ya para esta misma version
+                    if not existe_proyeccion(self.driver, nombre):
+                        proyectar_grafo(self.driver, nombre)
+                        creada = True
+                    with self._lock:
+                        self._creadas.add(nombre)
+                return nombre, self._registrar_uso(redis_client, nombre), creada
+
+    @contextmanager
+    def usar(self):
+        """
+        with gestor.usar() as proyeccion: ...
+        Garantiza que la proyeccion no se elimine mientras se esta consultando, en este worker o en otro.
+        """
+        redis_client = self.redis_client
+        nombre, uso, creada = self._tomar(redis_client)
+        try:
+            yield nombre
+        finally:
+            self._liberar_uso(redis_client, nombre, uso)
+            if creada or not self._barrido_hecho:
+                self._barrido_hecho = True
+                self.limpiar(redis_client)
+            elif nombre != self._nombre(self.version_grafo.actual()):
+                self._eliminar_si_libre(redis_client, nombre)
@@ -32,33 +32,52 @@ def obtener_puntos(driver):
 
 
 
-def asegurar_proyeccion_grafo(driver):
+PROYECCION_DEFECTO = 'mapa-logistico'
+
+PROYECTAR_GRAFO = """
+CALL gds.graph.project(
+    $nombre,
+    {
+        Point: {
+            properties: ['lat', 'lon']
+        }
+    },
+    {
+        STREET: {
+            properties: ['length', 'weight']
+        }
+    }
+)
+"""
+
+
+def existe_proyeccion(driver, nombre=PROYECCION_DEFECTO):
+    with driver.session() as session:
+        result = session.run("CALL gds.graph.exists($nombre) YIELD exists RETURN exists", nombre=nombre)
+        return result.single()["exists"]
+
+
+def proyectar_grafo(driver, nombre=PROYECCION_DEFECTO):
+    with driver.session() as session:
+        session.run(PROYECTAR_GRAFO, nombre=nombre).consume()
+
+
+def eliminar_proyeccion(driver, nombre=PROYECCION_DEFECTO):
+    with driver.session() as session:
+        session.run("CALL gds.graph.drop($nombre, false)", nombre=nombre).consume()
+
+
+def listar_proyecciones(driver, prefijo=PROYECCION_DEFECTO):
+    """Nombres de las proyecciones GDS que empiezan con `prefijo`"""
+    query = "CALL gds.graph.list() YIELD graphName WHERE graphName STARTS WITH $prefijo RETURN graphName"
+    with driver.session() as session:
+        return [record["graphName"] for record in session.run(query, prefijo=prefijo)]
+
+
+def asegurar_proyeccion_grafo(driver, nombre=PROYECCION_DEFECTO):
     """
-    Verifica si el grafo 'mapa-logistico' existe.
-    Si existe y se requiere regenerarlo (por nodos nuevos), lo elimina y lo vuelve a crear.
+    Crea la proyeccion `nombre` solo si no existe.
+    Para reconstruirla cuando el grafo cambia usar services.proyeccion.GestorProyeccion.
     """
-    with driver.session() as session:
-        # Verificamos si ya existe
-        result = session.run("CALL gds.graph.exists('mapa-logistico') YIELD exists RETURN exists")
-        exists = result.single()["exists"]
-
-        if exists:
-            #print("El grafo ya existe. Eliminando para reconstruir...")
-            session.run("CALL gds.graph.drop('mapa-logistico', false)")
-
-        #print("Creando grafo 'mapa-logistico'...")
-        session.run("""
-            CALL gds.graph.project(
-                'mapa-logistico',
-                {
-                    Point: {
-                        properties: ['lat', 'lon']
-                    }
-                },
-                {
-                    STREET: {
-                        properties: ['length', 'weight']
-                    }
-                }
-            )
-        """)
+    if not existe_proyeccion(driver, nombre):
+        proyectar_grafo(driver, nombre)
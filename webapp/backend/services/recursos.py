@@ -0,0 +1,171 @@
+import threading
+import time
+import redis
+import config
+from services.neo4j_connection import Neo4jConnection
+
+"""
+Conexiones compartidas por todo el proceso: un solo driver de Neo4j (con su pool de conexiones Bolt)
+y un ConnectionPool de Redis por base. Se crean en el lifespan de FastAPI (iniciar) y se cierran al
+apagar (cerrar); las rutas las obtienen con las dependencias get_*.
+
+Bases de Redis: 0 general (tokens, sesiones, versiones), 1 rate limiting, 2 binaria (matrices).
+
+Si Redis se cae, el primer comando que falla lo marca como caido y las get_redis* devuelven None (fallback
+sin cache) hasta que un ping responda; se vuelve a probar cada REINTENTO_REDIS_S. Mientras esta arriba se
+verifica con un ping como mucho cada VERIFICACION_REDIS_S, no en cada request.
+"""
+
+DB_GENERAL = 0
+DB_RATE_LIMIT = 1
+DB_BINARIA = 2
+
+# Si Redis no responde, no se vuelve a probar hasta pasado este tiempo
+REINTENTO_REDIS_S = 30
+# Con Redis arriba, cada cuanto se verifica con un ping al entregar un cliente
+VERIFICACION_REDIS_S = 5
+
+_conn = None
+_pools = {}
+_redis_caido_desde = None
+_redis_verificado_en = None
+_lock = threading.Lock()
+
+
+def _crear_pool(db, decode_responses):
+    return redis.ConnectionPool(
+        host=config.REDIS_HOST,
+        port=config.REDIS_PORT,
+        db=db,
+        decode_responses=decode_responses,
+        max_connections=getattr(config, "REDIS_MAX_CONNECTIONS", 50),
+        socket_timeout=getattr(config, "REDIS_SOCKET_TIMEOUT", 5),
+        socket_connect_timeout=getattr(config, "REDIS_SOCKET_TIMEOUT", 5),
+    )
+
+
+def iniciar():
+    global _conn
+    with _lock:
+        if _conn is None:
+            _conn = Neo4jConnection(
+                config.URI, config.USER, config.PASSWORD,
+                max_connection_pool_size=getattr(config, "NEO4J_MAX_POOL_SIZE", 100),
+                connection_acquisition_timeout=getattr(config, "NEO4J_ACQUISITION_TIMEOUT", 60.0),
+            )
+        if not _pools:
+            _pools[DB_GENERAL] = _crear_pool(DB_GENERAL, True)
+            _pools[DB_RATE_LIMIT] = _crear_pool(DB_RATE_LIMIT, True)
+            _pools[DB_BINARIA] = _crear_pool(DB_BINARIA, False)
+
+
+def cerrar():
+    global _conn
+    with _lock:
+        if _conn is not None:
+            _conn.close()
+            _conn = None
+        for pool in _pools.values():
+            pool.disconnect()
+        _pools.clear()
+
+
+def get_neo4j() -> Neo4jConnection:
+    if _conn is None:
+        iniciar()
+    return _conn
+
+
+def get_neo4j_driver():
+    return get_neo4j().driver
+
+
+def _marcar_redis_caido():
+    global _redis_caido_desde
+    if _redis_caido_desde is None:
+        _redis_caido_desde = time.monotonic()
+        print("⚠️  Redis no disponible - usando fallback sin cache")
+
+
+class _RedisCompartido(redis.Redis):
+    """Cliente sobre un pool compartido: un error de conexion marca Redis como caido para las proximas dependencias"""
+
+    def execute_command(self, *args, **options):
+        try:
+            return super().execute_command(*args, **options)
+        except (redis.ConnectionError, redis.TimeoutError):
+            _marcar_redis_caido()
+            raise
+
+
+def _redis(db):
+    """Cliente sobre el pool compartido, o None si Redis no esta disponible"""
+    global _redis_caido_desde, _redis_verificado_en
+    if not _pools:
+        iniciar()
+    ahora = time.monotonic()
+    if _redis_caido_desde is not None and ahora - _redis_caido_desde < REINTENTO_REDIS_S:
+        return None
+    cliente = _RedisCompartido(connection_pool=_pools[db])
+    if _redis_caido_desde is not None or _redis_verificado_en is None or ahora - _redis_verificado_en >= VERIFICACION_REDIS_S:
+        try:
+            cliente.ping()
+        except redis.RedisError:
+            # El ping fallido ya lo marco como caido; si venia caido, el reintento cuenta desde ahora
+            _redis_caido_desde = time.monotonic()
+            return None
+        _redis_caido_desde = None
+        _redis_verificado_en = ahora
+    return cliente
+
+
+def verificar_redis():
+    """Ping al iniciar; si falla se usa el fallback sin cache hasta el proximo reintento"""
+    global _redis_caido_desde, _redis_verificado_en
+    try:
+        _RedisCompartido(connection_pool=_pools[DB_GENERAL]).ping()
+        _redis_caido_desde = None
+        _redis_verificado_en = time.monotonic()
+        return True
+    except redis.RedisError:
+        _redis_caido_desde = time.monotonic()
+        return False
+
+
+def get_redis():
+    return _redis(DB_GENERAL)
+
+
+def get_redis_rate_limit():
+    return _redis(DB_RATE_LIMIT)
+
+
+def get_redis_binario():
+    return _redis(DB_BINARIA)
+
+
+def estadisticas():
+    """Estado de los pools (lo que exponen el driver de Neo4j y redis-py)"""
+    resultado = {"neo4j": None, "redis": {}}
+    if _conn is not None:
+        pool = getattr(_conn.driver, "_pool", None)
+        conexiones = getattr(pool, "connections", {}) if pool is not None else {}
+        resultado["neo4j"] = {
+            "max_connection_pool_size": getattr(config, "NEO4J_MAX_POOL_SIZE", 100),
+            "por_servidor": {
+                str(direccion): {
+                    "abiertas": len(lista),
+                    "en_uso": sum(1 for c in lista if getattr(c, "in_use", False)),
+                }
+                for direccion, lista in dict(conexiones).items()
+            },
+        }
+    for db, pool in _pools.items():
+        resultado["redis"][db] = {
+            "max_connections": pool.max_connections,
+            "creadas": getattr(pool, "_created_connections", None),
+            "disponibles": len(getattr(pool, "_available_connections", [])),
+            "en_uso": len(getattr(pool, "_in_use_connections", [])),
+        }
+    resultado["redis_disponible"] = _redis_caido_desde is None
+    return resultado
@@ -0,0 +1,53 @@
+import orjson
+from fastapi.responses import StreamingResponse
+
+"""
+Respuestas JSON en streaming para listados grandes.
+
+Los registros se leen de a uno del resultado de Neo4j (sin record.data() sobre la lista completa) y se
+escriben en bloques de `tamano_bloque` registros, como un arreglo JSON o como NDJSON (un objeto por linea).
+La sesion queda abierta mientras se envia la respuesta y se cierra al terminar el generador, asi la memoria
+del proceso no depende de la cantidad de registros.
+"""
+
+TAMANO_BLOQUE = 500
+MEDIA_NDJSON = "application/x-ndjson"
+OPCIONES_ORJSON = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def _registros(driver, query, parametros):
+    with driver.session() as session:
+        for record in session.run(query, parametros):
+            yield dict(record)
+
+
+def _arreglo_json(registros, tamano_bloque):
+    yield b"["
+    bloque, primero = [], True
+    for registro in registros:
+        bloque.append(orjson.dumps(registro, option=OPCIONES_ORJSON))
+        if len(bloque) >= tamano_bloque:
+            yield (b"" if primero else b",") + b",".join(bloque)
+            bloque, primero = [], False
+    if bloque:
+        yield (b"" if primero else b",") + b",".join(bloque)
+    yield b"]"
+
+
+def _ndjson(registros, tamano_bloque):
+    bloque = []
+    for registro in registros:
+        bloque.append(orjson.dumps(registro, option=OPCIONES_ORJSON))
+        if len(bloque) >= tamano_bloque:
+            yield b"\n".join(bloque) + b"\n"
+            bloque = []
+    if bloque:
+        yield b"\n".join(bloque) + b"\n"
+
+
+def respuesta_streaming(driver, query, parametros=None, ndjson=False, tamano_bloque=TAMANO_BLOQUE):
+    """StreamingResponse con los registros de `query`, como arreglo JSON o NDJSON"""
+    registros = _registros(driver, query, parametros or {})
+    if ndjson:
+        return StreamingResponse(_ndjson(registros, tamano_bloque), media_type=MEDIA_NDJSON)
+    return StreamingResponse(_arreglo_json(registros, tamano_bloque), media_type="application/json")
@@ -0,0 +1,177 @@
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError
+import orjson
+import redis
+
+"""
+Trabajos de optimizacion asincronicos.
+
+Cada trabajo se orquesta en un hilo (las consultas a Neo4j son I/O y el driver no se puede pasar a otro
+proceso) y la fase de CPU (ACO) se envia a un ProcessPoolExecutor, asi el proceso de la API no queda
+bloqueado por el GIL mientras corren varias optimizaciones en distintos nucleos.
+
+Cada trabajo corre en el worker que lo recibio, pero su estado se copia a Redis (`trabajo:<id>`, JSON) en cada
+cambio: con varios workers de uvicorn /trabajos/{id} se puede consultar desde cualquiera. Sin Redis el estado
+vive solo en el proceso y hay que correr un solo worker. Los terminados se descartan despues de `ttl_s`.
+
+`timeout_s` es el limite del trabajo entero, desde que empieza a correr: la fase de Neo4j (matriz, Yen) no se
+puede interrumpir, pero lo que consume se descuenta del tiempo que le queda a la fase de CPU, y un trabajo que
+termina fuera de plazo queda en TIMEOUT. El plazo viaja en el `ejecutar_cpu` que recibe el trabajo, asi lo
+respetan tambien las llamadas desde otros hilos (islas de aco_islas, vehiculos de optimizacion_flota). Un proceso que ya empezo tampoco se puede interrumpir: al vencer el
+plazo se reemplaza el pool, asi el proceso colgado no sigue ocupando un lugar; termina su tarea y sale.
+"""
+
+PENDIENTE = "pendiente"
+EJECUTANDO = "ejecutando"
+COMPLETADO = "completado"
+ERROR = "error"
+TIMEOUT = "timeout"
+
+
+class GestorTrabajos:
+    def __init__(self, procesos=None, timeout_s=300, max_trabajos=None, ttl_s=3600, redis_client=None):
+        self.procesos = procesos or os.cpu_count() or 1
+        self.timeout_s = timeout_s
+        self.ttl_s = ttl_s
+        # Cliente o funcion que lo devuelve (recursos.get_redis), como en VersionGrafo
+        self._redis = redis_client
+        self._trabajos = {}
+        self._lock = threading.Lock()
+        self._pool = None
+        self._orquestador = ThreadPoolExecutor(max_workers=max_trabajos or self.procesos * 2,
+                                               thread_name_prefix="optimizacion")
+
+    def _pool_procesos(self):
+        # Se crea al primer uso; spawn evita heredar los hilos del driver de Neo4j al hacer fork
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.procesos,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def _reciclar_pool(self, pool):
+        # Los pendientes de otros trabajos siguen en el pool viejo (no se cancelan); los nuevos van a uno nuevo
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False)
+
+    @property
+    def redis_client(self):
+        return self._redis() if callable(self._redis) else self._redis
+
+    def ejecutar_cpu(self, funcion, *args, hasta=None):
+        """
+        Corre funcion(*args) en el pool de procesos y espera el resultado, hasta `hasta` (time.time() del plazo
+        del trabajo) o `timeout_s` si no se pasa
+        """
+        timeout = self.timeout_s if hasta is None else hasta - time.time()
+        if timeout <= 0:
+            raise TimeoutError()
+        pool = self._pool_procesos()
+        futuro = pool.submit(funcion, *args)
+        try:
+            return futuro.result(timeout=timeout)
+        except TimeoutError:
+            # Si todavia estaba en cola se cancela; si ya empezo, el proceso no se puede interrumpir
+            if not futuro.cancel():
+                self._reciclar_pool(pool)
+            raise
+
+    def _limpiar(self):
+        ahora = time.time()
+        with self._lock:
+            vencidos = [tid for tid, t in self._trabajos.items()
+                        if t["terminado_en"] is not None and ahora - t["terminado_en"] > self.ttl_s]
+            for tid in vencidos:
+                del self._trabajos[tid]
+
+    def _clave(self, trabajo_id):
+        return f"trabajo:{trabajo_id}"
+
+    def _actualizar(self, trabajo_id, **campos):
+        with self._lock:
+            trabajo = self._trabajos[trabajo_id]
+            trabajo.update(campos)
+            datos = orjson.dumps(trabajo, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+            terminado = trabajo["terminado_en"] is not None
+        redis_client = self.redis_client
+        if redis_client:
+            try:
+                # Mientras corre vive al menos hasta su plazo; terminado, `ttl_s` mas
+                redis_client.set(self._clave(trabajo_id), datos,
+                                 ex=self.ttl_s if terminado else self.timeout_s + self.ttl_s)
+            except redis.RedisError:
+                pass
+
+    def _progreso(self, trabajo_id, hechos, total):
+        self._actualizar(trabajo_id, progreso={"hechos": hechos, "total": total})
+
+    def _correr(self, trabajo_id, funcion, args, kwargs):
+        inicio = time.time()
+        self._actualizar(trabajo_id, estado=EJECUTANDO, iniciado_en=inicio)
+        hasta = inicio + self.timeout_s
+        try:
+            resultado = funcion(*args, ejecutar_cpu=partial(self.ejecutar_cpu, hasta=hasta), **kwargs)
+            if time.time() > hasta:
+                raise TimeoutError()
+            self._actualizar(trabajo_id, estado=COMPLETADO, resultado=resultado)
+        except TimeoutError:
+            self._actualizar(trabajo_id, estado=TIMEOUT, error=f"Se supero el limite de {self.timeout_s}s")
+        except Exception as e:
+            self._actualizar(trabajo_id, estado=ERROR, error=str(e))
+        finally:
+            fin = time.time()
+            self._actualizar(trabajo_id, terminado_en=fin, segundos=round(fin - inicio, 3))
+
+    def enviar(self, tipo, funcion, *args, con_progreso=False, **kwargs) -> str:
+        """
+        Encola funcion(*args, ejecutar_cpu=..., **kwargs) y devuelve el id del trabajo.
+        `funcion` es un ejecutarOptimizacion de algorithms.*
+        Con `con_progreso` tambien recibe progreso(hechos, total), que queda en el campo "progreso" del trabajo.
+        """
+        self._limpiar()
+        trabajo_id = str(uuid.uuid4())
+        with self._lock:
+            self._trabajos[trabajo_id] = {
+                "id": trabajo_id,
+                "tipo": tipo,
+                "estado": PENDIENTE,
+                "creado_en": time.time(),
+                "iniciado_en": None,
+                "terminado_en": None,
+                "segundos": None,
+                "resultado": None,
+                "error": None,
+                "progreso": None,
+            }
+        self._actualizar(trabajo_id)
+        if con_progreso:
+            kwargs["progreso"] = partial(self._progreso, trabajo_id)
+        self._orquestador.submit(self._correr, trabajo_id, funcion, args, kwargs)
+        return trabajo_id
+
+    def obtener(self, trabajo_id):
+        """Estado del trabajo: el del proceso si lo corre este worker, si no el copiado en Redis"""
+        with self._lock:
+            trabajo = self._trabajos.get(trabajo_id)
+            if trabajo:
+                return dict(trabajo)
+        redis_client = self.redis_client
+        if redis_client:
+            try:
+                datos = redis_client.get(self._clave(trabajo_id))
+                return orjson.loads(datos) if datos else None
+            except redis.RedisError:
+                pass
+        return None
+
+    def cerrar(self):
+        self._orquestador.shutdown(wait=False, cancel_futures=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,42 @@
+import threading
+import redis
+
+"""
+Contador de version del mapa. Se incrementa cada vez que el grafo de calles se crea o se borra
+(crear_mapa_logistico / eliminar_mapa), y sirve como parte de la clave de los caches que dependen del mapa.
+Si hay Redis el contador es compartido entre workers (INCR); si no, vive en el proceso.
+`redis_client` puede ser un cliente o una funcion que lo devuelve (recursos.get_redis): asi se resuelve en
+cada uso y el contador vuelve a Redis cuando Redis vuelve.
+"""
+
+
+class VersionGrafo:
+    def __init__(self, redis_client=None, clave="grafo:version:mapa"):
+        self._redis = redis_client
+        self.clave = clave
+        self._local = 0
+        self._lock = threading.Lock()
+
+    @property
+    def redis_client(self):
+        return self._redis() if callable(self._redis) else self._redis
+
+    def actual(self) -> int:
+        redis_client = self.redis_client
+        if redis_client:
+            try:
+                return int(redis_client.get(self.clave) or 0)
+            except redis.RedisError:
+                pass
+        return self._local
+
+    def incrementar(self) -> int:
+        with self._lock:
+            self._local += 1
+        redis_client = self.redis_client
+        if redis_client:
+            try:
+                return int(redis_client.incr(self.clave))
+            except redis.RedisError:
+                pass
+        return self._local
@@ -159,7 +159,7 @@ export default function MapaRutas({}) {
   //
   const calcularRuta = async () => {
     try {
-      const response = await fetch("http://localhost:8000/calcularRuta");
+      const response = await fetch("http://localhost:8000/calcularRuta?geometria=polyline");
       const data = await response.json();
       const resultado = unirTramosRuta(data);
       setRuta(resultado.coordenadas);
@@ -1,5 +1,62 @@
+//Decodifica una polyline (algoritmo de Google) a [{lat, lon}]
+export const decodificarPolyline = (texto, precision = 5) => {
+  const escala = Math.pow(10, precision);
+  const puntos = [];
+  let lat = 0;
+  let lon = 0;
+  let i = 0;
+  while (i < texto.length) {
+    const valores = [];
+    for (let k = 0; k < 2; k++) {
+      let resultado = 0;
+      let desplazamiento = 0;
+      let b;
+      do {
+        b = texto.charCodeAt(i++) - 63;
+        resultado |= (b & 0x1f) << desplazamiento;
+        desplazamiento += 5;
+      } while (b >= 0x20);
+      valores.push(resultado & 1 ? ~(resultado >> 1) : resultado >> 1);
+    }
+    lat += valores[0];
+    lon += valores[1];
+    puntos.push({ lat: lat / escala, lon: lon / escala });
+  }
+  return puntos;
+};
+
+//Enteros delta [lat0, lon0, dlat1, dlon1, ...] a [{lat, lon}]
+const decodificarDelta = (valores, precision = 5) => {
+  const escala = Math.pow(10, precision);
+  const puntos = [];
+  let lat = 0;
+  let lon = 0;
+  for (let i = 0; i + 1 < valores.length; i += 2) {
+    lat += valores[i];
+    lon += valores[i + 1];
+    puntos.push({ lat: lat / escala, lon: lon / escala });
+  }
+  return puntos;
+};
+
+//Respuesta compacta del backend (?geometria=polyline|delta): coordenadas compartidas + offsets por tramo
+const unirTramosCompactos = (data) => {
+  const coordenadas =
+    data.formato === "polyline"
+      ? decodificarPolyline(data.coordenadas, data.precision)
+      : decodificarDelta(data.coordenadas, data.precision);
+  const inicios = data.tramos
+    .filter((tramo) => tramo.inicio !== null && coordenadas[tramo.inicio])
+    .map((tramo) => coordenadas[tramo.inicio]);
+  return { coordenadas, inicios };
+};
+
 //Funcion para graficar la ruta
 export const unirTramosRuta = (data) => {
+  if (data && Array.isArray(data.tramos)) {
+    return unirTramosCompactos(data);
+  }
+
   const coordenadas = [];
   const inicios = [];
 